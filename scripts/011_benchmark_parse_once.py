@@ -0,0 +1,60 @@
+"""
+Compares the per-record CPU cost of the schema and load branches
+when every line is decoded twice (once per branch) versus once (shared).
+
+Uses the data generated by script 008, or the files given on the command line.
+Results are reported in CPU-seconds per GB of input.
+"""
+import glob
+import json
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from schematools.schema_extraction import extract_schema, extract_schema_from_dict  # noqa: E402
+
+
+def read_lines(patterns):
+    lines = []
+    for pattern in patterns:
+        for filename in sorted(glob.glob(pattern)):
+            with open(filename, 'r') as infile:
+                lines.extend(infile)
+    return lines
+
+
+def parse_twice(lines):
+    for line in lines:
+        extract_schema(line)  # schema branch
+        json.loads(line)  # load branch
+
+
+def parse_once(lines):
+    for line in lines:
+        data = json.loads(line)
+        extract_schema_from_dict(data)  # schema branch, load branch reuses data
+
+
+def benchmark(name, fn, lines, size_gb):
+    start = time.process_time()
+    fn(lines)
+    elapsed = time.process_time() - start
+    print(f'{name:12s} {elapsed:8.2f} CPU-s  {elapsed / size_gb:8.2f} CPU-s/GB')
+    return elapsed
+
+
+if __name__ == '__main__':
+    patterns = sys.argv[1:] or ['examples/large/large*.jsonl']
+    lines = read_lines(patterns)
+    if not lines:
+        sys.exit(f'No input found for {patterns}, run scripts/008_generate_large_data.sh first.')
+
+    size_gb = sum(len(line) for line in lines) / 1e9
+    print(f'{len(lines)} records, {size_gb * 1000:.1f} MB')
+
+    before = benchmark('parse twice', parse_twice, lines, size_gb)
+    after = benchmark('parse once', parse_once, lines, size_gb)
+    print(f'speedup      {before / after:8.2f}x')
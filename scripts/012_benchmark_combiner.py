@@ -0,0 +1,82 @@
+"""
+Runs the schema branch of the pipeline on the DirectRunner (single worker),
+once with a combiner that merges every record into the accumulator
+and once with the SchemaCombinerFn used by the pipeline.
+
+Uses the data generated by script 008, or the files given on the command line.
+Results are reported in records per second per core (CPU time).
+"""
+import glob
+import json
+import logging
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+import apache_beam as beam  # noqa: E402
+from apache_beam.options.pipeline_options import PipelineOptions  # noqa: E402
+
+from json2bq.components import map_extract_schema  # noqa: E402
+from json2bq.schema_accumulator import SchemaCombinerFn  # noqa: E402
+from schematools.schema_merge import merge_schemas  # noqa: E402
+
+
+class PerRecordCombinerFn(beam.CombineFn):
+    """
+    Reference combiner, merges every single record schema into the accumulator.
+    """
+    def create_accumulator(self):
+        return None
+
+    def add_input(self, accumulator, input):
+        return merge_schemas(accumulator, input)
+
+    def merge_accumulators(self, accumulators):
+        merged = None
+        for accum in accumulators:
+            merged = merge_schemas(merged, accum)
+        return merged
+
+    def extract_output(self, accumulator):
+        return accumulator
+
+
+def run_schema_branch(input_pattern, combiner):
+    options = PipelineOptions([], runner='DirectRunner', direct_num_workers=1)
+    with beam.Pipeline(options=options) as pipeline:
+        (pipeline
+         | "Read JSONLine Messages" >> beam.io.ReadFromText(input_pattern)
+         | "Parse json" >> beam.Map(json.loads)
+         | "Extract Schemas" >> beam.Map(map_extract_schema)
+         | "Combine into 1 schema" >> beam.CombineGlobally(combiner)
+         )
+
+
+def benchmark(name, input_pattern, combiner, record_count):
+    start = time.process_time()
+    run_schema_branch(input_pattern, combiner)
+    elapsed = time.process_time() - start
+    print(f'{name:12s} {elapsed:8.2f} CPU-s  {record_count / elapsed:10.0f} records/s/core')
+    return elapsed
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+
+    input_pattern = sys.argv[1] if len(sys.argv) > 1 else 'examples/large/large*.jsonl'
+    filenames = glob.glob(input_pattern)
+    if not filenames:
+        sys.exit(f'No input found for {input_pattern}, run scripts/008_generate_large_data.sh first.')
+
+    record_count = 0
+    for filename in filenames:
+        with open(filename, 'r') as infile:
+            record_count += sum(1 for _ in infile)
+    print(f'{record_count} records')
+
+    before = benchmark('per record', input_pattern, PerRecordCombinerFn(), record_count)
+    after = benchmark('combiner', input_pattern, SchemaCombinerFn(), record_count)
+    print(f'speedup      {before / after:8.2f}x')
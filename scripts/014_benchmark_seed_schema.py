@@ -0,0 +1,89 @@
+"""
+Compares the cost of the schema branch (extraction + combine) with and without a seed schema,
+on generated records of which 99% fit the seed schema.
+
+Without a seed, every record is fingerprinted and every new shape is extracted and merged.
+With a seed, records that fit the seed are skipped after a subsumption check,
+only the remaining 1% is extracted and merged into the seed.
+
+The DoFn and combiner are called directly (in bundles), so only the schema work itself is measured.
+Results are reported in records per second per core (CPU time).
+"""
+import logging
+import random
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from json2bq.components import ExtractSchemaFn, ExtractUnmatchedSchemaFn  # noqa: E402
+from json2bq.schema_accumulator import SchemaCombinerFn  # noqa: E402
+
+BUNDLE_SIZE = 1000
+OPTIONAL_FIELDS = 16
+
+
+def gen_record(extra=False):
+    record = {'id': random.randint(0, 10 ** 9), 'created': '2020-06-18T10:44:12'}
+    for i in range(OPTIONAL_FIELDS):
+        if random.random() < 0.5:
+            record[f'field_{i}'] = [random.randint(0, 100), 'text', {'x': 1.5, 'y': [1, 2]}][i % 3]
+    if extra:
+        record[f'extra_{random.randint(0, 9)}'] = True
+    return record
+
+
+def seed_schema():
+    # Schema of the records without an extra field, i.e. the known schema
+    fields = [{'name': 'id', 'type': 'INTEGER', 'mode': 'REQUIRED'},
+              {'name': 'created', 'type': 'TIMESTAMP', 'mode': 'REQUIRED'}]
+    for i in range(OPTIONAL_FIELDS):
+        fields.append([
+            {'name': f'field_{i}', 'type': 'INTEGER', 'mode': 'NULLABLE'},
+            {'name': f'field_{i}', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': f'field_{i}', 'type': 'RECORD', 'mode': 'NULLABLE', 'fields': [
+                {'name': 'x', 'type': 'FLOAT', 'mode': 'REQUIRED'},
+                {'name': 'y', 'type': 'INTEGER', 'mode': 'REPEATED'},
+            ]},
+        ][i % 3])
+    return fields
+
+
+def run_schema_branch(records, extract_fn, *side_inputs):
+    combiner = SchemaCombinerFn()
+    accumulator = combiner.create_accumulator()
+    if side_inputs:
+        accumulator = combiner.add_input(accumulator, side_inputs[0])
+
+    extract_fn.setup()
+    for start in range(0, len(records), BUNDLE_SIZE):
+        extract_fn.start_bundle()
+        for record in records[start:start + BUNDLE_SIZE]:
+            for schema in extract_fn.process(record, *side_inputs):
+                accumulator = combiner.add_input(accumulator, schema)
+        extract_fn.finish_bundle()
+    return combiner.extract_output(accumulator)
+
+
+def benchmark(name, records, extract_fn, *side_inputs):
+    start = time.process_time()
+    schema = run_schema_branch(records, extract_fn, *side_inputs)
+    elapsed = time.process_time() - start
+    print(f'{name:12s} {elapsed:8.2f} CPU-s  {len(records) / elapsed:10.0f} records/s/core')
+    return elapsed, schema
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+
+    record_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    random.seed(42)
+    records = [gen_record(extra=random.random() < 0.01) for _ in range(record_count)]
+    print(f'{record_count} records, 99% fit the seed schema')
+
+    before, schema = benchmark('no seed', records, ExtractSchemaFn())
+    after, seeded_schema = benchmark('seeded', records, ExtractUnmatchedSchemaFn(), seed_schema())
+    print(f'speedup      {before / after:8.2f}x')
+    print(f'{len(schema)} fields without seed, {len(seeded_schema)} fields with seed')
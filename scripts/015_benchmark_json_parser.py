@@ -0,0 +1,67 @@
+"""
+Compares the JSON parser backends on the 1M line dataset generated by script 008 (or the files given on the command line).
+
+For every installed backend, two numbers are reported:
+- parse: decoding every line into Python objects (the load branch)
+- schema: decoding and extracting the schema of every line (the schema branch)
+
+Results are reported in lines per second per core (CPU time).
+"""
+import glob
+import logging
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from json2bq.components import ExtractSchemaFn  # noqa: E402
+from schematools.json_parser import available_parsers, create_parser  # noqa: E402
+
+BUNDLE_SIZE = 10000
+
+
+def parse_lines(lines, parser):
+    loads = create_parser(parser)
+    for line in lines:
+        loads(line)
+
+
+def extract_lines(lines, parser):
+    loads = create_parser(parser)
+    extract_fn = ExtractSchemaFn()
+    extract_fn.setup()
+    for start in range(0, len(lines), BUNDLE_SIZE):
+        extract_fn.start_bundle()
+        for line in lines[start:start + BUNDLE_SIZE]:
+            for _ in extract_fn.process(loads(line)):
+                pass
+        extract_fn.finish_bundle()
+
+
+def benchmark(fn, lines, parser):
+    start = time.process_time()
+    fn(lines, parser)
+    return time.process_time() - start
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+
+    input_pattern = sys.argv[1] if len(sys.argv) > 1 else 'examples/large/large*.jsonl'
+    filenames = glob.glob(input_pattern)
+    if not filenames:
+        sys.exit(f'No input found for {input_pattern}, run scripts/008_generate_large_data.sh first.')
+
+    lines = []
+    for filename in filenames:
+        with open(filename, 'r') as infile:
+            lines.extend(infile.read().splitlines())
+    print(f'{len(lines)} lines')
+
+    for parser in available_parsers():
+        parse_time = benchmark(parse_lines, lines, parser)
+        schema_time = benchmark(extract_lines, lines, parser)
+        print(f'{parser:10s} parse {len(lines) / parse_time:10.0f} lines/s/core  '
+              f'schema {len(lines) / schema_time:10.0f} lines/s/core')
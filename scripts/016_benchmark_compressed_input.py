@@ -0,0 +1,112 @@
+"""
+Compares reading and inferring the schema of compressed input with uncompressed input,
+on the dataset generated by script 008 (or the files given on the command line).
+
+The input is concatenated into a single file, which is written in the following formats:
+- plain: uncompressed, split at newlines
+- gzip: a single gzip member, can't be split
+- gzip members: gzip members of 1MB uncompressed data (like bgzip), split at member boundaries
+- bzip2 streams: bzip2 streams of 1MB uncompressed data (like pbzip2), split at stream boundaries
+- zstd seekable: zstd frames of 1MB uncompressed data with a seek table, split at frame boundaries
+
+Every file is split into (at most) 16 ranges, the number of ranges the file could be split into
+bounds the number of parallel readers.
+For every format, the number of ranges, the read and the inference throughput are reported,
+in lines per second per core (CPU time).
+"""
+import bz2
+import glob
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from schematools.compression import ZSTD_SEEKABLE_MAGIC, ZSTD_SKIPPABLE_MAGIC, zstandard  # noqa: E402
+from schematools.local_inference import infer_chunk, read_chunk, split_files  # noqa: E402
+
+MEMBER_SIZE = 1024 * 1024
+
+# Chunk sizes are in compressed bytes, so files are split into a fixed number of ranges instead
+RANGE_COUNT = 16
+
+
+def write_members(path, data, compress):
+    with open(path, 'wb') as outfile:
+        for start in range(0, len(data), MEMBER_SIZE):
+            outfile.write(compress(data[start:start + MEMBER_SIZE]))
+
+
+def write_zstd_seekable(path, data):
+    compressor = zstandard.ZstdCompressor()
+    frames = [compressor.compress(data[start:start + MEMBER_SIZE]) for start in range(0, len(data), MEMBER_SIZE)]
+
+    # Seek table entries: compressed and decompressed size of every frame, without checksums
+    entries = b''.join(len(frame).to_bytes(4, 'little') +
+                       min(MEMBER_SIZE, len(data) - i * MEMBER_SIZE).to_bytes(4, 'little')
+                       for i, frame in enumerate(frames))
+    footer = len(frames).to_bytes(4, 'little') + b'\x00' + ZSTD_SEEKABLE_MAGIC.to_bytes(4, 'little')
+    with open(path, 'wb') as outfile:
+        outfile.write(b''.join(frames))
+        outfile.write((ZSTD_SKIPPABLE_MAGIC | 0xE).to_bytes(4, 'little'))
+        outfile.write((len(entries) + len(footer)).to_bytes(4, 'little'))
+        outfile.write(entries + footer)
+
+
+def benchmark(path):
+    start = time.process_time()
+    chunks = split_files([path], os.path.getsize(path) // RANGE_COUNT)
+    split_time = time.process_time() - start
+
+    start = time.process_time()
+    line_count = sum(1 for chunk in chunks for _ in read_chunk(chunk))
+    read_time = time.process_time() - start
+
+    start = time.process_time()
+    for chunk in chunks:
+        infer_chunk(chunk)
+    infer_time = time.process_time() - start
+
+    return len(chunks), line_count, split_time, read_time, infer_time
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+
+    input_pattern = sys.argv[1] if len(sys.argv) > 1 else 'examples/large/large*.jsonl'
+    filenames = sorted(glob.glob(input_pattern))
+    if not filenames:
+        sys.exit(f'No input found for {input_pattern}, run scripts/008_generate_large_data.sh first.')
+
+    data = b''
+    for filename in filenames:
+        with open(filename, 'rb') as infile:
+            data += infile.read()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = {
+            'plain': os.path.join(tmp_dir, 'data.jsonl'),
+            'gzip': os.path.join(tmp_dir, 'data.jsonl.gz'),
+            'gzip members': os.path.join(tmp_dir, 'members.jsonl.gz'),
+            'bzip2 streams': os.path.join(tmp_dir, 'streams.jsonl.bz2'),
+        }
+        with open(files['plain'], 'wb') as outfile:
+            outfile.write(data)
+        with open(files['gzip'], 'wb') as outfile:
+            outfile.write(gzip.compress(data))
+        write_members(files['gzip members'], data, gzip.compress)
+        write_members(files['bzip2 streams'], data, bz2.compress)
+        if zstandard is not None:
+            files['zstd seekable'] = os.path.join(tmp_dir, 'seekable.jsonl.zst')
+            write_zstd_seekable(files['zstd seekable'], data)
+
+        for name, path in files.items():
+            range_count, line_count, split_time, read_time, infer_time = benchmark(path)
+            print(f'{name:14s} {os.path.getsize(path) / len(data):6.1%} size  {range_count:4d} ranges  '
+                  f'split {split_time:6.3f}s  read {line_count / read_time:10.0f} lines/s/core  '
+                  f'infer {line_count / infer_time:10.0f} lines/s/core')
@@ -0,0 +1,99 @@
+"""
+Simulates the final schema merge of a job with many workers,
+comparing what reaches the global combine with and without pre-aggregation per bundle,
+and the effect of a fanout on the merge critical path.
+
+Every bundle runs the extraction DoFn on generated records with many optional fields,
+so a bundle emits many distinct schemas. The emitted schemas are then either shuffled as is,
+or first merged into one SchemaNode per bundle (like `PreAggregateSchemasFn`).
+The shuffle volume is measured as the pickled size of the elements, the merge time in CPU time.
+With a fanout, the partial results are merged in that many groups (in parallel on a real job),
+the critical path is the slowest group plus the final merge.
+"""
+import logging
+import pickle
+import random
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from json2bq.components import ExtractSchemaFn  # noqa: E402
+from json2bq.schema_accumulator import SchemaCombinerFn  # noqa: E402
+
+BUNDLE_COUNT = 500
+BUNDLE_SIZE = 200
+OPTIONAL_FIELDS = 24
+FANOUTS = [None, 8, 32]
+
+
+def gen_record():
+    record = {'id': random.randint(0, 10 ** 9), 'created': '2020-06-18T10:44:12'}
+    for i in range(OPTIONAL_FIELDS):
+        if random.random() < 0.3:
+            record[f'field_{i}'] = [random.randint(0, 100), 'text', {'x': 1.5, 'y': [1, 2]}][i % 3]
+    return record
+
+
+def extract_bundle(extract_fn, records):
+    extract_fn.start_bundle()
+    schemas = [schema for record in records for schema in extract_fn.process(record)]
+    list(extract_fn.finish_bundle())
+    return schemas
+
+
+def pre_aggregate(combiner, schemas):
+    accumulator = combiner.create_accumulator()
+    for schema in schemas:
+        combiner.add_input(accumulator, schema)
+    return accumulator
+
+
+def final_merge(combiner, elements, fanout):
+    """
+    Merges the elements, in `fanout` groups first if given.
+    Returns the result and the CPU time of the critical path.
+    """
+    def merge(group):
+        start = time.process_time()
+        accumulator = combiner.create_accumulator()
+        for element in group:
+            combiner.add_input(accumulator, element)
+        return accumulator, time.process_time() - start
+
+    if fanout is None:
+        return merge(elements)
+
+    partials = [merge(elements[i::fanout]) for i in range(fanout)]
+    start = time.process_time()
+    merged = combiner.merge_accumulators([partial for partial, _ in partials])
+    return merged, max(elapsed for _, elapsed in partials) + time.process_time() - start
+
+
+def report(name, combiner, bundles):
+    elements = [element for bundle in bundles for element in bundle]
+    # Elements are shuffled in their pickled form
+    shuffle_bytes = sum(len(pickle.dumps(element)) for element in elements)
+    for fanout in FANOUTS:
+        # Accumulators are merged in place, so every run needs its own copy of the elements
+        copies = pickle.loads(pickle.dumps(elements))
+        merged, elapsed = final_merge(combiner, copies, fanout)
+        print(f'{name:16s} fanout {str(fanout):>4s}  {len(elements):8d} elements  {shuffle_bytes / 1e6:8.2f} MB  '
+              f'{elapsed * 1000:8.1f} ms critical path  ({merged.size()} nodes)')
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(42)
+
+    extract_fn = ExtractSchemaFn()
+    extract_fn.setup()
+    combiner = SchemaCombinerFn()
+
+    bundles = [extract_bundle(extract_fn, [gen_record() for _ in range(BUNDLE_SIZE)]) for _ in range(BUNDLE_COUNT)]
+    print(f'{BUNDLE_COUNT} bundles of {BUNDLE_SIZE} records')
+
+    report('per shape', combiner, bundles)
+    report('pre-aggregated', combiner, [[pre_aggregate(combiner, schemas)] for schemas in bundles])
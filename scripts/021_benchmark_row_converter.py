@@ -0,0 +1,82 @@
+"""
+Measures the throughput of the row conversion in the load branch (see `compile_converter`),
+compared to a converter that interprets the schema for every row.
+
+Uses the data generated by script 008, or the files given on the command line.
+The schema is inferred from the records first, only the conversion is timed.
+Results are reported in rows per second per core (CPU time).
+"""
+import glob
+import json
+import logging
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from schematools.schema_casting import TYPE_CONVERTERS, compile_converter  # noqa: E402
+from schematools.schema_extraction import extract_schema_from_dict  # noqa: E402
+from schematools.schema_tree import SchemaNode  # noqa: E402
+
+MAX_RECORDS = 200000
+
+
+def interpret_record(data, fields):
+    """
+    Reference converter, looks up the schema of every field of every row.
+    """
+    if type(data) is not dict:
+        return data
+    fields_by_name = {field['name']: field for field in fields}
+    result = {}
+    for name, value in data.items():
+        field = fields_by_name.get(name)
+        if field is None or value is None:
+            continue
+        if field['mode'] == 'REPEATED' and type(value) is list:
+            result[name] = [interpret_value(element, field) for element in value if element is not None]
+        else:
+            result[name] = interpret_value(value, field)
+    return result
+
+
+def interpret_value(value, field):
+    if field['type'] == 'RECORD':
+        return interpret_record(value, field['fields'])
+    converter = TYPE_CONVERTERS.get(field['type'])
+    return value if converter is None else converter(value)
+
+
+def benchmark(name, records, convert):
+    start = time.process_time()
+    for record in records:
+        convert(record)
+    elapsed = time.process_time() - start
+    print(f'{name:12s} {elapsed:8.2f} CPU-s  {len(records) / elapsed:10.0f} rows/s/core')
+    return elapsed
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+
+    input_pattern = sys.argv[1] if len(sys.argv) > 1 else 'examples/large/large*.jsonl'
+    filenames = glob.glob(input_pattern)
+    if not filenames:
+        sys.exit(f'No input found for {input_pattern}, run scripts/008_generate_large_data.sh first.')
+
+    records = []
+    for filename in filenames:
+        with open(filename, 'r') as infile:
+            records.extend(json.loads(line) for line, _ in zip(infile, range(MAX_RECORDS - len(records))))
+    print(f'{len(records)} records')
+
+    root = SchemaNode()
+    for record in records:
+        root.merge_schema(extract_schema_from_dict(record))
+    schema = root.to_schema()
+
+    before = benchmark('interpreted', records, lambda record: interpret_record(record, schema))
+    after = benchmark('compiled', records, compile_converter(schema))
+    print(f'speedup      {before / after:8.2f}x')
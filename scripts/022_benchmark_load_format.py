@@ -0,0 +1,82 @@
+"""
+Compares the load formats of the load branch: the size of the temporary files and the CPU time per row
+to convert and serialize the rows, for JSON lines and Avro (see `compile_converter` and `--load_format`).
+
+Uses the data generated by script 008, or the files given on the command line.
+The schema is inferred from the records first. The rows are written like the temporary files of the load jobs,
+with the row writers of Beam, but to memory.
+Results are reported in CPU time per row (single core) and in bytes per row.
+"""
+import glob
+import io
+import json
+import logging
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from apache_beam.io.gcp.bigquery_tools import AvroRowWriter, JsonRowWriter  # noqa: E402
+
+from json2bq.components import prep_schema  # noqa: E402
+from schematools.schema_casting import LOAD_FORMATS, LOAD_FORMAT_AVRO, LOAD_FORMAT_JSON, compile_converter  # noqa: E402
+from schematools.schema_extraction import extract_schema_from_dict  # noqa: E402
+from schematools.schema_tree import SchemaNode  # noqa: E402
+
+MAX_RECORDS = 200000
+
+ROW_WRITERS = {
+    LOAD_FORMAT_JSON: lambda file_handle, schema: JsonRowWriter(file_handle),
+    LOAD_FORMAT_AVRO: lambda file_handle, schema: AvroRowWriter(file_handle, prep_schema(None, schema, LOAD_FORMAT_AVRO)),
+}
+
+
+class InMemoryFile(io.BytesIO):
+    """
+    Keeps the written bytes available after the writer closes the file.
+    """
+
+    def close(self):
+        self.written = self.getvalue()
+        super().close()
+
+
+def benchmark(load_format, records, schema):
+    convert = compile_converter(schema, load_format)
+    outfile = InMemoryFile()
+
+    start = time.process_time()
+    writer = ROW_WRITERS[load_format](outfile, schema)
+    for record in records:
+        writer.write(convert(record))
+    writer.close()
+    elapsed = time.process_time() - start
+
+    size = len(outfile.written)
+    print(f'{load_format:6s} {elapsed:8.2f} CPU-s  {elapsed / len(records) * 1e6:8.2f} us/row  '
+          f'{size / 1e6:8.2f} MB  {size / len(records):8.1f} bytes/row')
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+
+    input_pattern = sys.argv[1] if len(sys.argv) > 1 else 'examples/large/large*.jsonl'
+    filenames = glob.glob(input_pattern)
+    if not filenames:
+        sys.exit(f'No input found for {input_pattern}, run scripts/008_generate_large_data.sh first.')
+
+    records = []
+    for filename in filenames:
+        with open(filename, 'r') as infile:
+            records.extend(json.loads(line) for line, _ in zip(infile, range(MAX_RECORDS - len(records))))
+    print(f'{len(records)} records')
+
+    root = SchemaNode()
+    for record in records:
+        root.merge_schema(extract_schema_from_dict(record))
+    schema = root.to_schema()
+
+    for load_format in LOAD_FORMATS:
+        benchmark(load_format, records, schema)
@@ -0,0 +1,53 @@
+"""
+Measures how the merge of two schemas scales with their width, for a few nesting depths
+(see `merge_schemas`, which matches the fields through a name index).
+
+The schemas have the same fields in opposite order, the worst case for naive matching.
+Linear scaling gives a factor 5 between 1k and 5k fields, quadratic scaling a factor 25.
+"""
+import sys
+import time
+import pathlib
+
+# Make the pipeline modules importable when running from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
+
+from schematools.schema_merge import merge_schemas  # noqa: E402
+
+WIDTHS = [10, 100, 1000, 5000]
+DEPTHS = [1, 2, 3, 4, 5]
+REPETITIONS = 3
+
+
+def gen_wide_schema(width: int, depth: int, reverse: bool = False):
+    """
+    Generates a schema with `width` primitive fields,
+    nested in `depth - 1` levels of records.
+    """
+    fields = [{"name": f"field_{i}", "type": "INTEGER", "mode": "REQUIRED"} for i in range(width)]
+    if reverse:
+        fields.reverse()
+    for level in range(depth - 1):
+        fields = [{"name": f"record_{level}", "type": "RECORD", "mode": "REQUIRED", "fields": fields}]
+    return fields
+
+
+def time_merge(width: int, depth: int) -> float:
+    """
+    Returns the best time of a few merges of two schemas with the same fields in opposite order.
+    """
+    timings = []
+    for _ in range(REPETITIONS):
+        schema1 = gen_wide_schema(width, depth)
+        schema2 = gen_wide_schema(width, depth, reverse=True)
+        start = time.perf_counter()
+        merge_schemas(schema1, schema2)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    for depth in DEPTHS:
+        timings = {width: time_merge(width, depth) for width in WIDTHS}
+        print(f'depth {depth}: ' + '  '.join(f'{width:5d} fields {timing * 1e3:8.2f} ms' for width, timing in timings.items())
+              + f'  ratio 5k/1k {timings[5000] / timings[1000]:5.1f}')
@@ -0,0 +1,111 @@
+import json
+import logging
+from typing import Dict, List
+
+from apache_beam.io.filesystems import FileSystems
+
+from json2bq.components import write_json
+
+logger = logging.getLogger()
+
+CHECKPOINT_VERSION = 1
+
+# The checkpoint of a run is written next to the previous one, and only replaces it once the run succeeded
+PENDING_SUFFIX = '.pending'
+
+
+def list_files(file_pattern: str) -> Dict[str, Dict[str, object]]:
+    """
+    Lists the files that match a pattern, with the metadata that identifies their content.
+
+    :param file_pattern: file pattern (local or on Cloud Storage)
+    :return: size and modification time (in seconds) of every file, by path
+    """
+    match = FileSystems.match([file_pattern])[0]
+    return {metadata.path: {'size': metadata.size_in_bytes, 'last_updated': metadata.last_updated_in_seconds}
+            for metadata in match.metadata_list}
+
+
+def load_checkpoint(path: str) -> Dict[str, object]:
+    """
+    Reads a checkpoint manifest (local or on Cloud Storage): the files that were processed by the previous runs
+    and the schema that was inferred from them.
+
+    :param path: location of the checkpoint
+    :return: the checkpoint, an empty one if it doesn't exist yet
+    """
+    if not FileSystems.exists(path):
+        return {'version': CHECKPOINT_VERSION, 'files': {}, 'schema': None}
+
+    with FileSystems.open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version {checkpoint.get("version")} in {path}')
+    return checkpoint
+
+
+def unprocessed_files(files: Dict[str, Dict[str, object]], checkpoint: Dict[str, object]) -> List[str]:
+    """
+    Determines the files that were not processed yet, i.e. the new files.
+    Files that changed since they were processed are not included, see `changed_files`.
+
+    :param files: files with their metadata, see `list_files`
+    :param checkpoint: checkpoint of the previous runs
+    :return: paths of the unprocessed files
+    """
+    processed_files = checkpoint['files']
+    return sorted(path for path in files if path not in processed_files)
+
+
+def changed_files(files: Dict[str, Dict[str, object]], checkpoint: Dict[str, object]) -> List[str]:
+    """
+    Determines the files that changed since they were processed.
+    These are not processed again, as loading them in full would duplicate the rows that were already loaded.
+
+    :param files: files with their metadata, see `list_files`
+    :param checkpoint: checkpoint of the previous runs
+    :return: paths of the changed files
+    """
+    processed_files = checkpoint['files']
+    return sorted(path for path, metadata in files.items()
+                  if path in processed_files and processed_files[path] != metadata)
+
+
+def checkpoint_files(files: Dict[str, Dict[str, object]], checkpoint: Dict[str, object]) -> Dict[str, Dict[str, object]]:
+    """
+    Determines the files to record in the next checkpoint.
+    Changed files keep the metadata of when they were processed, so every run reports them again.
+
+    :param files: files with their metadata, see `list_files`
+    :param checkpoint: checkpoint of the previous runs
+    :return: metadata of the processed files, by path
+    """
+    processed_files = checkpoint['files']
+    return {path: processed_files.get(path, metadata) for path, metadata in files.items()}
+
+
+def write_checkpoint(schema: List[object], path: str, files: Dict[str, Dict[str, object]]) -> str:
+    """
+    Writes the checkpoint of a run as pending, see `commit_checkpoint`.
+    The schema is the one inferred from all files, so the next run can merge the schemas of new files into it.
+
+    :param schema: inferred schema
+    :param path: location of the checkpoint
+    :param files: files that were processed, see `list_files`
+    :return: location of the pending checkpoint
+    """
+    checkpoint = {'version': CHECKPOINT_VERSION, 'files': files, 'schema': schema}
+    return write_json(checkpoint, path + PENDING_SUFFIX)
+
+
+def commit_checkpoint(path: str):
+    """
+    Replaces the checkpoint with the pending one, after the run that wrote it succeeded.
+    Until then, the next run starts from the previous checkpoint, so no files are skipped if the data load fails.
+
+    :param path: location of the checkpoint
+    """
+    pending_path = path + PENDING_SUFFIX
+    if FileSystems.exists(pending_path):
+        FileSystems.rename([pending_path], [path])
+        logger.info(f'Committed checkpoint {path}')
@@ -1,16 +1,39 @@
-import io
+import copy
 import json
 import logging
-
-from apache_beam.typehints import Dict, List
+import re
+import zlib
+
+import apache_beam as beam
+from apache_beam.io.filesystems import FileSystems
+from apache_beam.metrics import Metrics
+from apache_beam.transforms.trigger import AccumulationMode, AfterProcessingTime, Repeatedly
+from apache_beam.transforms.window import GlobalWindows
+from apache_beam.typehints import Dict, List, Tuple
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 
-from schematools.schema_extraction import extract_schema
-from schematools.schema_merge import merge_schemas
+from schematools.bq_types import MODE_NULLABLE, TYPE_ALIASES, TYPE_RECORD
+from schematools.data_detectors import DetectionContext, create_registry
+from schematools.exceptions import BQSchemaCastException, BQSchemaMergeException
+from schematools.field_stats import FieldStats
+from schematools.json_parser import create_parser
+from schematools.schema_casting import LOAD_FORMAT_JSON, check_load_format, compile_converter
+from schematools.schema_extraction import extract_schema_from_dict, validate_document
+from schematools.schema_fingerprint import ShapeCache, schema_fingerprint
+from schematools.schema_merge import WIDENING_STRICT, merge_schema_list, merge_schemas, schemas_equal
+from schematools.schema_validation import find_unknown_fields, fits_schema, index_schema
 
 logger = logging.getLogger()
 
+schema_updates_skipped = Metrics.counter(__name__, 'schema_updates_skipped')
+
+# BigQuery table names can only contain letters, numbers and underscores
+TABLE_NAME_INVALID_CHARS_RE = re.compile(r'[^A-Za-z0-9_]')
+
+# Output tag of the records that can't be processed
+DEAD_LETTER_TAG = 'dead_letter'
+
 
 def dummy(x: object):
     """
@@ -30,6 +53,64 @@ def print_schema(schema: List[object]):
     return schema
 
 
+def print_keyed_schema(element: Tuple[str, List[object]]):
+    table, schema = element
+    logger.info(f'Schema of {table}: {json.dumps(schema, indent=4)}')
+    return element
+
+
+def write_json(data: object, path: str) -> str:
+    """
+    Writes an object as a JSON file (local or on Cloud Storage), e.g. a field statistics report.
+
+    :param data: JSON serializable object
+    :param path: location of the file
+    :return: location of the file
+    """
+    with FileSystems.create(path, mime_type='application/json') as outfile:
+        outfile.write(json.dumps(data, indent=4).encode('utf-8'))
+    logger.info(f'Wrote {path}')
+    return path
+
+
+def dead_letter(namespace: object, error: Exception, record: str, source: str = None) -> beam.pvalue.TaggedOutput:
+    """
+    Wraps a record that can't be processed into a dead letter, and counts it per error class.
+
+    :param namespace: namespace of the counter, e.g. the DoFn class
+    :param error: the error that occurred while processing the record
+    :param record: the (serialized) record
+    :param source: file the record was read from, if known
+    :return: the dead letter, on the DEAD_LETTER_TAG output
+    """
+    error_class = type(error).__name__
+    Metrics.counter(namespace, f'dead_letter_{error_class}').inc()
+    return beam.pvalue.TaggedOutput(DEAD_LETTER_TAG, {
+        'error': error_class,
+        'reason': str(error),
+        'source': source,
+        'record': record,
+    })
+
+
+def failed_row_dead_letter(element: Tuple[str, Dict[str, object]], source: str = None) -> Dict[str, object]:
+    """
+    Wraps a row that BigQuery rejected (the FailedRows output of streaming inserts) into a dead letter.
+
+    :param element: (destination table, row) pair
+    :param source: where the row was read from, if known
+    :return: the dead letter
+    """
+    destination, row = element[0], element[1]
+    Metrics.counter('WriteToBigQuery', 'dead_letter_FailedRows').inc()
+    return {
+        'error': 'FailedRows',
+        'reason': f'Insert into {destination} failed',
+        'source': source,
+        'record': json.dumps(row, default=str),
+    }
+
+
 def map_extract_schema(data: Dict[str, object]) -> List[object]:
     """
     Mapper function to infer a schema from a given json document (1 line of JSONL file).
@@ -37,44 +118,654 @@ def map_extract_schema(data: Dict[str, object]) -> List[object]:
     :return: the inferred schema
     """
 
-    schema = extract_schema(data)
+    schema = extract_schema_from_dict(data)
     return schema
 
 
-def create_bq_table(schema: List[object], project: str, dataset: str, table: str) -> List[object]:
+class ParseJsonFn(beam.DoFn):
+    """
+    Parses JSONL lines, provided as (filename, line) tuples, into Python dicts.
+
+    Optionally selects a deterministic sample of the documents for schema inference,
+    which is emitted on the SCHEMA_SAMPLE_TAG output.
+    A line is sampled based on a checksum of its content.
+    With `sample_max`, the sampled documents are emitted as (filename, (checksum, line, document)) candidates,
+    of which `LimitSamplePerFile` keeps at most `sample_max` per file.
+    The JSON parser backend can be chosen, see `schematools.json_parser`.
+
+    With `dead_letter` enabled, lines that are not a JSON object, or of which no schema can be extracted,
+    are emitted on the DEAD_LETTER_TAG output instead of failing the job,
+    so they reach neither the schema inference nor the load.
+    The widening mode should be the one used for schema extraction.
+    With `keyed` enabled, documents (and sampled documents) are emitted as (filename, document) pairs.
+    """
+
+    SCHEMA_SAMPLE_TAG = 'schema_sample'
+
+    def __init__(self, sample_rate: float = None, sample_max: int = None, parser: str = None,
+                 dead_letter: bool = False, data_detectors: List[str] = None, widening: str = WIDENING_STRICT,
+                 keyed: bool = False):
+        self.sample_rate = sample_rate
+        self.sample_max = sample_max
+        self.sample_threshold = None if sample_rate is None else int(sample_rate * 2 ** 32)
+        self.parser = parser
+        self.loads = None
+        self.dead_letter = dead_letter
+        self.data_detectors = data_detectors
+        self.widening = widening
+        self.keyed = keyed
+        self.registry = None
+        self.detection = None
+        self.records_sampled = Metrics.counter(self.__class__, 'records_sampled')
+
+    def setup(self):
+        self.loads = create_parser(self.parser)
+        if self.dead_letter:
+            self.registry = create_registry(self.data_detectors)
+
+    def start_bundle(self):
+        if self.dead_letter:
+            self.detection = DetectionContext(self.registry)
+
+    def process(self, element):
+        filename, line = element
+        try:
+            data = self.loads(line)
+            if self.dead_letter:
+                # Only arrays can make schema extraction fail, so the scan of the line is a cheap shortcut
+                if '[' in line:
+                    validate_document(data, self.detection, self.widening)
+                elif type(data) is not dict:
+                    raise ValueError(f'JSON document is not an object but {type(data).__name__}')
+        except (ValueError, BQSchemaMergeException) as e:
+            if not self.dead_letter:
+                raise
+            yield dead_letter(self.__class__, e, line, filename)
+            return
+        yield (filename, data) if self.keyed else data
+
+        if self.sample_rate is not None or self.sample_max is not None:
+            checksum = zlib.crc32(line.encode('utf-8'))
+            if self.is_sampled(checksum):
+                self.records_sampled.inc()
+                if self.sample_max is not None:
+                    sample = (filename, (checksum, line, data))
+                else:
+                    sample = (filename, data) if self.keyed else data
+                yield beam.pvalue.TaggedOutput(self.SCHEMA_SAMPLE_TAG, sample)
+
+    def is_sampled(self, checksum: int) -> bool:
+        return self.sample_threshold is None or checksum < self.sample_threshold
+
+
+class LimitSamplePerFile(beam.PTransform):
+    """
+    Keeps at most `sample_max` documents per file of the sample candidates of ParseJsonFn.
+    The documents with the lowest checksums are kept, so the sample doesn't depend on how the input is bundled.
+
+    :param sample_max: maximal number of documents per file
+    :param keyed: emit the documents as (filename, document) pairs
+    """
+
+    def __init__(self, sample_max: int, keyed: bool = False):
+        super().__init__()
+        self.sample_max = sample_max
+        self.keyed = keyed
+
+    def expand(self, candidates):
+        if self.keyed:
+            get_sample = (lambda element: [(element[0], data) for _, _, data in element[1]])
+        else:
+            get_sample = (lambda element: [data for _, _, data in element[1]])
+        return (candidates
+                | "Select lowest checksums" >> beam.combiners.Top.SmallestPerKey(self.sample_max,
+                                                                                  key=lambda candidate: candidate[:2])
+                | "Get sampled documents" >> beam.FlatMap(get_sample)
+                )
+
+
+class ExtractSchemaFn(beam.DoFn):
+    """
+    Infers a schema from every json document, skipping documents
+    of which the shape was already seen in the current bundle.
+
+    As merging a schema with itself does not change the result,
+    only the first document of every shape needs to reach the combiner.
+    Data detection is skipped for field paths that were already seen as plain strings.
+    Caches are reset for every bundle, so retried bundles emit all their shapes again.
+
+    Optionally, field statistics are collected from every inspected document (see `FieldStats`),
+    they are emitted at the end of every bundle, to be merged by the combiner.
+    With `dead_letter` enabled, documents of which no schema can be extracted
+    are emitted on the DEAD_LETTER_TAG output instead of failing the job.
+    With `with_source` enabled, documents are (source, document) pairs, e.g. with the file they were read from,
+    the source is recorded in the dead letters.
+    The widening mode determines how conflicting types of array elements are resolved.
+    """
+
+    def __init__(self, cache_size: int = 1024, data_detectors: List[str] = None, collect_stats: bool = False,
+                 dead_letter: bool = False, widening: str = WIDENING_STRICT, with_source: bool = False):
+        self.cache_size = cache_size
+        self.data_detectors = data_detectors
+        self.collect_stats = collect_stats
+        self.dead_letter = dead_letter
+        self.widening = widening
+        self.with_source = with_source
+        self.registry = None
+        self.shape_cache = None
+        self.detection = None
+        self.stats = None
+        self.skipped = 0
+        self.cache_hits = Metrics.counter(self.__class__, 'shape_cache_hits')
+        self.cache_misses = Metrics.counter(self.__class__, 'shape_cache_misses')
+        self.detections_skipped = Metrics.counter(self.__class__, 'string_detections_skipped')
+        self.records_inspected = Metrics.counter(self.__class__, 'records_inspected')
+
+    def setup(self):
+        self.registry = create_registry(self.data_detectors)
+
+    def start_bundle(self):
+        self.shape_cache = ShapeCache(self.cache_size)
+        self.detection = DetectionContext(self.registry)
+        self.stats = {} if self.collect_stats else None
+        self.skipped = 0
+
+    def process(self, element):
+        source, data = self.split_source(element)
+        self.add_stats(data, self.detection)
+        yield from self.extract(data, self.detection, source=source)
+
+    def split_source(self, element) -> Tuple[str, Dict[str, object]]:
+        return element if self.with_source else (None, element)
+
+    def extract(self, data: Dict[str, object], detection: DetectionContext, key: str = None, source: str = None):
+        """
+        Emits the schema of a json document (see `extract_schema`), keyed if a key is given,
+        or a dead letter if no schema can be extracted.
+
+        :param data: JSON document, as a Python dict object
+        :param detection: data detection context
+        :param key: key of the document
+        :param source: source of the document, for the dead letter
+        :return: the schema, (key, schema) pair or dead letter, nothing if the shape was already seen
+        """
+        try:
+            schema = self.extract_schema(data, detection, key)
+        except BQSchemaMergeException as e:
+            if not self.dead_letter:
+                raise
+            yield dead_letter(self.__class__, e, json.dumps(data, default=str), source)
+            return
+
+        if schema is not None:
+            yield schema if key is None else (key, schema)
+
+    def add_stats(self, data: Dict[str, object], detection: DetectionContext, key: str = None):
+        """
+        Adds a json document to the field statistics of its key, if statistics are collected.
+
+        :param data: JSON document, as a Python dict object
+        :param detection: data detection context
+        :param key: key of the document
+        """
+        if self.stats is None:
+            return
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = FieldStats()
+        stats.add_document(data, detection)
+
+    def extract_schema(self, data: Dict[str, object], detection: DetectionContext, key: str = None) -> List[object]:
+        """
+        Infers the schema of a json document, unless a document of the same shape was already seen.
+
+        :param data: JSON document, as a Python dict object
+        :param detection: data detection context
+        :param key: key of the document, shapes are only shared between documents of the same key
+        :return: the inferred schema, None if the shape was already seen
+        """
+        self.records_inspected.inc()
+        fingerprint = schema_fingerprint(data, detection)
+        if key is not None:
+            fingerprint = (key, fingerprint)
+        if self.shape_cache.lookup(fingerprint):
+            self.cache_hits.inc()
+            return None
+
+        self.cache_misses.inc()
+        # Fingerprints and statistics share the detection context, only the skips of the extraction are counted
+        skipped = detection.skipped
+        schema = extract_schema_from_dict(data, detection, self.widening)
+        self.skipped += detection.skipped - skipped
+        self.shape_cache.add(fingerprint)
+        return schema
+
+    def finish_bundle(self):
+        self.detections_skipped.inc(self.skipped)
+        yield from self.emit_stats()
+
+    def emit_stats(self):
+        # Elements emitted outside of `process` need an explicit window
+        for key, stats in (self.stats or {}).items():
+            yield GlobalWindows.windowed_value(stats if key is None else (key, stats))
+
+
+class ExtractUnmatchedSchemaFn(ExtractSchemaFn):
+    """
+    Infers a schema from the json documents that don't fit a given schema (provided as a side input).
+    Used to validate a schema that was inferred from a sample of the documents.
+    """
+
+    def __init__(self, cache_size: int = 1024, data_detectors: List[str] = None, collect_stats: bool = False,
+                 dead_letter: bool = False, widening: str = WIDENING_STRICT, with_source: bool = False):
+        super().__init__(cache_size, data_detectors, collect_stats, dead_letter, widening, with_source)
+        self.schema_index = None
+        self.indexed_schema = None
+        self.records_unmatched = Metrics.counter(self.__class__, 'records_unmatched')
+
+    def process(self, element, schema: List[object]):
+        source, data = self.split_source(element)
+        # Side input is the same for all elements, so only index it once
+        if schema is not self.indexed_schema:
+            self.indexed_schema = schema
+            self.schema_index = index_schema(schema or [])
+
+        # Statistics cover all documents, also the ones that fit the schema
+        self.add_stats(data, self.detection)
+        if schema is not None and fits_schema(data, self.schema_index, self.registry):
+            return
+
+        self.records_unmatched.inc()
+        yield from self.extract(data, self.detection, source=source)
+
+
+class ExtractKeyedSchemaFn(ExtractSchemaFn):
+    """
+    Infers a schema per key from (key, json document) pairs, e.g. documents routed to different tables.
+    Emits (key, schema) pairs. With `with_source` enabled, the documents are (key, (source, document)) pairs.
+
+    Shapes and string paths are tracked per key,
+    as the same field can have a different type in every table.
+    """
+
+    def __init__(self, cache_size: int = 1024, data_detectors: List[str] = None, collect_stats: bool = False,
+                 dead_letter: bool = False, widening: str = WIDENING_STRICT, with_source: bool = False):
+        super().__init__(cache_size, data_detectors, collect_stats, dead_letter, widening, with_source)
+        self.detections = None
+
+    def start_bundle(self):
+        super().start_bundle()
+        self.detections = {}
+
+    def process(self, element):
+        key, (source, data) = element[0], self.split_source(element[1])
+        detection = self.get_detection(key)
+        self.add_stats(data, detection, key)
+        yield from self.extract(data, detection, key, source)
+
+    def get_detection(self, key: str) -> DetectionContext:
+        detection = self.detections.get(key)
+        if detection is None:
+            detection = self.detections[key] = DetectionContext(self.registry)
+        return detection
+
+
+class ExtractUnmatchedKeyedSchemaFn(ExtractKeyedSchemaFn):
+    """
+    Keyed version of ExtractUnmatchedSchemaFn,
+    the schemas are provided as a dictionary side input that maps every key to its schema.
+    """
+
+    def __init__(self, cache_size: int = 1024, data_detectors: List[str] = None, collect_stats: bool = False,
+                 dead_letter: bool = False, widening: str = WIDENING_STRICT, with_source: bool = False):
+        super().__init__(cache_size, data_detectors, collect_stats, dead_letter, widening, with_source)
+        self.schema_indexes = None
+        self.indexed_schemas = None
+        self.records_unmatched = Metrics.counter(self.__class__, 'records_unmatched')
+
+    def process(self, element, schemas: Dict[str, List[object]]):
+        # Side input is the same for all elements, so only index every schema once
+        if schemas is not self.indexed_schemas:
+            self.indexed_schemas = schemas
+            self.schema_indexes = {}
+
+        key, (source, data) = element[0], self.split_source(element[1])
+        detection = self.get_detection(key)
+        # Statistics cover all documents, also the ones that fit the schema
+        self.add_stats(data, detection, key)
+
+        schema = schemas.get(key)
+        if schema is not None:
+            schema_index = self.schema_indexes.get(key)
+            if schema_index is None:
+                schema_index = self.schema_indexes[key] = index_schema(schema)
+            if fits_schema(data, schema_index, self.registry):
+                return
+
+        self.records_unmatched.inc()
+        yield from self.extract(data, detection, key, source)
+
+
+class CastToSchemaFn(beam.DoFn):
+    """
+    Converts json documents to the types of a schema (provided as a side input) before they are loaded,
+    so BigQuery doesn't reject or coerce them (see `compile_converter`).
+    The converter is compiled once per side input.
+
+    With `report_dropped` enabled (e.g. for a schema that was inferred from a sample),
+    the fields that are not in the schema, and are dropped by the conversion, are counted (`fields_dropped`)
+    and the first occurrence of every such field is logged.
+
+    With `dead_letter` enabled, documents with a value that is not an object in a RECORD field
+    (e.g. a record that was kept in a conflict with a primitive type, see `dead_letter_widening`)
+    are emitted on the DEAD_LETTER_TAG output instead of being loaded.
+
+    :param load_format: format of the files the rows are loaded from, json (default) or avro
+    :param report_dropped: report the fields that are dropped by the conversion
+    :param dead_letter: emit the documents that don't fit the records of the schema as dead letters
+    :param with_source: documents are (source, document) pairs, the source is recorded in the dead letters
+    """
+
+    def __init__(self, load_format: str = LOAD_FORMAT_JSON, report_dropped: bool = False, dead_letter: bool = False,
+                 with_source: bool = False):
+        self.load_format = load_format
+        self.report_dropped = report_dropped
+        self.dead_letter = dead_letter
+        self.with_source = with_source
+        self.converter = None
+        self.compiled_schema = None
+        self.schema_index = None
+        self.dropped_paths = None
+        self.fields_dropped = Metrics.counter(self.__class__, 'fields_dropped')
+
+    def setup(self):
+        self.dropped_paths = set()
+
+    def process(self, element, schema: List[object]):
+        # Side input is the same for all elements, so only compile it once
+        if schema is not self.compiled_schema:
+            self.compiled_schema = schema
+            self.converter = compile_converter(schema or [], self.load_format, check_records=self.dead_letter)
+            self.schema_index = index_schema(schema or []) if self.report_dropped else None
+
+        source, data = element if self.with_source else (None, element)
+        if self.report_dropped:
+            self.check_dropped(data, self.schema_index)
+        try:
+            yield self.converter(data)
+        except BQSchemaCastException as e:
+            # Only raised with dead letters enabled
+            yield dead_letter(self.__class__, e, json.dumps(data, default=str), source)
+
+    def check_dropped(self, data: Dict[str, object], schema_index):
+        if type(data) is not dict:
+            return
+        unknown = find_unknown_fields(data, schema_index)
+        if not unknown:
+            return
+        self.fields_dropped.inc(len(unknown))
+        for path in set(unknown) - self.dropped_paths:
+            self.dropped_paths.add(path)
+            logger.warning(f'Field {path} is not in the schema and is dropped, it was not in the sampled documents')
+
+
+class CastToRoutedSchemaFn(CastToSchemaFn):
+    """
+    Routed version of CastToSchemaFn, documents are converted to the schema of the table they are routed to
+    (see `route_table`). The schemas are provided as a dictionary side input that maps every table to its schema.
+    """
+
+    def __init__(self, route_path: List[str], table: str, load_format: str = LOAD_FORMAT_JSON,
+                 report_dropped: bool = False, dead_letter: bool = False, with_source: bool = False):
+        super().__init__(load_format, report_dropped, dead_letter, with_source)
+        self.route_path = route_path
+        self.table = table
+        self.converters = None
+        self.compiled_schemas = None
+
+    def process(self, element, schemas: Dict[str, List[object]]):
+        # Side input is the same for all elements, so only compile every schema once
+        if schemas is not self.compiled_schemas:
+            self.compiled_schemas = schemas
+            self.converters = {}
+
+        source, data = element if self.with_source else (None, element)
+        table = route_table(data, self.route_path, self.table)
+        if table not in self.converters:
+            schema = schemas.get(table)
+            self.converters[table] = None if schema is None else \
+                (compile_converter(schema, self.load_format, check_records=self.dead_letter),
+                 index_schema(schema) if self.report_dropped else None)
+
+        # Documents of tables without a schema are left to BigQuery
+        if self.converters[table] is None:
+            yield data
+            return
+        converter, schema_index = self.converters[table]
+        if self.report_dropped:
+            self.check_dropped(data, schema_index)
+        try:
+            yield converter(data)
+        except BQSchemaCastException as e:
+            yield dead_letter(self.__class__, e, json.dumps(data, default=str), source)
+
+
+class CastToRunningSchemaFn(CastToSchemaFn):
+    """
+    Streaming version of CastToSchemaFn, documents are converted to the running schema (see `EvolveSchema`),
+    provided as a side input that is updated when the schema changes.
+    Documents that don't fit the running schema yet (e.g. with new fields of which the table update is pending)
+    are not converted, as the conversion would drop their new fields. They are emitted on the PENDING_TAG output
+    with `hold_pending` enabled, so they can be held until the table is updated, and passed on as is otherwise.
+
+    :param data_detectors: BigQuery types to detect in string values
+    :param hold_pending: emit the documents that don't fit the running schema on the PENDING_TAG output
+    """
+
+    PENDING_TAG = 'pending'
+
+    def __init__(self, data_detectors: List[str] = None, hold_pending: bool = False):
+        super().__init__(LOAD_FORMAT_JSON)
+        self.data_detectors = data_detectors
+        self.hold_pending = hold_pending
+        self.registry = None
+        self.schema_index = None
+        self.indexed_schema = None
+        self.records_pending = Metrics.counter(self.__class__, 'records_pending_schema_update')
+
+    def setup(self):
+        super().setup()
+        self.registry = create_registry(self.data_detectors)
+
+    def process(self, data: Dict[str, object], schema: List[object]):
+        # Side input is the same for all elements until the schema changes, so only index it once
+        if schema is not self.indexed_schema:
+            self.indexed_schema = schema
+            self.schema_index = None if schema is None else index_schema(schema)
+
+        if self.schema_index is None or not fits_schema(data, self.schema_index, self.registry):
+            self.records_pending.inc()
+            yield beam.pvalue.TaggedOutput(self.PENDING_TAG, data) if self.hold_pending else data
+            return
+        yield from super().process(data, schema)
+
+
+class HoldPendingRows(beam.PTransform):
+    """
+    Holds the documents that don't fit the running schema yet (see `CastToRunningSchemaFn`) for `delay` seconds
+    (processing time), so the table update that covers them is done before they are inserted,
+    and converts them to the running schema (provided as a singleton side input) once they are released.
+    Documents are grouped by their top level fields, documents that still don't fit are passed on as is.
+
+    :param running_schema: the running schema, as a singleton side input
+    :param delay: time to hold the documents, in seconds
+    :param data_detectors: BigQuery types to detect in string values
+    """
+
+    def __init__(self, running_schema: beam.pvalue.AsSingleton, delay: float, data_detectors: List[str] = None):
+        super().__init__()
+        self.running_schema = running_schema
+        self.delay = delay
+        self.data_detectors = data_detectors
+
+    def expand(self, documents):
+        return (documents
+                | "Key by fields" >> beam.Map(lambda data: (','.join(sorted(data)) if isinstance(data, dict) else '',
+                                                            data))
+                | "Hold documents" >> beam.WindowInto(GlobalWindows(), trigger=Repeatedly(AfterProcessingTime(self.delay)),
+                                                      accumulation_mode=AccumulationMode.DISCARDING)
+                | "Group documents" >> beam.GroupByKey()
+                | "Release documents" >> beam.FlatMap(lambda element: element[1])
+                | "Restore trigger" >> beam.WindowInto(GlobalWindows())
+                | "Cast to running schema" >> beam.ParDo(CastToRunningSchemaFn(self.data_detectors), self.running_schema)
+                )
+
+
+def route_table(data: Dict[str, object], route_path: List[str], table: str) -> str:
+    """
+    Determines the target table of a json document, based on the value of a routing field.
+    Documents with value `x` are routed to table `<table>_x`, characters that are not allowed
+    in table names are replaced by underscores.
+    Documents without a (primitive) value for the routing field are routed to the base table.
+
+    :param data: JSON document, as a Python dict object
+    :param route_path: path of the routing field, e.g. ['event', 'type']
+    :param table: base table name
+    :return: name of the target table
+    """
+    value = data
+    for field_name in route_path:
+        value = value.get(field_name) if isinstance(value, dict) else None
+
+    if value is None or isinstance(value, (dict, list)):
+        return table
+    return f'{table}_{TABLE_NAME_INVALID_CHARS_RE.sub("_", str(value))}'
+
+
+def route_table_spec(data: Dict[str, object], route_path: List[str], project: str, dataset: str, table: str) -> str:
+    """
+    Determines the full target table specification of a json document, see `route_table`.
+    Used as a dynamic destination of the WriteToBigQuery transform.
+
+    :param data: JSON document, as a Python dict object
+    :param route_path: path of the routing field
+    :param project: GCP project
+    :param dataset: Dataset in BigQuery
+    :param table: base table name
+    :return: table specification (project:dataset.table)
+    """
+    return f'{project}:{dataset}.{route_table(data, route_path, table)}'
+
+
+def load_schema(path: str) -> List[object]:
+    """
+    Reads a BigQuery schema from a JSON file (local or on Cloud Storage).
+    Both a list of fields and an object with a `fields` attribute are accepted.
+
+    :param path: location of the schema file
+    :return: BigQuery schema
+    """
+    with FileSystems.open(path) as schema_file:
+        schema = json.load(schema_file)
+    if isinstance(schema, dict):
+        schema = schema['fields']
+    return clean_schema(schema)
+
+
+def clean_schema(schema: List[object]) -> List[object]:
+    """
+    Converts a user provided schema into the form produced by schema inference:
+    upper case (legacy SQL) types and modes, with NULLABLE as default mode.
+
+    :param schema: BigQuery schema
+    :return: cleaned BigQuery schema
+    """
+    cleaned = []
+    for field in schema:
+        field_type = field['type'].upper()
+        cleaned_field = {
+            'name': field['name'],
+            'type': TYPE_ALIASES.get(field_type, field_type),
+            'mode': (field.get('mode') or MODE_NULLABLE).upper(),
+        }
+        if cleaned_field['type'] == TYPE_RECORD:
+            cleaned_field['fields'] = clean_schema(field.get('fields') or [])
+        cleaned.append(cleaned_field)
+    return cleaned
+
+
+def get_bq_table_schema(project: str, dataset: str, table: str, client: bigquery.Client = None) -> List[object]:
+    """
+    Fetches the schema of an existing table.
+
+    :param project: GCP project
+    :param dataset: Dataset in BigQuery
+    :param table: table name
+    :param client: BigQuery client, a new one is created if omitted
+    :return: schema of the table, None if the table does not exist
+    """
+    if client is None:
+        client = bigquery.Client()
+
+    table_id = f'{project}.{dataset}.{table}'
+    try:
+        existing_table = client.get_table(table_id)
+    except NotFound:
+        logger.info(f'Table {table_id} not found, no existing schema to seed with.')
+        return None
+    return clean_schema([field.to_api_repr() for field in existing_table.schema])
+
+
+def add_bq_table_schema(seed_schema: List[object], project: str, dataset: str, table: str,
+                        client: bigquery.Client = None) -> List[object]:
+    """
+    Extends a seed schema with the schema of an existing table.
+
+    :param seed_schema: seed schema, can be None
+    :param project: GCP project
+    :param dataset: Dataset in BigQuery
+    :param table: table name
+    :param client: BigQuery client, a new one is created if omitted
+    :return: merged seed schema, None if there is no seed schema nor an existing table
+    """
+    table_schema = get_bq_table_schema(project, dataset, table, client=client)
+    return merge_schema_list([seed_schema, table_schema])
+
+
+def create_bq_table(schema: List[object], project: str, dataset: str, table: str,
+                    client: bigquery.Client = None) -> List[object]:
     """
     Creates a table with a new schema, or updates the schema of an existing table.
     If the table already exists, a merge is performed with the new schema and the
-    existing schema. The table is then updated accordingly.
+    existing schema. The table is then updated accordingly, unless the merge
+    did not change the existing schema.
 
     :param schema: schema of the table
     :param project: GCP project (must exist)
     :param dataset: Dataset in BigQuery (must exist)
     :param table: Target table
+    :param client: BigQuery client, a new one is created if omitted
     :return: The final schema
     """
 
     # Construct a BigQuery client object.
-    client = bigquery.Client()
+    if client is None:
+        client = bigquery.Client()
 
     # FUTURE check dataset
 
     # Determine if table already exists
     table_id = f'{project}.{dataset}.{table}'
-    create = True
     try:
-        client.get_table(table_id)
+        existing_table = client.get_table(table_id)
         logger.info(f'Table {table_id} already exists.')
-        create = False
     except NotFound:
+        existing_table = None
         logger.info(f'Table {table_id} not found.')
 
     # Create or Update table
-    if create:
-        inmem_input = io.StringIO(json.dumps(schema))
-        final_schema = client.schema_from_json(inmem_input)
-
-        table = bigquery.Table(table_id, schema=final_schema)
+    if existing_table is None:
+        table = bigquery.Table(table_id, schema=to_schema_fields(schema))
         client.create_table(table)
         logger.info(f'Created table {table_id}')
 
@@ -82,31 +773,28 @@ def create_bq_table(schema: List[object], project: str, dataset: str, table: str
     else:
         # Update the table
 
-        # Get schema from existing table
-        existing_table = client.get_table(table_id)
-        existing_schema = existing_table.schema
-
-        # Convert to schema to dictionary
-        inmem_output = io.StringIO()
-        client.schema_to_json(existing_schema, inmem_output)
-        existing_schema_str = inmem_output.getvalue()
-        existing_schema_list = json.loads(existing_schema_str)
-        logger.info(f'Existing schema {existing_schema_str}')
+        # Convert existing schema to dictionary
+        existing_schema_list = [field.to_api_repr() for field in existing_table.schema]
+        logger.info(f'Existing schema {json.dumps(existing_schema_list)}')
 
         # Log proposed schema
         schema_str = json.dumps(schema, indent=4)
         logger.info(f'Proposed schema {schema_str}')
 
-        # Merge schemas
-        final_schema_list = merge_schemas(existing_schema_list, schema)
-        final_schema_str = json.dumps(final_schema_list, indent=4)
+        # Merge schemas (merging relaxes fields in place, so keep the existing schema intact)
+        final_schema_list = merge_schemas(copy.deepcopy(existing_schema_list), schema)
+
+        # Skip the update when nothing changed
+        if schemas_equal(final_schema_list, existing_schema_list):
+            logger.info(f'Schema of table {table_id} is unchanged, skipping update')
+            schema_updates_skipped.inc()
+            return final_schema_list
 
-        inmem_input = io.StringIO(final_schema_str)
-        final_schema = client.schema_from_json(inmem_input)
+        final_schema_str = json.dumps(final_schema_list, indent=4)
         logger.info(f'Merged schema {final_schema_str}')
 
         # Update existing table with new schema
-        existing_table.schema = final_schema
+        existing_table.schema = to_schema_fields(final_schema_list)
         client.update_table(existing_table, ["schema"])  # Make an API request.
 
         logger.info("Existing table updated with new schema")
@@ -114,15 +802,57 @@ def create_bq_table(schema: List[object], project: str, dataset: str, table: str
         return final_schema_list
 
 
-def prep_schema(destination, json_schema: List[object]) -> Dict[str, object]:
+def create_keyed_bq_table(element: Tuple[str, List[object]], project: str, dataset: str,
+                          client: bigquery.Client = None) -> Tuple[str, List[object]]:
+    """
+    Keyed version of `create_bq_table`, for (table, schema) pairs.
+
+    :param element: table name and the schema of the table
+    :param project: GCP project (must exist)
+    :param dataset: Dataset in BigQuery (must exist)
+    :param client: BigQuery client, a new one is created if omitted
+    :return: table name and the final schema
+    """
+    table, schema = element
+    return table, create_bq_table(schema, project, dataset, table, client=client)
+
+
+def to_schema_fields(schema: List[object]) -> List[bigquery.SchemaField]:
+    """
+    Converts a schema to BigQuery client objects.
+
+    :param schema: BigQuery schema, as a list of dictionaries
+    :return: BigQuery schema, as a list of SchemaField objects
+    """
+    return [bigquery.SchemaField.from_api_repr(field) for field in schema]
+
+
+def prep_schema(destination, json_schema: List[object], load_format: str = LOAD_FORMAT_JSON) -> Dict[str, object]:
     """
     Prepares the schema in a format that the WriteToBigQuery transform can handle.
 
     :param destination: destination table
     :param json_schema: schema for the table
+    :param load_format: format of the files the rows are loaded from, the schema is checked against it
     :return: wrapped schema, compatible with WriteToBigQuery
     """
 
+    check_load_format(json_schema, load_format)
+
     return {
         'fields': json_schema
     }
+
+
+def prep_routed_schema(destination: str, json_schemas: Dict[str, List[object]],
+                       load_format: str = LOAD_FORMAT_JSON) -> Dict[str, object]:
+    """
+    Prepares the schema of a dynamic destination in a format that the WriteToBigQuery transform can handle.
+
+    :param destination: destination table (project:dataset.table)
+    :param json_schemas: schemas, by table name
+    :param load_format: format of the files the rows are loaded from, the schema is checked against it
+    :return: wrapped schema, compatible with WriteToBigQuery
+    """
+
+    return prep_schema(destination, json_schemas[destination.rsplit('.', 1)[-1]], load_format)
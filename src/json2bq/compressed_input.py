@@ -0,0 +1,148 @@
+import logging
+from typing import List
+
+import apache_beam as beam
+from apache_beam.io import ReadFromTextWithFilename
+from apache_beam.io.filesystem import CompressionTypes
+from apache_beam.io.filesystems import FileSystems
+from apache_beam.io.fileio import MatchAll, MatchFiles
+from apache_beam.metrics import Metrics
+
+from schematools import compression
+from schematools.local_inference import DEFAULT_CHUNK_SIZE
+
+logger = logging.getLogger()
+
+
+class SplitCompressedFileFn(beam.DoFn):
+    """
+    Splits a compressed file into byte ranges that start at a member boundary, see `compression.split_points`.
+    Files that consist of a single member (e.g. regular gzip files) result in a single range.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.compressed_ranges = Metrics.counter(self.__class__, 'compressed_ranges')
+
+    def process(self, metadata):
+        path = metadata.path
+        # Raw bytes are needed, FileSystems would otherwise decompress based on the extension
+        with FileSystems.open(path, compression_type=CompressionTypes.UNCOMPRESSED) as infile:
+            ranges = compression.split_points(infile, metadata.size_in_bytes, compression.compression_type(path),
+                                              self.chunk_size)
+
+        logger.info(f'Split {path} into {len(ranges)} ranges')
+        self.compressed_ranges.inc(len(ranges))
+        for start, end in ranges:
+            yield path, start, end
+
+
+class ReadCompressedRangeFn(beam.DoFn):
+    """
+    Reads the lines of a byte range of a compressed file.
+    Outputs (filename, line) pairs, like `ReadFromTextWithFilename`.
+    """
+
+    def process(self, element):
+        path, start, end = element
+        with FileSystems.open(path, compression_type=CompressionTypes.UNCOMPRESSED) as infile:
+            for line in compression.read_lines(infile, start, end, compression.compression_type(path)):
+                yield path, line.decode('utf-8')
+
+
+class ReadTextFileFn(beam.DoFn):
+    """
+    Reads the lines of a whole text file, from its metadata.
+    Outputs (filename, line) pairs, like `ReadFromTextWithFilename`.
+    """
+
+    def process(self, metadata):
+        path = metadata.path
+        with FileSystems.open(path) as infile:
+            for line in infile:
+                if line.endswith(b'\n'):
+                    line = line[:-2] if line.endswith(b'\r\n') else line[:-1]
+                yield path, line.decode('utf-8')
+
+
+class ReadCompressedTextWithFilename(beam.PTransform):
+    """
+    Reads compressed (gzip, zstd or bzip2) text files, splitting them at member boundaries
+    so a single large file can be decompressed by multiple workers.
+    """
+
+    def __init__(self, file_pattern: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self.file_pattern = file_pattern
+        self.chunk_size = chunk_size
+
+    def expand(self, pbegin):
+        return (pbegin
+                | "Match files" >> MatchFiles(self.file_pattern)
+                | "Split at members" >> beam.ParDo(SplitCompressedFileFn(self.chunk_size))
+                # Distribute the ranges of a file over the workers
+                | "Distribute ranges" >> beam.Reshuffle()
+                | "Read ranges" >> beam.ParDo(ReadCompressedRangeFn())
+                )
+
+
+class ReadMatchedTextWithFilename(beam.PTransform):
+    """
+    Reads the text files of a PCollection of file metadata, e.g. the output of `MatchFiles`.
+    Like `read_text_with_filename`, compressed files are split at member boundaries.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self.chunk_size = chunk_size
+
+    def expand(self, files):
+        compressed_files, plain_files = (files
+                | "Partition by compression" >> beam.Partition(
+                    lambda metadata, _: 0 if compression.compression_type(metadata.path) is not None else 1, 2)
+                )
+
+        compressed_lines = (compressed_files
+                | "Split at members" >> beam.ParDo(SplitCompressedFileFn(self.chunk_size))
+                # Distribute the ranges of a file over the workers
+                | "Distribute ranges" >> beam.Reshuffle()
+                | "Read ranges" >> beam.ParDo(ReadCompressedRangeFn())
+                )
+        # Files are read as a whole, `ReadAllFromText` only keeps the filenames in newer Beam versions
+        lines = (plain_files
+                | "Distribute files" >> beam.Reshuffle()
+                | "Read files" >> beam.ParDo(ReadTextFileFn())
+                )
+        return (compressed_lines, lines) | "Flatten files" >> beam.Flatten()
+
+
+class ReadTextFilesWithFilename(beam.PTransform):
+    """
+    Reads a list of text files, e.g. the files that were not processed yet (see `unprocessed_files`).
+    Like `read_text_with_filename`, compressed files are split at member boundaries.
+    """
+
+    def __init__(self, paths: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self.paths = paths
+        self.chunk_size = chunk_size
+
+    def expand(self, pbegin):
+        return (pbegin
+                | "Files" >> beam.Create(self.paths)
+                | "Match files" >> MatchAll()
+                | "Read matched files" >> ReadMatchedTextWithFilename(self.chunk_size)
+                )
+
+
+def read_text_with_filename(file_pattern: str) -> beam.PTransform:
+    """
+    Creates the read transform for a file pattern: compressed files are split at member boundaries,
+    other files are read (and split) by `ReadFromTextWithFilename`.
+
+    :param file_pattern: file pattern
+    :return: a transform that outputs (filename, line) pairs
+    """
+    if compression.compression_type(file_pattern) is not None:
+        return ReadCompressedTextWithFilename(file_pattern)
+    return ReadFromTextWithFilename(file_pattern)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+import apache_beam as beam
+from apache_beam.io.filesystem import FileMetadata
+from apache_beam.io.filesystems import FileSystems
+from apache_beam.io.fileio import MatchFiles
+from apache_beam.metrics import Metrics
+
+from json2bq.components import DEAD_LETTER_TAG, ExtractKeyedSchemaFn, ParseJsonFn, write_json
+from json2bq.compressed_input import ReadMatchedTextWithFilename
+from json2bq.schema_accumulator import CombineSchemas
+from schematools.data_detectors import DEFAULT_DETECTOR_TYPES
+from schematools.schema_merge import WIDENING_STRICT
+
+logger = logging.getLogger()
+
+
+class FileSchemaCache(object):
+    """
+    Cache of the partial schemas of input files (local or on Cloud Storage), keyed by a fingerprint of their content.
+    Every entry is a JSON file `<key>.json` in the cache location, so the cache can be shared by all workers.
+
+    Entries are evicted by age (since they were written) and by the total size of the cache, oldest first.
+    Partial schemas depend on the data detectors and the widening mode, so these are part of the keys.
+
+    :param location: directory of the cache entries
+    :param max_age: maximal age of an entry, in seconds
+    :param max_size: maximal total size of the entries, in bytes
+    :param data_detectors: BigQuery types to detect in string values, defaults to DEFAULT_DETECTOR_TYPES
+    :param widening: widening mode of the schema extraction
+    """
+
+    def __init__(self, location: str, max_age: float = None, max_size: int = None, data_detectors: List[str] = None,
+                 widening: str = WIDENING_STRICT):
+        self.location = location
+        self.max_age = max_age
+        self.max_size = max_size
+        self.data_detectors = data_detectors
+        self.widening = widening
+
+    def fingerprint(self, metadata: FileMetadata) -> str:
+        """
+        Computes the key of a file from its path, size and checksum, and from the settings of the schema extraction.
+
+        :param metadata: metadata of the file, e.g. from `MatchFiles`
+        :return: the key of the file
+        """
+        checksum = FileSystems.checksum(metadata.path)
+        # Local files have no checksum (only their size), their modification time identifies their content instead
+        version = metadata.last_updated_in_seconds if checksum == str(metadata.size_in_bytes) else None
+        # The order of the detectors is kept, it determines which type is detected first
+        data_detectors = list(DEFAULT_DETECTOR_TYPES if self.data_detectors is None else self.data_detectors)
+        content = json.dumps([metadata.path, metadata.size_in_bytes, checksum, version, data_detectors, self.widening])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return FileSystems.join(self.location, f'{key}.json')
+
+    def get(self, key: str) -> Optional[List[object]]:
+        """
+        :param key: the key of a file, see `fingerprint`
+        :return: the cached schema of the file, None if it is not cached
+        """
+        path = self.entry_path(key)
+        if not FileSystems.exists(path):
+            return None
+        with FileSystems.open(path) as entry_file:
+            return json.load(entry_file)['schema']
+
+    def put(self, key: str, schema: List[object], source: str = None):
+        """
+        :param key: the key of a file, see `fingerprint`
+        :param schema: the schema of the file
+        :param source: the path of the file, for reference
+        """
+        write_json({'source': source, 'schema': schema}, self.entry_path(key))
+
+    def evict(self, now: float = None) -> int:
+        """
+        Removes the entries that are older than the maximal age,
+        and the oldest entries until the cache is not larger than the maximal size.
+
+        :param now: current time, in seconds since the epoch
+        :return: number of removed entries
+        """
+        now = time.time() if now is None else now
+        entries = FileSystems.match([FileSystems.join(self.location, '*.json')])[0].metadata_list
+        entries = sorted(entries, key=lambda entry: entry.last_updated_in_seconds, reverse=True)
+
+        evicted = []
+        size = 0
+        for entry in entries:
+            size += entry.size_in_bytes
+            if (self.max_age is not None and now - entry.last_updated_in_seconds > self.max_age) or \
+                    (self.max_size is not None and size > self.max_size):
+                evicted.append(entry.path)
+
+        if evicted:
+            FileSystems.delete(evicted)
+            logger.info(f'Evicted {len(evicted)} of {len(entries)} entries from {self.location}')
+        return len(evicted)
+
+
+class LookupFileSchemaFn(beam.DoFn):
+    """
+    Looks up the schema of every file in the cache.
+    Cached schemas are emitted on the main output,
+    files that are not cached on the UNCACHED_TAG output, as (metadata, key) pairs.
+    """
+
+    UNCACHED_TAG = 'uncached'
+
+    def __init__(self, cache: FileSchemaCache):
+        self.cache = cache
+        self.cache_hits = Metrics.counter(self.__class__, 'cache_hits')
+        self.cache_misses = Metrics.counter(self.__class__, 'cache_misses')
+
+    def process(self, metadata: FileMetadata):
+        key = self.cache.fingerprint(metadata)
+        schema = self.cache.get(key)
+        if schema is None:
+            self.cache_misses.inc()
+            yield beam.pvalue.TaggedOutput(self.UNCACHED_TAG, (metadata, key))
+        else:
+            self.cache_hits.inc()
+            yield schema
+
+
+class StoreFileSchemaFn(beam.DoFn):
+    """
+    Stores the schemas of files, provided as (path, schema) pairs, in the cache and emits them.
+    The keys of the files are provided as a dictionary side input that maps every path to its key.
+    """
+
+    def __init__(self, cache: FileSchemaCache):
+        self.cache = cache
+
+    def process(self, element, keys: Dict[str, str]):
+        path, schema = element
+        self.cache.put(keys[path], schema, path)
+        yield schema
+
+
+class InferCachedFileSchemas(beam.PTransform):
+    """
+    Infers a schema per input file, only extracting the documents of the files of which the schema is not cached yet.
+    The schemas of these files are extracted, merged per file and added to the cache.
+    The data detectors and the widening mode are the ones of the cache.
+
+    If the whole input is read anyway (e.g. to load it), its parsed documents can be provided
+    as (filename, document) pairs, so the input is not read twice.
+    Otherwise only the files that are not cached are read.
+
+    Outputs the schemas of all files and the dead letters of the schema extraction,
+    which include the dead letters of the parser if the files are read by this transform.
+    Files without any valid document are not cached.
+
+    :param file_pattern: the file pattern of the input
+    :param cache: the file schema cache
+    :param parser: JSON parser backend, if the files are read by this transform
+    :param dead_letter: emit the documents that can't be processed as dead letters instead of failing
+    :param documents: parsed documents of the whole input, keyed by filename
+    """
+
+    def __init__(self, file_pattern: str, cache: FileSchemaCache, parser: str = None, dead_letter: bool = False,
+                 documents: beam.PCollection = None):
+        super().__init__()
+        self.file_pattern = file_pattern
+        self.cache = cache
+        self.parser = parser
+        self.dead_letter = dead_letter
+        self.documents = documents
+
+    def expand(self, pbegin):
+        data_detectors = self.cache.data_detectors
+        widening = self.cache.widening
+        files = (pbegin
+                 | "Match files" >> MatchFiles(self.file_pattern)
+                 | "Look up file schemas" >> beam.ParDo(LookupFileSchemaFn(self.cache))
+                                                  .with_outputs(LookupFileSchemaFn.UNCACHED_TAG, main='schemas')
+                 )
+        uncached_files = files[LookupFileSchemaFn.UNCACHED_TAG]
+        keys = (uncached_files | "Get file keys" >> beam.Map(lambda element: (element[0].path, element[1])))
+
+        dead_letters = []
+        if self.documents is not None:
+            uncached_documents = (self.documents
+                 | "Select uncached documents" >> beam.Filter(lambda element, uncached: element[0] in uncached,
+                                                              beam.pvalue.AsDict(keys))
+                 )
+        else:
+            parsed_data = (uncached_files
+                 | "Get file metadata" >> beam.Map(lambda element: element[0])
+                 | "Read uncached files" >> ReadMatchedTextWithFilename()
+                 | "Parse json" >> beam.ParDo(ParseJsonFn(parser=self.parser, dead_letter=self.dead_letter,
+                                                          data_detectors=data_detectors, widening=widening,
+                                                          keyed=True))
+                                       .with_outputs(DEAD_LETTER_TAG, main='documents')
+                 )
+            uncached_documents = parsed_data.documents
+            dead_letters.append(parsed_data[DEAD_LETTER_TAG])
+
+        extracted_schemas = (uncached_documents
+                 # The file is the key, and the source of the dead letters
+                 | "Add sources" >> beam.Map(lambda element: (element[0], element))
+                 | "Extract schemas" >> beam.ParDo(ExtractKeyedSchemaFn(data_detectors=data_detectors,
+                                                                        dead_letter=self.dead_letter,
+                                                                        widening=widening, with_source=True))
+                                            .with_outputs(DEAD_LETTER_TAG, main='schemas')
+                 )
+        dead_letters.append(extracted_schemas[DEAD_LETTER_TAG])
+        new_schemas = (extracted_schemas.schemas
+                 | "Combine schemas per file" >> CombineSchemas(widening=widening, keyed=True)
+                 | "Store file schemas" >> beam.ParDo(StoreFileSchemaFn(self.cache), beam.pvalue.AsDict(keys))
+                 )
+
+        schemas = ((files.schemas, new_schemas) | "Flatten file schemas" >> beam.Flatten())
+        dead_letters = (dead_letters | "Flatten dead letters" >> beam.Flatten())
+        return schemas, dead_letters
@@ -0,0 +1,207 @@
+import json
+import logging
+import uuid
+
+import apache_beam as beam
+import pyarrow as pa
+import pyarrow.parquet as pq
+from apache_beam.io.filesystems import FileSystems
+from apache_beam.metrics import Metrics
+from apache_beam.transforms.window import GlobalWindows
+from apache_beam.typehints import Dict, List
+
+from json2bq.components import DEAD_LETTER_TAG, dead_letter
+from schematools.schema_arrow import to_arrow_schema
+from schematools.schema_casting import LOAD_FORMAT_AVRO, compile_converter
+
+logger = logging.getLogger()
+
+# Number of rows that are buffered before they are written as a row group
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+# Errors of Arrow on rows of which a value doesn't fit the type of its field
+ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError)
+
+
+def to_arrow_table(rows: List[Dict[str, object]], arrow_schema: pa.Schema) -> pa.Table:
+    """
+    Converts rows into an Arrow table, column by column (`Table.from_pylist` needs a newer pyarrow than Beam allows).
+    Fields that are missing in a row are null.
+
+    :param rows: rows, converted to the schema (see `compile_converter`)
+    :param arrow_schema: Arrow schema of the table
+    :return: Arrow table
+    """
+    columns = {name: [row.get(name) for row in rows] for name in arrow_schema.names}
+    return pa.Table.from_pydict(columns, schema=arrow_schema)
+
+
+class WriteParquetFn(beam.DoFn):
+    """
+    Writes json documents as Parquet files, with the schema provided as a side input (see `to_arrow_schema`).
+    Documents are converted to the schema first (see `compile_converter`), Parquet holds the same typed values as Avro.
+    All fields are nullable, as a document without a value for a REQUIRED field (e.g. with a sampled schema)
+    would make the whole file fail to write.
+
+    Every bundle writes its own file, named `<path_prefix>-<uuid>.parquet`, and emits its location.
+    Rows are buffered and written in row groups of at most `row_group_size` rows,
+    so memory usage doesn't depend on the bundle size.
+    Only supports the global window, i.e. batch pipelines.
+
+    With `dead_letter` enabled, rows with values that don't fit the types of the schema
+    are emitted on the DEAD_LETTER_TAG output instead of failing the job.
+
+    :param path_prefix: location prefix of the files (local or on Cloud Storage)
+    :param row_group_size: maximal number of rows per row group
+    :param dead_letter: emit the rows that don't fit the schema as dead letters
+    """
+
+    def __init__(self, path_prefix: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE, dead_letter: bool = False):
+        self.path_prefix = path_prefix
+        self.row_group_size = row_group_size
+        self.dead_letter = dead_letter
+        self.converter = None
+        self.arrow_schema = None
+        self.compiled_schema = None
+        self.path = None
+        self.outfile = None
+        self.writer = None
+        self.rows = None
+        self.written_rows = Metrics.counter(self.__class__, 'written_rows')
+        self.written_row_groups = Metrics.counter(self.__class__, 'written_row_groups')
+
+    def start_bundle(self):
+        self.rows = []
+
+    def process(self, data: Dict[str, object], schema: List[object]):
+        # Side input is the same for all elements, so only compile it once
+        if schema is not self.compiled_schema:
+            self.compiled_schema = schema
+            self.converter = compile_converter(schema, LOAD_FORMAT_AVRO)
+            self.arrow_schema = to_arrow_schema(schema, required=False)
+
+        self.rows.append(self.converter(data))
+        if len(self.rows) >= self.row_group_size:
+            yield from self.write_row_group()
+
+    def write_row_group(self):
+        """
+        Writes the buffered rows as a row group.
+
+        :return: the dead letters of the rows that don't fit the schema
+        """
+        try:
+            table = to_arrow_table(self.rows, self.arrow_schema)
+        except ARROW_ERRORS:
+            if not self.dead_letter:
+                raise
+            # Only look for the rows that don't fit if the row group can't be converted at once
+            table, dead_letters = self.convert_rows()
+            yield from dead_letters
+        self.rows = []
+        if table.num_rows == 0:
+            return
+
+        # The file is only created once there are rows to write
+        if self.writer is None:
+            self.path = f'{self.path_prefix}-{uuid.uuid4().hex}.parquet'
+            self.outfile = FileSystems.create(self.path, mime_type='application/octet-stream')
+            self.writer = pq.ParquetWriter(self.outfile, self.arrow_schema)
+
+        self.writer.write_table(table)
+        self.written_rows.inc(table.num_rows)
+        self.written_row_groups.inc()
+
+    def convert_rows(self):
+        rows = []
+        dead_letters = []
+        for row in self.rows:
+            try:
+                to_arrow_table([row], self.arrow_schema)
+                rows.append(row)
+            except ARROW_ERRORS as e:
+                dead_letters.append(dead_letter(self.__class__, e, json.dumps(row, default=str)))
+        return to_arrow_table(rows, self.arrow_schema), dead_letters
+
+    def finish_bundle(self):
+        # Elements emitted outside of `process` need an explicit window
+        if self.rows:
+            for output in self.write_row_group():
+                yield beam.pvalue.TaggedOutput(output.tag, GlobalWindows.windowed_value(output.value))
+        self.rows = None
+
+        if self.writer is not None:
+            self.writer.close()
+            self.outfile.close()
+            logger.info(f'Wrote {self.path}')
+            yield GlobalWindows.windowed_value(self.path)
+            self.writer = None
+            self.outfile = None
+
+
+def finalize_parquet_files(temp_paths: List[str], temp_prefix: str, path_prefix: str) -> List[str]:
+    """
+    Moves the Parquet files of the committed bundles from the temporary directory to their final location,
+    and removes the temporary directory with the files of failed or retried bundles.
+    Files that were already moved (when the finalization is retried) are skipped.
+
+    :param temp_paths: locations of the files of the committed bundles
+    :param temp_prefix: location prefix of the temporary files, in the temporary directory
+    :param path_prefix: location prefix of the final files
+    :return: final locations of the files
+    """
+    final_paths = [path_prefix + temp_path[len(temp_prefix):] for temp_path in temp_paths]
+    pending = [(temp_path, final_path) for temp_path, final_path in zip(temp_paths, final_paths)
+               if FileSystems.exists(temp_path)]
+    if pending:
+        FileSystems.rename([temp_path for temp_path, _ in pending], [final_path for _, final_path in pending])
+    logger.info(f'Moved {len(pending)} Parquet files to {path_prefix}-*.parquet')
+
+    temp_dir = FileSystems.split(temp_prefix)[0]
+    try:
+        FileSystems.delete([temp_dir])
+    except IOError:
+        # Nothing was written, or the directory was already removed by a previous attempt
+        logger.info(f'Unable to delete {temp_dir}')
+    return final_paths
+
+
+class WriteParquetFiles(beam.PTransform):
+    """
+    Writes json documents as Parquet files named `<path_prefix>-<uuid>.parquet` (see `WriteParquetFn`).
+
+    The bundles write their files into a temporary directory next to the final files,
+    which are only moved to their final location once all bundles are committed (see `finalize_parquet_files`),
+    so failed or retried bundles leave no duplicate or partial files behind.
+
+    Outputs the final locations of the files, and the dead letters of the rows that don't fit the schema.
+
+    :param path_prefix: location prefix of the files (local or on Cloud Storage)
+    :param schema: the schema, as a singleton side input
+    :param row_group_size: maximal number of rows per row group
+    :param dead_letter: emit the rows that don't fit the schema as dead letters
+    """
+
+    def __init__(self, path_prefix: str, schema: beam.pvalue.AsSingleton, row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                 dead_letter: bool = False):
+        super().__init__()
+        self.path_prefix = path_prefix
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.dead_letter = dead_letter
+
+    def expand(self, documents):
+        base_path, name = FileSystems.split(self.path_prefix)
+        temp_prefix = FileSystems.join(base_path, f'temp-{name}-{uuid.uuid4().hex}', name)
+
+        written = (documents
+                   | "Write temporary files" >> beam.ParDo(WriteParquetFn(temp_prefix, self.row_group_size,
+                                                                          self.dead_letter), self.schema)
+                                                    .with_outputs(DEAD_LETTER_TAG, main='paths')
+                   )
+        paths = (written.paths
+                 | "Collect temporary files" >> beam.combiners.ToList()
+                 | "Finalize files" >> beam.FlatMap(finalize_parquet_files, temp_prefix=temp_prefix,
+                                                    path_prefix=self.path_prefix)
+                 )
+        return paths, written[DEAD_LETTER_TAG]
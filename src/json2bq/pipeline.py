@@ -1,16 +1,409 @@
 from __future__ import absolute_import
 
+import functools
+
 import apache_beam as beam
-from apache_beam.io import ReadFromText
-from apache_beam.options.pipeline_options import PipelineOptions, GoogleCloudOptions, SetupOptions
+from apache_beam.io import fileio
+from apache_beam.io.gcp.bigquery import BigQueryWriteFn
+from apache_beam.io.gcp.bigquery_tools import FileFormat, RetryStrategy
+from apache_beam.options.pipeline_options import PipelineOptions, GoogleCloudOptions, SetupOptions, StandardOptions
+from apache_beam.transforms import trigger, window
 
 from json2bq.components import *
-from json2bq.schema_accumulator import SchemaCombinerFn
+from json2bq.checkpoint import changed_files, checkpoint_files, commit_checkpoint, list_files, load_checkpoint, \
+    unprocessed_files, write_checkpoint
+from json2bq.compressed_input import ReadTextFilesWithFilename, read_text_with_filename
+from json2bq.file_schema_cache import FileSchemaCache, InferCachedFileSchemas
+from json2bq.parquet_output import WriteParquetFiles
+from json2bq.schema_accumulator import CombineSchemas
+from json2bq.schema_evolution import EvolveSchema
+from schematools.schema_casting import LOAD_FORMAT_AVRO, LOAD_FORMAT_JSON, LOAD_FORMATS
+from schematools.schema_merge import WIDENING_JSON, WIDENING_MODES, dead_letter_widening, relax_schema
 
 logger = logging.getLogger()
 
+# Formats of the temporary files of the load jobs
+LOAD_FILE_FORMATS = {
+    LOAD_FORMAT_JSON: FileFormat.JSON,
+    LOAD_FORMAT_AVRO: FileFormat.AVRO,
+}
+
+
+def create_pipeline_options(pipeline_args, setup_script=None, streaming=False) -> PipelineOptions:
+    """
+    Creates the options of a pipeline.
+
+    :param pipeline_args: general pipeline arguments
+    :param setup_script: setup script, so the workers include the right modules
+    :param streaming: run the pipeline in streaming mode
+    :return: the pipeline options
+    """
+    # `save_main_session` is set to true because some DoFn's rely on
+    # globally imported modules.
+    pipeline_options = PipelineOptions(
+        pipeline_args,
+        save_main_session=True,
+    )
+    if streaming:
+        pipeline_options.view_as(StandardOptions).streaming = True
+
+    # Set setup script so we include the right modules
+    if setup_script:
+        pipeline_options.view_as(SetupOptions).setup_file = setup_script
+    return pipeline_options
+
+
+class ParseInput(beam.PTransform):
+    """
+    Reads the input and decodes every line once (see `ParseJsonFn`),
+    the parsed documents are shared by the schema and load branches.
+
+    Outputs the documents, the documents to infer the schema from (the sample, if sampling is enabled)
+    and the dead letters.
+
+    :param read_input: transform that reads the input as (filename, line) pairs
+    :param sample_rate: fraction of the documents to infer the schema from
+    :param sample_max: maximal number of documents per file to infer the schema from
+    :param keyed: emit the documents (and the documents to infer the schema from) as (filename, document) pairs
+    """
+
+    def __init__(self, read_input: beam.PTransform, sample_rate: float = None, sample_max: int = None,
+                 parser: str = None, dead_letter: bool = False, data_detectors: List[str] = None,
+                 widening: str = WIDENING_STRICT, keyed: bool = False):
+        super().__init__()
+        self.read_input = read_input
+        self.sample_rate = sample_rate
+        self.sample_max = sample_max
+        self.parser = parser
+        self.dead_letter = dead_letter
+        self.data_detectors = data_detectors
+        self.widening = widening
+        self.keyed = keyed
+
+    def expand(self, pbegin):
+        parsed_data = (pbegin
+                 | "Read JSONLine Messages" >> self.read_input
+                 | "Parse json" >> beam.ParDo(ParseJsonFn(self.sample_rate, self.sample_max, parser=self.parser,
+                                                          dead_letter=self.dead_letter,
+                                                          data_detectors=self.data_detectors, widening=self.widening,
+                                                          keyed=self.keyed))
+                                       .with_outputs(ParseJsonFn.SCHEMA_SAMPLE_TAG, DEAD_LETTER_TAG, main='documents')
+                 )
+        schema_input = parsed_data.documents
+        if self.sample_rate is not None or self.sample_max is not None:
+            schema_input = parsed_data[ParseJsonFn.SCHEMA_SAMPLE_TAG]
+        if self.sample_max is not None:
+            schema_input = (schema_input | "Limit sample per file" >> LimitSamplePerFile(self.sample_max, self.keyed))
+        return parsed_data.documents, schema_input, parsed_data[DEAD_LETTER_TAG]
+
+
+class InferSchemas(beam.PTransform):
+    """
+    Infers a schema from json documents, or a schema per key from (key, document) pairs.
+
+    With a seed (a schema, or (key, schema) pairs if keyed), only the documents that don't fit it
+    are extracted, and their schemas are merged into it.
+    The same is used to extend a schema that was inferred from a sample with all documents.
+
+    Outputs the schemas (with their field statistics, if collected) and the dead letters of the extraction.
+
+    :param seed: the seed schemas, None to extract all documents
+    :param keyed: the documents are keyed, a schema is inferred per key
+    :param collect_stats: collect field statistics (see `CombineSchemas`)
+    :param fanout: number of intermediate partial combines (see `CombineSchemas`)
+    :param with_source: the documents are (source, document) pairs, or (key, (source, document)) pairs if keyed,
+                        the source is recorded in the dead letters
+    """
+
+    def __init__(self, seed: beam.PCollection = None, keyed: bool = False, collect_stats: bool = False,
+                 data_detectors: List[str] = None, dead_letter: bool = False, widening: str = WIDENING_STRICT,
+                 fanout: int = None, with_source: bool = False):
+        super().__init__()
+        self.seed = seed
+        self.keyed = keyed
+        self.collect_stats = collect_stats
+        self.data_detectors = data_detectors
+        self.dead_letter = dead_letter
+        self.widening = widening
+        self.fanout = fanout
+        self.with_source = with_source
+
+    def expand(self, documents):
+        options = dict(data_detectors=self.data_detectors, collect_stats=self.collect_stats,
+                       dead_letter=self.dead_letter, widening=self.widening, with_source=self.with_source)
+        if self.seed is None:
+            extract_fn = ExtractKeyedSchemaFn(**options) if self.keyed else ExtractSchemaFn(**options)
+            side_inputs = []
+        elif self.keyed:
+            extract_fn = ExtractUnmatchedKeyedSchemaFn(**options)
+            side_inputs = [beam.pvalue.AsDict(self.seed)]
+        else:
+            extract_fn = ExtractUnmatchedSchemaFn(**options)
+            side_inputs = [beam.pvalue.AsSingleton(self.seed)]
+
+        extracted_schemas = (documents
+                 | "Extract schemas" >> beam.ParDo(extract_fn, *side_inputs)
+                                            .with_outputs(DEAD_LETTER_TAG, main='schemas')
+                 )
+        schemas = extracted_schemas.schemas
+        if self.seed is not None:
+            # The seed is also the side input of the extraction, flattening it with the fused extraction output
+            # stalls the DirectRunner. Breaking the fusion only shuffles the extracted schemas, which are few.
+            schemas = (schemas | "Break fusion" >> beam.Reshuffle())
+            schemas = ((self.seed, schemas) | "Add seed schemas" >> beam.Flatten())
+        combined_schemas = (schemas
+                 | "Combine schemas" >> CombineSchemas(self.collect_stats, self.widening, keyed=self.keyed,
+                                                       fanout=self.fanout)
+                 )
+        return combined_schemas, extracted_schemas[DEAD_LETTER_TAG]
+
+
+def write_dead_letters(dead_letters: List[beam.PCollection], dead_letter_output: str):
+    """
+    Writes the records that could not be processed, as JSONL files.
+
+    :param dead_letters: the dead letters of all stages
+    :param dead_letter_output: location (prefix) of the files
+    """
+    return (dead_letters
+            | "Collect dead letters" >> beam.Flatten()
+            | "Serialize dead letters" >> beam.Map(json.dumps)
+            | "Write dead letters" >> beam.io.WriteToText(dead_letter_output, file_name_suffix='.jsonl')
+            )
+
+
+def write_to_bigquery(rows: beam.PCollection, table, schema, schema_side_input, load_format: str,
+                      temp_bq_location: str = None, project: str = None, dataset: str = None):
+    """
+    Loads rows into BigQuery with load jobs, after the tables have been created.
+
+    :param rows: rows, converted to the schema of their table
+    :param table: table name, or a function that determines the table of a row
+    :param schema: function that determines the schema of a table, from the schema side input
+    :param schema_side_input: side input with the final schemas
+    :param load_format: format of the files the rows are loaded from
+    :param temp_bq_location: temp GCS location to be used when loading data in BigQuery
+    :param project: BigQuery project, if the table is a name
+    :param dataset: BigQuery dataset, if the table is a name
+    """
+    # FUTURE Storage Write API, Beam only supports it with a schema that is known when the pipeline is constructed
+    return (rows
+            | "Load data" >> beam.io.WriteToBigQuery(
+                table=table,
+                dataset=dataset,
+                project=project,
+                schema=functools.partial(schema, load_format=load_format),
+                method=beam.io.WriteToBigQuery.Method.FILE_LOADS,
+                temp_file_format=LOAD_FILE_FORMATS[load_format],
+                write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
+                create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
+                schema_side_inputs=(schema_side_input,),  # inject the calculated schemas as a side input
+                custom_gcs_temp_location=temp_bq_location
+            )
+            )
+
+
+def check_options(widening: str, load_format: str, seeding: bool = False, sampling: bool = False, route_field=None,
+                  checkpoint=None, schema_cache=None, field_stats_output=None, output_location=None):
+    """
+    Checks the combination of the options of a batch run, see `run`.
+
+    :raises ValueError: if the options can't be combined
+    """
+    if widening not in WIDENING_MODES:
+        raise ValueError(f'Unknown type widening mode {widening}, choose one of {", ".join(WIDENING_MODES)}')
+    if load_format not in LOAD_FORMATS:
+        raise ValueError(f'Unknown load format {load_format}, choose one of {", ".join(LOAD_FORMATS)}')
+    if load_format == LOAD_FORMAT_AVRO and widening == WIDENING_JSON:
+        raise ValueError('Widening to JSON is not supported in combination with the avro load format')
+    if schema_cache is not None and (seeding or sampling or checkpoint is not None or route_field is not None
+                                     or field_stats_output is not None):
+        raise ValueError('A schema cache is not supported in combination with seed schemas, sampling, checkpoints, '
+                         'a routing field or field statistics')
+    if route_field is not None:
+        if checkpoint is not None:
+            raise ValueError('A checkpoint is not supported in combination with a routing field')
+        if seeding:
+            raise ValueError('Seed schemas are not supported in combination with a routing field')
+        if output_location is not None:
+            raise ValueError('An output location is not supported in combination with a routing field')
+
+
+def read_checkpoint_input(input_pattern: str, checkpoint: str):
+    """
+    Determines the input of an incremental run: only the files that are new since the previous run are read.
+
+    :param input_pattern: the file pattern to read from
+    :param checkpoint: location of the checkpoint
+    :return: the read transform of the new files, the files to record in the next checkpoint (see `checkpoint_files`)
+             and the schema inferred by the previous runs
+    """
+    input_files = list_files(input_pattern)
+    checkpoint_state = load_checkpoint(checkpoint)
+    paths = unprocessed_files(input_files, checkpoint_state)
+    logger.info(f'{len(paths)} of {len(input_files)} files were not processed yet')
+    changed_paths = changed_files(input_files, checkpoint_state)
+    if changed_paths:
+        logger.warning(f'{len(changed_paths)} files changed since they were processed and are skipped, '
+                       f'loading them again would duplicate their rows: {", ".join(changed_paths)}')
+    return ReadTextFilesWithFilename(paths), checkpoint_files(input_files, checkpoint_state), checkpoint_state['schema']
+
+
+def create_schema_cache(location: str, max_age_days: float = None, max_size_mb: float = None,
+                        data_detectors: List[str] = None, widening: str = WIDENING_STRICT) -> FileSchemaCache:
+    """
+    Creates the schema cache of a run and evicts its old entries.
+
+    :return: the schema cache
+    """
+    cache = FileSchemaCache(location,
+                            max_age=None if max_age_days is None else max_age_days * 86400,
+                            max_size=None if max_size_mb is None else max_size_mb * 2 ** 20,
+                            data_detectors=data_detectors, widening=widening)
+    cache.evict()
+    return cache
+
+
+def parse_batch_input(pipeline: beam.Pipeline, read_input: beam.PTransform, sample_rate: float = None,
+                      sample_max: int = None, parser: str = None, dead_letter: bool = False,
+                      data_detectors: List[str] = None, widening: str = WIDENING_STRICT, keyed: bool = False):
+    """
+    Reads and parses the input, see `ParseInput`.
+
+    :param keyed: also output the documents as (filename, document) pairs
+    :return: the documents, the keyed documents (None if not keyed), the documents to infer the schema from
+             (keyed by filename if keyed) and the dead letters
+    """
+    documents, schema_input, dead_letters = (pipeline
+             | "Parse input" >> ParseInput(read_input, sample_rate, sample_max, parser=parser, dead_letter=dead_letter,
+                                           data_detectors=data_detectors, widening=widening, keyed=keyed)
+             )
+    if not keyed:
+        return documents, None, schema_input, dead_letters
+    return (documents | "Drop filenames" >> beam.Map(lambda element: element[1])), documents, schema_input, dead_letters
+
 
-def run(input_pattern, bq_dataset, bq_table, load_data=True, setup_script=None, temp_bq_location=None, pipeline_args=None):
+def infer_batch_schema(pipeline: beam.Pipeline, schema_input: beam.PCollection, input_pattern: str,
+                       cache: FileSchemaCache = None, keyed_documents: beam.PCollection = None,
+                       seed: beam.PCollection = None, parser: str = None, collect_stats: bool = False,
+                       data_detectors: List[str] = None, dead_letter: bool = False, widening: str = WIDENING_STRICT,
+                       fanout: int = None, with_source: bool = False):
+    """
+    Infers the schema of a batch run, from all documents or from the sample.
+    With `with_source` enabled, the documents to infer the schema from are keyed by filename.
+
+    With a schema cache, only the documents of the files of which the schema is not cached are extracted
+    (see `InferCachedFileSchemas`), the files are only read for the schema if the whole input is not read anyway.
+    With a seed, only the documents that don't fit the seed schema are extracted and merged into it.
+
+    :return: the schema (with the field statistics, if collected) and the dead letters
+    """
+    if cache is None:
+        return (schema_input
+             | "Infer schema" >> InferSchemas(seed, collect_stats=collect_stats, data_detectors=data_detectors,
+                                              dead_letter=dead_letter, widening=widening, fanout=fanout,
+                                              with_source=with_source)
+             )
+
+    file_schemas, dead_letters = (pipeline
+             | "Infer file schemas" >> InferCachedFileSchemas(input_pattern, cache, parser=parser, dead_letter=dead_letter,
+                                                              documents=keyed_documents)
+             )
+    schema = (file_schemas | "Combine into 1 schema" >> CombineSchemas(widening=widening, fanout=fanout))
+    return schema, dead_letters
+
+
+def seed_schema_input(pipeline: beam.Pipeline, seed_value: List[object], seed_from_table: bool = False,
+                      project: str = None, dataset: str = None, table: str = None) -> beam.PCollection:
+    """
+    Creates the seed schema, from a schema and/or the schema of the existing table.
+
+    :return: the seed schema
+    """
+    seed = (pipeline | "Seed schema" >> beam.Create([seed_value]))
+    if seed_from_table:
+        seed = (seed
+                | "Add existing table schema" >> beam.Map(add_bq_table_schema, project=project, dataset=dataset,
+                                                          table=table)
+                )
+    return seed
+
+
+def split_field_stats(schemas: beam.PCollection, field_stats_output: str = None, keyed: bool = False):
+    """
+    Writes the field statistics that are combined together with the schemas, to a single report.
+
+    :param schemas: (schema, statistics) pairs, or (key, (schema, statistics)) pairs if keyed
+    :param field_stats_output: location of the report, None if no statistics are collected
+    :param keyed: the schemas are keyed, e.g. by table
+    :return: the schemas, without the statistics
+    """
+    if field_stats_output is None:
+        return schemas
+    if not keyed:
+        stats_output = (schemas
+                 | "Get field statistics" >> beam.Map(lambda output: output[1])
+                 | "Write field statistics" >> beam.Map(write_json, path=field_stats_output)
+                 )
+        return (schemas | "Get schema" >> beam.Map(lambda output: output[0]))
+
+    stats_output = (schemas
+             | "Get field statistics" >> beam.Map(lambda element: (element[0], element[1][1]))
+             | "Collect field statistics" >> beam.combiners.ToDict()
+             | "Write field statistics" >> beam.Map(write_json, path=field_stats_output)
+             )
+    return (schemas | "Get schemas" >> beam.Map(lambda element: (element[0], element[1][0])))
+
+
+def complete_sampled_schemas(schemas: beam.PCollection, documents: beam.PCollection, schema_validation: bool = False,
+                             keyed: bool = False, data_detectors: List[str] = None, dead_letter: bool = False,
+                             widening: str = WIDENING_STRICT, fanout: int = None, with_source: bool = False):
+    """
+    Completes the schemas that were inferred from a sample.
+    With validation, they are extended with the documents that don't fit them.
+    Otherwise, all their fields are relaxed to NULLABLE, as fields that are in every sampled document
+    can be missing in the others.
+
+    :param schemas: the sampled schemas, or (key, schema) pairs if keyed
+    :param documents: all documents, or (key, document) pairs if keyed (only used for validation)
+    :param schema_validation: check all documents against the sampled schemas
+    :param with_source: the documents carry their source, see `InferSchemas`
+    :return: the schemas and the list of dead letters
+    """
+    if schema_validation:
+        schemas, dead_letters = (documents
+                 | "Validate sampled schemas" >> InferSchemas(schemas, keyed=keyed, data_detectors=data_detectors,
+                                                              dead_letter=dead_letter, widening=widening, fanout=fanout,
+                                                              with_source=with_source)
+                 )
+        return schemas, [dead_letters]
+
+    relax = (lambda element: (element[0], relax_schema(element[1]))) if keyed else relax_schema
+    return (schemas | "Relax sampled schemas" >> beam.Map(relax)), []
+
+
+def write_output_location(schema: beam.PCollection, documents: beam.PCollection, output_location: str,
+                          dead_letter: bool = False) -> beam.PCollection:
+    """
+    Writes the final schema (schema.json) and the data as Parquet files (see `WriteParquetFiles`) to a location.
+
+    :return: the dead letters of the Parquet files
+    """
+    schema_output = (schema
+              | "Write schema" >> beam.Map(write_json, path=FileSystems.join(output_location, 'schema.json'))
+              )
+    parquet_files, dead_letters = (documents
+              | "Write Parquet files" >> WriteParquetFiles(FileSystems.join(output_location, 'data'),
+                                                           beam.pvalue.AsSingleton(schema), dead_letter=dead_letter)
+              )
+    return dead_letters
+
+
+def run(input_pattern, bq_dataset, bq_table, load_data=True, setup_script=None, temp_bq_location=None, pipeline_args=None,
+        data_detectors=None, schema_sample_rate=None, schema_sample_max=None, schema_validation=False, route_field=None,
+        seed_schema=None, seed_from_table=False, json_parser=None, field_stats_output=None, dead_letter_output=None,
+        type_widening=None, combine_fanout=None, load_format=None, output_location=None, checkpoint=None,
+        schema_cache=None, schema_cache_max_age_days=None, schema_cache_max_size_mb=None):
     """
     Executes a JSON to BigQuery schema detection and optional data load.
 
@@ -22,6 +415,29 @@ def run(input_pattern, bq_dataset, bq_table, load_data=True, setup_script=None,
 
     As a final optional step, the source data is loaded in the BigQuery table.
 
+    When a routing field is given, the documents are partitioned by its value,
+    and a schema is inferred and a table is created or updated per value (see `route_table`).
+    The input is still read only once.
+
+    A seed schema (from a file and/or the existing table) can be provided to short-circuit inference:
+    documents that fit the seed schema are skipped, only the remaining ones are extracted and merged into it.
+
+    By default, incompatible types (e.g. an INTEGER field that holds a string) make the job fail.
+    With a widening mode, they are widened to STRING or JSON instead (see `determine_common_type`).
+    Before loading, documents are converted to the final schema (see `compile_converter`),
+    e.g. values are cast to widened types and fields that are not in the schema are dropped.
+    The data is loaded with load jobs, from JSON or Avro files (written with the final schema).
+
+    Optionally, the final schema and the data (as Parquet files) are written to an output location,
+    so the data can be used without parsing the JSON documents again.
+
+    With a checkpoint, runs are incremental: only the files that were not processed by a previous run are read
+    (and loaded), and their schemas are merged into the schema inferred by the previous runs (see `load_checkpoint`).
+    The checkpoint is only updated once the run succeeded.
+
+    With a schema cache, the schema of every input file is cached (see `FileSchemaCache`),
+    so files that didn't change since a previous run are not read (and extracted) again for the schema.
+
     :param input_pattern: the file pattern to read from
     :param bq_dataset: BigQuery dataset
     :param bq_table: BigQuery table
@@ -29,53 +445,363 @@ def run(input_pattern, bq_dataset, bq_table, load_data=True, setup_script=None,
     :param temp_bq_location: temp GCS location to be used when loading data in BigQuery
     :param setup_script: setup script
     :param pipeline_args: general pipeline arguments
+    :param data_detectors: BigQuery types to detect in string values, defaults to TIMESTAMP only
+    :param schema_sample_rate: fraction of the documents to infer the schema from (deterministic sample)
+    :param schema_sample_max: maximal number of documents per file to infer the schema from
+    :param schema_validation: check all documents against the sampled schema and extend it where needed
+    :param route_field: dot separated path of the field to route documents to different tables by, e.g. event.type
+    :param seed_schema: location of a JSON schema file to start inference from
+    :param seed_from_table: start inference from the schema of the existing table
+    :param json_parser: JSON parser backend (json, orjson or simdjson), the fastest installed one is used if omitted
+    :param field_stats_output: location to write a JSON report with field statistics to (see `FieldStats`),
+                               collected from the documents the schema is inferred from
+    :param dead_letter_output: location (prefix) to write the records that can't be parsed or of which no schema
+                               can be extracted to, as JSONL, with the file they were read from.
+                               In strict mode, the records with a primitive value in a field that is a RECORD
+                               in other records are dead letters as well (see `dead_letter_widening`).
+                               If omitted, such records make the job fail.
+    :param type_widening: widening mode for incompatible types: strict (default), string or json
+    :param combine_fanout: number of intermediate partial combines between the per-bundle and the final schema merge,
+                           spreads the merge work when many workers produce partial schemas (see `CombineSchemas`)
+    :param load_format: format of the files the data is loaded from: json (default) or avro.
+                        Avro files are smaller and faster to load, but can't hold JSON columns.
+    :param output_location: location (local or gs://...) to write the final schema (schema.json)
+                            and the data as Parquet files (data-<uuid>.parquet) to
+    :param checkpoint: location (local or gs://...) of the checkpoint manifest that keeps track of the processed
+                       files and the schema inferred from them, to only process new files
+    :param schema_cache: location (local or gs://...) of the cache of the schemas per input file
+    :param schema_cache_max_age_days: maximal age of the cached schemas, older ones are evicted before the run
+    :param schema_cache_max_size_mb: maximal size of the schema cache, the oldest schemas are evicted before the run
     """
 
-    # `save_main_session` is set to true because some DoFn's rely on
-    # globally imported modules.
-    pipeline_options = PipelineOptions(
-        pipeline_args,
-        save_main_session=True,
-    )
+    widening = type_widening or WIDENING_STRICT
+    load_format = load_format or LOAD_FORMAT_JSON
+    seeding = seed_schema is not None or seed_from_table
+    sampling = schema_sample_rate is not None or schema_sample_max is not None
+    # Without validation, the schema is only inferred from the sample
+    sampled_schema = sampling and not schema_validation
+    check_options(widening, load_format, seeding=seeding, sampling=sampling, route_field=route_field,
+                  checkpoint=checkpoint, schema_cache=schema_cache, field_stats_output=field_stats_output,
+                  output_location=output_location)
+    if route_field is not None:
+        return run_routed(input_pattern, bq_dataset, bq_table, route_field, load_data=load_data, setup_script=setup_script,
+                          temp_bq_location=temp_bq_location, pipeline_args=pipeline_args, data_detectors=data_detectors,
+                          schema_sample_rate=schema_sample_rate, schema_sample_max=schema_sample_max,
+                          schema_validation=schema_validation, json_parser=json_parser,
+                          field_stats_output=field_stats_output, dead_letter_output=dead_letter_output,
+                          type_widening=widening, combine_fanout=combine_fanout, load_format=load_format)
 
+    pipeline_options = create_pipeline_options(pipeline_args, setup_script)
     project_id = pipeline_options.view_as(GoogleCloudOptions).project
 
-    # Set setup script so we include the right modules
-    if setup_script:
-        pipeline_options.view_as(SetupOptions).setup_file = setup_script
+    # With dead letters, the documents keep their file, and conflicts of records with primitive types don't fail the job
+    dead_lettering = dead_letter_output is not None
+    widening = dead_letter_widening(widening) if dead_lettering else widening
+
+    seed_value = load_schema(seed_schema) if seed_schema is not None else None
+    read_input = read_text_with_filename(input_pattern)
+    if checkpoint is not None:
+        # Only read the files that are new since the previous run, the previous schema is the seed
+        read_input, input_files, checkpoint_schema = read_checkpoint_input(input_pattern, checkpoint)
+        seed_value = merge_schema_list([seed_value, checkpoint_schema], widening)
+        seeding = seeding or seed_value is not None
+    cache = None if schema_cache is None else \
+        create_schema_cache(schema_cache, schema_cache_max_age_days, schema_cache_max_size_mb, data_detectors, widening)
 
     with beam.Pipeline(options=pipeline_options) as pipeline:
 
-        # Read input
-        input_data = (pipeline
-                 | "Read JSONLine Messages" >> ReadFromText(input_pattern)
-                 )
+        # Read input and decode every line once,
+        # the parsed documents are shared by the schema and load branches.
+        # With a schema cache, the whole input is only read if the documents are needed,
+        # they are keyed by filename so the schemas of the files that are not cached can be extracted from them.
+        # With dead letters, the documents are keyed by filename as well, so every dead letter records its source.
+        dead_letters = []
+        input_data = keyed_input_data = schema_input = None
+        if cache is None or load_data or output_location is not None:
+            input_data, keyed_input_data, schema_input, parse_dead_letters = parse_batch_input(
+                pipeline, read_input, schema_sample_rate, schema_sample_max, parser=json_parser,
+                dead_letter=dead_lettering, data_detectors=data_detectors, widening=widening,
+                keyed=cache is not None or dead_lettering)
+            dead_letters.append(parse_dead_letters)
+        load_input = keyed_input_data if dead_lettering else input_data
+
+        # Infer the schema, from all documents or from the sample
+        seed = seed_schema_input(pipeline, seed_value, seed_from_table, project=project_id, dataset=bq_dataset,
+                                 table=bq_table) if seeding else None
+        inferred_schema, extract_dead_letters = infer_batch_schema(
+            pipeline, schema_input, input_pattern, cache, keyed_input_data, seed, parser=json_parser,
+            collect_stats=field_stats_output is not None, data_detectors=data_detectors, dead_letter=dead_lettering,
+            widening=widening, fanout=combine_fanout, with_source=dead_lettering)
+        dead_letters.append(extract_dead_letters)
+
+        # Branch to write the field statistics, which are combined together with the schema
+        inferred_schema = split_field_stats(inferred_schema, field_stats_output)
+
+        # Extend the sampled schema with the documents that don't fit it, or relax it
+        if sampling:
+            inferred_schema, sample_dead_letters = complete_sampled_schemas(
+                inferred_schema, load_input, schema_validation, data_detectors=data_detectors,
+                dead_letter=dead_lettering, widening=widening, fanout=combine_fanout, with_source=dead_lettering)
+            dead_letters.extend(sample_dead_letters)
+
+        # Branch to write the checkpoint for the next run, committed after the pipeline has finished
+        if checkpoint is not None:
+            checkpoint_output = (inferred_schema
+                     | "Write checkpoint" >> beam.Map(write_checkpoint, path=checkpoint, files=input_files)
+                     )
 
         # Create/update BQ table schema
-        bq_schema = (input_data
-                     | "Extract Schemas" >> beam.Map(map_extract_schema)
-                     | "Combine into 1 schema" >> beam.CombineGlobally(SchemaCombinerFn())
-                     | "Create or update table" >> beam.Map(create_bq_table, project=project_id, dataset=bq_dataset, table=bq_table)
+        bq_schema = (inferred_schema
+                     | "Create or update table" >> beam.Map(create_bq_table, project=project_id, dataset=bq_dataset,
+                                                            table=bq_table)
                      )
 
         # Branch to print the schema
         print_output = (bq_schema | "Print resulting schema" >> beam.Map(print_schema))
 
-        # FUTURE write to bucket
-        # bucket_output = ...
+        # Branch to write the schema and the data as Parquet files, e.g. to a bucket
+        if output_location is not None:
+            dead_letters.append(write_output_location(bq_schema, input_data, output_location, dead_lettering))
 
         # Branch to write the data to BigQuery, after the table has been created
         if load_data:
-            bq_insert_result = (input_data
-                      | "Parse json" >> beam.Map(json.loads)
-                      | "Load data" >> beam.io.WriteToBigQuery(
-                            table=bq_table,
-                            dataset=bq_dataset,
-                            project=project_id,
-                            schema=prep_schema,
-                            write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
-                            create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
-                            schema_side_inputs=(beam.pvalue.AsSingleton(bq_schema),),  # inject the calculated schema as a side input
-                            custom_gcs_temp_location=temp_bq_location
-                        )
+            cast_rows = (load_input
+                      # Normalize the rows, so BigQuery doesn't reject them (e.g. null-only fields, widened types)
+                      # Fields that are not in a sampled schema are dropped, report them
+                      | "Cast to schema" >> beam.ParDo(CastToSchemaFn(load_format, report_dropped=sampled_schema,
+                                                                      dead_letter=dead_lettering,
+                                                                      with_source=dead_lettering),
+                                                       beam.pvalue.AsSingleton(bq_schema))
+                                                .with_outputs(DEAD_LETTER_TAG, main='rows')
                       )
+            dead_letters.append(cast_rows[DEAD_LETTER_TAG])
+            bq_insert_result = write_to_bigquery(cast_rows.rows, bq_table, prep_schema,
+                                                 beam.pvalue.AsSingleton(bq_schema), load_format, temp_bq_location,
+                                                 project=project_id, dataset=bq_dataset)
+
+        # Branch to write the records that could not be processed
+        if dead_lettering:
+            dead_letter_result = write_dead_letters(dead_letters, dead_letter_output)
+
+    # The pipeline has finished, so the next run can start from this one
+    if checkpoint is not None:
+        commit_checkpoint(checkpoint)
+
+
+def run_routed(input_pattern, bq_dataset, bq_table, route_field, load_data=True, setup_script=None, temp_bq_location=None,
+               pipeline_args=None, data_detectors=None, schema_sample_rate=None, schema_sample_max=None,
+               schema_validation=False, json_parser=None, field_stats_output=None, dead_letter_output=None,
+               type_widening=None, combine_fanout=None, load_format=None):
+    """
+    Executes a JSON to BigQuery schema detection and optional data load into multiple tables.
+
+    Documents are routed to a table based on the value of a routing field (see `route_table`).
+    Schemas are inferred and combined per table, after which every table is created or updated.
+    The data is loaded with dynamic destinations, so a single read of the input feeds all tables.
+
+    :param input_pattern: the file pattern to read from
+    :param bq_dataset: BigQuery dataset
+    :param bq_table: base name of the BigQuery tables
+    :param route_field: dot separated path of the routing field, e.g. event.type
+    :param load_data: load data into tables
+    :param temp_bq_location: temp GCS location to be used when loading data in BigQuery
+    :param setup_script: setup script
+    :param pipeline_args: general pipeline arguments
+    :param data_detectors: BigQuery types to detect in string values, defaults to TIMESTAMP only
+    :param schema_sample_rate: fraction of the documents to infer the schemas from (deterministic sample)
+    :param schema_sample_max: maximal number of documents per file to infer the schemas from
+    :param schema_validation: check all documents against the sampled schemas and extend them where needed
+    :param json_parser: JSON parser backend (json, orjson or simdjson), the fastest installed one is used if omitted
+    :param field_stats_output: location to write a JSON report with field statistics per table to
+    :param dead_letter_output: location (prefix) to write the records that can't be processed to, as JSONL
+    :param type_widening: widening mode for incompatible types: strict (default), string or json
+    :param combine_fanout: number of intermediate partial combines per table (hot key fanout)
+    :param load_format: format of the files the data is loaded from: json (default) or avro
+    """
+
+    widening = type_widening or WIDENING_STRICT
+    load_format = load_format or LOAD_FORMAT_JSON
+
+    pipeline_options = create_pipeline_options(pipeline_args, setup_script)
+    project_id = pipeline_options.view_as(GoogleCloudOptions).project
+    route_path = route_field.split('.')
+
+    # With dead letters, the documents keep their file, and conflicts of records with primitive types don't fail the job
+    dead_lettering = dead_letter_output is not None
+    widening = dead_letter_widening(widening) if dead_lettering else widening
+
+    def route(element):
+        # Documents with their file are routed by the document
+        data = element[1] if dead_lettering else element
+        return route_table(data, route_path, bq_table), element
+
+    with beam.Pipeline(options=pipeline_options) as pipeline:
+
+        # Read input and decode every line once
+        sampling = schema_sample_rate is not None or schema_sample_max is not None
+        sampled_schema = sampling and not schema_validation
+        input_data, keyed_input_data, schema_input, parse_dead_letters = parse_batch_input(
+            pipeline, read_text_with_filename(input_pattern), schema_sample_rate, schema_sample_max, parser=json_parser,
+            dead_letter=dead_lettering, data_detectors=data_detectors, widening=widening, keyed=dead_lettering)
+        dead_letters = [parse_dead_letters]
+        load_input = keyed_input_data if dead_lettering else input_data
+
+        # Infer the schema of every table
+        inferred_schemas, extract_dead_letters = (schema_input
+                     | "Route documents" >> beam.Map(route)
+                     | "Infer schemas" >> InferSchemas(keyed=True, collect_stats=field_stats_output is not None,
+                                                       data_detectors=data_detectors, dead_letter=dead_lettering,
+                                                       widening=widening, fanout=combine_fanout,
+                                                       with_source=dead_lettering)
+                     )
+        dead_letters.append(extract_dead_letters)
+
+        # Branch to write the field statistics of all tables into a single report
+        inferred_schemas = split_field_stats(inferred_schemas, field_stats_output, keyed=True)
+
+        # Extend the sampled schemas with the documents that don't fit them, or relax them
+        if sampling:
+            routed_data = (load_input | "Route all documents" >> beam.Map(route)) if schema_validation else None
+            inferred_schemas, sample_dead_letters = complete_sampled_schemas(
+                inferred_schemas, routed_data, schema_validation, keyed=True, data_detectors=data_detectors,
+                dead_letter=dead_lettering, widening=widening, fanout=combine_fanout, with_source=dead_lettering)
+            dead_letters.extend(sample_dead_letters)
+
+        # Create/update BQ table schemas
+        bq_schemas = (inferred_schemas
+                     | "Create or update tables" >> beam.Map(create_keyed_bq_table, project=project_id, dataset=bq_dataset)
+                     )
+
+        # Branch to print the schemas
+        print_output = (bq_schemas | "Print resulting schemas" >> beam.Map(print_keyed_schema))
+
+        # Branch to write the data to BigQuery, after the tables have been created
+        if load_data:
+            cast_rows = (load_input
+                      # Normalize the rows, so BigQuery doesn't reject them (e.g. null-only fields, widened types)
+                      # Fields that are not in the sampled schemas are dropped, report them
+                      | "Cast to schemas" >> beam.ParDo(CastToRoutedSchemaFn(route_path, bq_table, load_format,
+                                                                             report_dropped=sampled_schema,
+                                                                             dead_letter=dead_lettering,
+                                                                             with_source=dead_lettering),
+                                                        beam.pvalue.AsDict(bq_schemas))
+                                                 .with_outputs(DEAD_LETTER_TAG, main='rows')
+                      )
+            dead_letters.append(cast_rows[DEAD_LETTER_TAG])
+            table = functools.partial(route_table_spec, route_path=route_path, project=project_id, dataset=bq_dataset,
+                                      table=bq_table)
+            bq_insert_result = write_to_bigquery(cast_rows.rows, table, prep_routed_schema,
+                                                 beam.pvalue.AsDict(bq_schemas), load_format, temp_bq_location)
+
+        # Branch to write the records that could not be processed
+        if dead_lettering:
+            dead_letter_result = write_dead_letters(dead_letters, dead_letter_output)
+
+
+def run_streaming(bq_dataset, bq_table, input_subscription=None, input_topic=None, schema_update_window=60,
+                  setup_script=None, pipeline_args=None, data_detectors=None, json_parser=None, dead_letter_output=None):
+    """
+    Executes a streaming JSON to BigQuery schema detection and data load.
+
+    JSON documents are read from Pub/Sub, one document per message.
+    A running schema is kept and merged with the schemas of new documents per window,
+    the table is only created or updated when the running schema changes.
+    Documents are converted to the running schema (see `CastToRunningSchemaFn`) and inserted as they arrive.
+    Documents that don't fit the running schema yet are held for two schema update windows (see `HoldPendingRows`),
+    so their table update is done before they are inserted.
+    Inserts are retried on transient errors, rows that BigQuery rejects are dead letters,
+    so a dead-letter output is required.
+
+    :param bq_dataset: BigQuery dataset
+    :param bq_table: BigQuery table
+    :param input_subscription: Pub/Sub subscription to read from (projects/<project>/subscriptions/<subscription>)
+    :param input_topic: Pub/Sub topic to read from, if no subscription is given
+    :param schema_update_window: window (in seconds) in which schema changes are grouped into a single table update
+    :param setup_script: setup script
+    :param pipeline_args: general pipeline arguments
+    :param data_detectors: BigQuery types to detect in string values, defaults to TIMESTAMP only
+    :param json_parser: JSON parser backend (json, orjson or simdjson), the fastest installed one is used if omitted
+    :param dead_letter_output: location (prefix) to write the messages that can't be processed
+                               and the rejected rows to, as JSONL files per window
+    """
+
+    if dead_letter_output is None:
+        raise ValueError('A dead-letter output is required in streaming mode, rows that BigQuery rejects are written to it')
+
+    pipeline_options = create_pipeline_options(pipeline_args, setup_script, streaming=True)
+    project_id = pipeline_options.view_as(GoogleCloudOptions).project
+    source = input_subscription or input_topic
+
+    with beam.Pipeline(options=pipeline_options) as pipeline:
+
+        # Read input and decode every message once
+        parsed_data = (pipeline
+                 | "Read Pub/Sub Messages" >> beam.io.ReadFromPubSub(topic=input_topic, subscription=input_subscription)
+                 | "Decode messages" >> beam.Map(lambda message: (source, message.decode('utf-8')))
+                 | "Parse json" >> beam.ParDo(ParseJsonFn(parser=json_parser, dead_letter=True,
+                                                          data_detectors=data_detectors))
+                                       .with_outputs(DEAD_LETTER_TAG, main='documents')
+                 )
+        input_data = parsed_data.documents
+
+        # Keep the BQ table schema up to date
+        bq_schema = (input_data
+                     | "Extract Schemas" >> beam.ParDo(ExtractSchemaFn(data_detectors=data_detectors))
+                     | "Evolve schema" >> EvolveSchema(
+                            functools.partial(create_bq_table, project=project_id, dataset=bq_dataset, table=bq_table),
+                            window_size=schema_update_window
+                        )
+                     )
+
+        # Branch to print the schema updates
+        print_output = (bq_schema | "Print resulting schema" >> beam.Map(print_schema))
+
+        # The running schema is a side input that is updated with every schema change,
+        # a pane can hold several updates, of which the latest one is the running schema
+        running_schema = (bq_schema
+                     | "Trigger on schema updates" >> beam.WindowInto(
+                            window.GlobalWindows(), trigger=trigger.Repeatedly(trigger.AfterCount(1)),
+                            accumulation_mode=trigger.AccumulationMode.DISCARDING)
+                     | "Add update times" >> beam.Map(lambda schema, timestamp=beam.DoFn.TimestampParam: (schema, timestamp))
+                     | "Latest schema" >> beam.CombineGlobally(beam.combiners.LatestCombineFn()).without_defaults()
+                     )
+        running_schema_input = beam.pvalue.AsSingleton(running_schema, default_value=None)
+
+        # Normalize the rows, so BigQuery doesn't reject them (e.g. timestamp formats)
+        cast_data = (input_data
+                  | "Cast to schema" >> beam.ParDo(CastToRunningSchemaFn(data_detectors, hold_pending=True),
+                                                   running_schema_input)
+                                            .with_outputs(CastToRunningSchemaFn.PENDING_TAG, main='rows')
+                  )
+
+        # Rows with new fields are held until their table update is done, BigQuery would reject them before
+        held_rows = (cast_data[CastToRunningSchemaFn.PENDING_TAG]
+                  | "Hold pending rows" >> HoldPendingRows(running_schema_input, 2 * schema_update_window, data_detectors)
+                  )
+
+        # Branch to write the data to BigQuery as it arrives
+        bq_insert_result = ((cast_data.rows, held_rows)
+                  | "Collect rows" >> beam.Flatten()
+                  | "Load data" >> beam.io.WriteToBigQuery(
+                        table=bq_table,
+                        dataset=bq_dataset,
+                        project=project_id,
+                        method=beam.io.WriteToBigQuery.Method.STREAMING_INSERTS,
+                        write_disposition=beam.io.BigQueryDisposition.WRITE_APPEND,
+                        create_disposition=beam.io.BigQueryDisposition.CREATE_NEVER,
+                        insert_retry_strategy=RetryStrategy.RETRY_ON_TRANSIENT_ERROR,
+                    )
+                  )
+
+        # Branch to write the messages that could not be processed and the rejected rows, per window
+        failed_rows = (bq_insert_result[BigQueryWriteFn.FAILED_ROWS]
+                  | "Wrap failed rows" >> beam.Map(failed_row_dead_letter, source=source)
+                  )
+        dead_letter_path, dead_letter_prefix = FileSystems.split(dead_letter_output)
+        dead_letter_result = ((parsed_data[DEAD_LETTER_TAG], failed_rows)
+                  | "Collect dead letters" >> beam.Flatten()
+                  | "Window dead letters" >> beam.WindowInto(window.FixedWindows(schema_update_window))
+                  | "Serialize dead letters" >> beam.Map(json.dumps)
+                  | "Write dead letters" >> fileio.WriteToFiles(
+                        dead_letter_path, file_naming=fileio.default_file_naming(dead_letter_prefix, '.jsonl'))
+                  )
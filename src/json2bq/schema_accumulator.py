@@ -1,6 +1,12 @@
+import time
+
 import apache_beam as beam
+from apache_beam.metrics import Metrics
+from apache_beam.transforms.window import GlobalWindows
 
-from schematools.schema_merge import merge_schemas
+from schematools.field_stats import FieldStats
+from schematools.schema_merge import WIDENING_STRICT
+from schematools.schema_tree import SchemaNode
 
 
 class SchemaCombinerFn(beam.CombineFn):
@@ -8,18 +14,146 @@ class SchemaCombinerFn(beam.CombineFn):
     Schema combiner.
     Merges an undefined number of schemas into a
     relaxed version, provided that they are compatible.
+
+    The accumulator is a SchemaNode tree that is merged in place,
+    it is only converted to a BigQuery schema when extracting the output.
+    Inputs can also be SchemaNode trees, i.e. accumulators that were pre-aggregated (see `PreAggregateSchemasFn`).
+
+    When statistics are collected, the inputs can also be FieldStats (as emitted by the extraction DoFns),
+    the accumulator is then a (SchemaNode, FieldStats) pair
+    and the output a (schema, statistics report) pair.
+
+    Incompatible types are widened according to the widening mode, see `determine_common_type`.
+    The number of accumulators per merge, the merge time and the size (in nodes) of the merged accumulators
+    are reported as distribution metrics, to tune the fanout and the pre-aggregation.
     """
+
+    def __init__(self, collect_stats: bool = False, widening: str = WIDENING_STRICT):
+        self.collect_stats = collect_stats
+        self.widening = widening
+        self.accumulators_per_merge = Metrics.distribution(self.__class__, 'accumulators_per_merge')
+        self.merge_time = Metrics.distribution(self.__class__, 'merge_time_usec')
+        self.merged_size = Metrics.distribution(self.__class__, 'merged_accumulator_size')
+
     def create_accumulator(self):
-        return None
+        if self.collect_stats:
+            return SchemaNode(), FieldStats()
+        return SchemaNode()
 
     def add_input(self, accumulator, input):
-        return merge_schemas(accumulator, input)
+        if self.collect_stats:
+            node, stats = accumulator
+            if isinstance(input, FieldStats):
+                stats.merge(input)
+            else:
+                self.add_schema(node, input)
+        else:
+            self.add_schema(accumulator, input)
+        return accumulator
+
+    def add_schema(self, node: SchemaNode, input):
+        if isinstance(input, SchemaNode):
+            node.merge_node(input, self.widening)
+        elif input is not None:
+            node.merge_schema(input, widening=self.widening)
 
     def merge_accumulators(self, accumulators):
-        merged = None
+        start = time.perf_counter()
+        accumulators = iter(accumulators)
+        merged = next(accumulators, None) or self.create_accumulator()
+        count = 1
         for accum in accumulators:
-            merged = merge_schemas(merged, accum)
+            count += 1
+            if self.collect_stats:
+                merged[0].merge_node(accum[0], self.widening)
+                merged[1].merge(accum[1])
+            else:
+                merged.merge_node(accum, self.widening)
+
+        self.accumulators_per_merge.update(count)
+        self.merge_time.update(int((time.perf_counter() - start) * 1e6))
+        self.merged_size.update((merged[0] if self.collect_stats else merged).size())
         return merged
 
     def extract_output(self, accumulator):
-        return accumulator
+        if self.collect_stats:
+            node, stats = accumulator
+            return self.extract_schema(node), stats.to_report()
+        return self.extract_schema(accumulator)
+
+    @staticmethod
+    def extract_schema(node: SchemaNode):
+        if node.count == 0:
+            return None
+        return node.to_schema()
+
+
+class PreAggregateSchemasFn(beam.DoFn):
+    """
+    Merges all schemas (or (key, schema) pairs) of a bundle into a local accumulator per key,
+    which are emitted at the end of the bundle as SchemaNode trees (and FieldStats, if statistics are collected).
+
+    This is what combiner lifting does implicitly, done explicitly so the number and size
+    of the partial accumulators that reach the global combine can be measured.
+    Only supports the global window, i.e. batch pipelines.
+    """
+
+    def __init__(self, combiner: SchemaCombinerFn, keyed: bool = False):
+        self.combiner = combiner
+        self.keyed = keyed
+        self.accumulators = None
+        self.inputs_per_accumulator = Metrics.distribution(self.__class__, 'inputs_per_accumulator')
+        self.accumulator_size = Metrics.distribution(self.__class__, 'accumulator_size')
+
+    def start_bundle(self):
+        self.accumulators = {}
+
+    def process(self, element):
+        key, input = element if self.keyed else (None, element)
+        entry = self.accumulators.get(key)
+        if entry is None:
+            entry = self.accumulators[key] = [self.combiner.create_accumulator(), 0]
+        self.combiner.add_input(entry[0], input)
+        entry[1] += 1
+
+    def finish_bundle(self):
+        for key, (accumulator, input_count) in self.accumulators.items():
+            self.inputs_per_accumulator.update(input_count)
+            partials = accumulator if self.combiner.collect_stats else (accumulator,)
+            self.accumulator_size.update(partials[0].size())
+            # Elements emitted outside of `process` need an explicit window
+            for partial in partials:
+                yield GlobalWindows.windowed_value((key, partial) if self.keyed else partial)
+        self.accumulators = None
+
+
+class CombineSchemas(beam.PTransform):
+    """
+    Combines schemas into a single one (or one per key) in two levels:
+    first per bundle (see `PreAggregateSchemasFn`), then globally with the SchemaCombinerFn.
+
+    With a fanout, the global combine gets an intermediate level of that many partial combines,
+    which spreads the merge work of many workers over multiple workers.
+    """
+
+    def __init__(self, collect_stats: bool = False, widening: str = WIDENING_STRICT, keyed: bool = False,
+                 fanout: int = None):
+        super().__init__()
+        self.combiner = SchemaCombinerFn(collect_stats, widening)
+        self.keyed = keyed
+        self.fanout = fanout
+
+    def expand(self, schemas):
+        if self.keyed:
+            combine = beam.CombinePerKey(self.combiner)
+            if self.fanout:
+                combine = combine.with_hot_key_fanout(self.fanout)
+        else:
+            combine = beam.CombineGlobally(self.combiner)
+            if self.fanout:
+                combine = combine.with_fanout(self.fanout)
+
+        return (schemas
+                | "Pre-aggregate per bundle" >> beam.ParDo(PreAggregateSchemasFn(self.combiner, self.keyed))
+                | "Combine partial schemas" >> combine
+                )
@@ -0,0 +1,73 @@
+import copy
+import logging
+from typing import Callable, List
+
+import apache_beam as beam
+from apache_beam.coders import PickleCoder
+from apache_beam.metrics import Metrics
+from apache_beam.transforms import window
+from apache_beam.transforms.userstate import ReadModifyWriteStateSpec
+
+from json2bq.schema_accumulator import SchemaCombinerFn
+from schematools.schema_merge import merge_schemas, schemas_equal
+
+logger = logging.getLogger()
+
+
+class SchemaEvolutionFn(beam.DoFn):
+    """
+    Stateful schema tracker for unbounded inputs.
+
+    Keeps the running schema in state and merges every incoming (windowed) schema into it.
+    The update function (e.g. a table update) is only called when the merged schema
+    differs from the running one, the resulting schema is then emitted.
+    Input elements must be keyed, a single key is sufficient as the input is pre-aggregated per window.
+    """
+
+    SCHEMA_STATE = ReadModifyWriteStateSpec('schema', PickleCoder())
+
+    def __init__(self, update_fn: Callable[[List[object]], List[object]]):
+        self.update_fn = update_fn
+        self.schema_updates = Metrics.counter(self.__class__, 'schema_updates')
+        self.schema_unchanged = Metrics.counter(self.__class__, 'schema_unchanged')
+
+    def process(self, element, schema_state=beam.DoFn.StateParam(SCHEMA_STATE)):
+        _, schema = element
+        current_schema = schema_state.read()
+
+        # Merging relaxes fields in place, so keep the state untouched
+        merged_schema = merge_schemas(copy.deepcopy(current_schema), schema)
+        if schemas_equal(merged_schema, current_schema):
+            self.schema_unchanged.inc()
+            return
+
+        logger.info(f'Schema changed, updating with {merged_schema}')
+        final_schema = self.update_fn(merged_schema)
+        schema_state.write(final_schema)
+        self.schema_updates.inc()
+        yield final_schema
+
+
+class EvolveSchema(beam.PTransform):
+    """
+    Merges an unbounded stream of schemas into a running schema.
+
+    Schemas are first combined per fixed window, so a burst of new fields
+    results in a single update rather than one per record.
+    Emits the running schema every time it changes.
+    """
+
+    def __init__(self, update_fn: Callable[[List[object]], List[object]], window_size: float = 60):
+        super().__init__()
+        self.update_fn = update_fn
+        self.window_size = window_size
+
+    def expand(self, schemas):
+        return (schemas
+                | "Window schemas" >> beam.WindowInto(window.FixedWindows(self.window_size))
+                | "Combine window schemas" >> beam.CombineGlobally(SchemaCombinerFn()).without_defaults()
+                # State is kept per key and window, so move to a single global window
+                | "Rewindow schemas" >> beam.WindowInto(window.GlobalWindows())
+                | "Key schemas" >> beam.Map(lambda schema: (None, schema))
+                | "Merge into running schema" >> beam.ParDo(SchemaEvolutionFn(self.update_fn))
+                )
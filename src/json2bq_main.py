@@ -2,6 +2,15 @@ import argparse
 import logging
 
 from json2bq import pipeline
+from schematools.schema_casting import LOAD_FORMATS
+from schematools.schema_merge import WIDENING_MODES
+
+# Options of batch runs, streaming runs don't support them
+BATCH_ONLY_ARGS = [
+    "input_pattern", "bq_temp_location", "schema_sample_rate", "schema_sample_max", "schema_validation", "route_field",
+    "seed_schema", "seed_from_table", "field_stats_output", "type_widening", "combine_fanout", "load_format",
+    "output_location", "checkpoint", "schema_cache", "schema_cache_max_age_days", "schema_cache_max_size_mb",
+]
 
 if __name__ == "__main__":
     logger = logging.getLogger()
@@ -36,14 +45,168 @@ if __name__ == "__main__":
         "--setup_script",
         help="Script that contains all dependencies of the python job."
     )
+    parser.add_argument(
+        "--data_detectors",
+        help="Comma separated BigQuery types to detect in string values "
+             "(TIMESTAMP, DATE, TIME, NUMERIC, GEOGRAPHY, JSON), defaults to TIMESTAMP.",
+        type=lambda types: [field_type.strip().upper() for field_type in types.split(',') if field_type.strip()],
+    )
+    parser.add_argument(
+        "--schema_sample_rate",
+        help="Infer the schema from a deterministic sample of this fraction of the records (0-1).",
+        type=float,
+    )
+    parser.add_argument(
+        "--schema_sample_max",
+        help="Infer the schema from at most this many records per file (the ones with the lowest checksums).",
+        type=int,
+    )
+    parser.add_argument(
+        "--schema_validation",
+        help="Check all records against the sampled schema and extend it with the ones that don't fit. "
+             "Without it, all fields of the sampled schema are nullable and fields that are not in the sample are "
+             "dropped when loading.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--input_subscription",
+        help="Pub/Sub subscription to stream JSON messages from (projects/<project>/subscriptions/<name>), "
+             "runs the pipeline in streaming mode.",
+    )
+    parser.add_argument(
+        "--input_topic",
+        help="Pub/Sub topic to stream JSON messages from, runs the pipeline in streaming mode.",
+    )
+    parser.add_argument(
+        "--schema_update_window",
+        help="Streaming mode: window (in seconds) in which schema changes are grouped into one table update. "
+             "Records with new fields are held for two windows, until the table is updated.",
+        type=float,
+        default=60,
+    )
+    parser.add_argument(
+        "--route_field",
+        help="Dot separated path of a field (e.g. event.type) to route records by, "
+             "every value is loaded into its own table <bq_table>_<value>.",
+    )
+    parser.add_argument(
+        "--seed_schema",
+        help="JSON schema file (local or gs://...) to start schema inference from, "
+             "records that fit it are skipped during inference.",
+    )
+    parser.add_argument(
+        "--seed_from_table",
+        help="Fetch the schema of the existing table first and start schema inference from it.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--json_parser",
+        help="JSON parser backend: json, orjson or simdjson, defaults to the fastest one that is installed. "
+             "Documents with integers that don't fit in 64 bits are always parsed by json.",
+    )
+    parser.add_argument(
+        "--field_stats_output",
+        help="JSON file (local or gs://...) to write field statistics to: presence, null rate, type counts, "
+             "maximal string and array length of every field.",
+    )
+    parser.add_argument(
+        "--dead_letter_output",
+        help="File prefix (local or gs://...) to write records that can't be parsed or of which no schema "
+             "can be extracted to, as JSONL with the error. By default, such records make the job fail. "
+             "Required in streaming mode, for the rows that BigQuery rejects. "
+             "In strict mode, records with a primitive value in a field that is a RECORD in other records "
+             "are dead letters as well, other type conflicts between records still fail the job.",
+    )
+    parser.add_argument(
+        "--type_widening",
+        help="How to resolve incompatible types of a field (e.g. integers and strings): strict (fail the job, default), "
+             "string (widen to STRING) or json (widen to STRING, records and other types to JSON). "
+             "Loaded values are cast to the widened type.",
+        choices=WIDENING_MODES,
+    )
+    parser.add_argument(
+        "--combine_fanout",
+        help="Number of intermediate combines between the per-bundle and the final schema merge, "
+             "spreads the merge work on jobs with many workers.",
+        type=int,
+    )
+    parser.add_argument(
+        "--load_format",
+        help="Format of the files the data is loaded from: json (default) or avro. "
+             "Avro files are typed and smaller, but can't hold JSON columns.",
+        choices=LOAD_FORMATS,
+    )
+    parser.add_argument(
+        "--output_location",
+        help="Location (local or gs://...) to write the final schema (schema.json) and the data as Parquet files to.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="JSON manifest (local or gs://...) of the processed files and the schema inferred from them. "
+             "Only files that are new since the previous run are processed and loaded, "
+             "their schemas are merged into the stored one. Changed files are skipped with a warning.",
+    )
+    parser.add_argument(
+        "--schema_cache",
+        help="Directory (local or gs://...) to cache the schema of every input file in. Files that didn't change "
+             "since a previous run are not read again for the schema. Not supported with seed schemas, sampling, "
+             "checkpoints, routing or field statistics.",
+    )
+    parser.add_argument(
+        "--schema_cache_max_age_days",
+        help="Maximal age of the cached schemas in days, older ones are evicted.",
+        type=float,
+    )
+    parser.add_argument(
+        "--schema_cache_max_size_mb",
+        help="Maximal size of the schema cache in MB, the oldest schemas are evicted first.",
+        type=float,
+    )
     known_args, pipeline_args = parser.parse_known_args()
 
-    pipeline.run(
-        known_args.input_pattern,
-        known_args.bq_dataset,
-        known_args.bq_table,
-        known_args.load_data,
-        known_args.setup_script,
-        known_args.bq_temp_location,
-        pipeline_args,
-    )
+    if known_args.input_subscription or known_args.input_topic:
+        batch_args = [name for name in BATCH_ONLY_ARGS if getattr(known_args, name) not in (None, False)]
+        if batch_args:
+            parser.error(f"Not supported in streaming mode: {', '.join('--' + name for name in batch_args)}")
+        if known_args.dead_letter_output is None:
+            parser.error("--dead_letter_output is required in streaming mode, rows that BigQuery rejects are written to it")
+        pipeline.run_streaming(
+            known_args.bq_dataset,
+            known_args.bq_table,
+            input_subscription=known_args.input_subscription,
+            input_topic=known_args.input_topic,
+            schema_update_window=known_args.schema_update_window,
+            setup_script=known_args.setup_script,
+            pipeline_args=pipeline_args,
+            data_detectors=known_args.data_detectors,
+            json_parser=known_args.json_parser,
+            dead_letter_output=known_args.dead_letter_output,
+        )
+    else:
+        pipeline.run(
+            known_args.input_pattern,
+            known_args.bq_dataset,
+            known_args.bq_table,
+            known_args.load_data,
+            known_args.setup_script,
+            known_args.bq_temp_location,
+            pipeline_args,
+            data_detectors=known_args.data_detectors,
+            schema_sample_rate=known_args.schema_sample_rate,
+            schema_sample_max=known_args.schema_sample_max,
+            schema_validation=known_args.schema_validation,
+            route_field=known_args.route_field,
+            seed_schema=known_args.seed_schema,
+            seed_from_table=known_args.seed_from_table,
+            json_parser=known_args.json_parser,
+            field_stats_output=known_args.field_stats_output,
+            dead_letter_output=known_args.dead_letter_output,
+            type_widening=known_args.type_widening,
+            combine_fanout=known_args.combine_fanout,
+            load_format=known_args.load_format,
+            output_location=known_args.output_location,
+            checkpoint=known_args.checkpoint,
+            schema_cache=known_args.schema_cache,
+            schema_cache_max_age_days=known_args.schema_cache_max_age_days,
+            schema_cache_max_size_mb=known_args.schema_cache_max_size_mb,
+        )
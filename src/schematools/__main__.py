@@ -0,0 +1,58 @@
+import argparse
+import json
+import sys
+
+from schematools.local_inference import DEFAULT_CHUNK_SIZE, infer_files
+from schematools.schema_merge import WIDENING_MODES, WIDENING_STRICT
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m schematools',
+                                     description='Local BigQuery schema inference for JSONL files.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    infer_parser = subparsers.add_parser('infer', help='Infer the BigQuery schema of JSONL files.')
+    infer_parser.add_argument(
+        "patterns",
+        nargs='+',
+        help="Input files or glob patterns (quote them to avoid shell expansion).",
+    )
+    infer_parser.add_argument(
+        "--workers",
+        help="Number of worker processes, defaults to the number of cores.",
+        type=int,
+    )
+    infer_parser.add_argument(
+        "--chunk_size",
+        help="Files are split into chunks of this many bytes, processed in parallel.",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+    )
+    infer_parser.add_argument(
+        "--data_detectors",
+        help="Comma separated BigQuery types to detect in string values "
+             "(TIMESTAMP, DATE, TIME, NUMERIC, GEOGRAPHY, JSON), defaults to TIMESTAMP.",
+        type=lambda types: [field_type.strip().upper() for field_type in types.split(',') if field_type.strip()],
+    )
+    infer_parser.add_argument(
+        "--json_parser",
+        help="JSON parser backend: json, orjson or simdjson, defaults to the fastest one that is installed.",
+    )
+    infer_parser.add_argument(
+        "--type_widening",
+        help="How to resolve incompatible types of a field: strict (fail, default), "
+             "string (widen to STRING) or json (widen to STRING, records and other types to JSON).",
+        choices=WIDENING_MODES,
+        default=WIDENING_STRICT,
+    )
+    args = parser.parse_args(argv)
+
+    schema = infer_files(args.patterns, workers=args.workers, chunk_size=args.chunk_size,
+                         data_detectors=args.data_detectors, parser=args.json_parser, widening=args.type_widening)
+    if schema is None:
+        sys.exit('No JSON documents found.')
+    print(json.dumps(schema, indent=4))
+
+
+if __name__ == "__main__":
+    main()
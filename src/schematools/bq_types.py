@@ -7,7 +7,26 @@ TYPE_TIMESTAMP = 'TIMESTAMP'
 TYPE_DATE = 'DATE'
 TYPE_TIME = 'TIME'
 TYPE_RECORD = 'RECORD'
+TYPE_NUMERIC = 'NUMERIC'
+TYPE_GEOGRAPHY = 'GEOGRAPHY'
+TYPE_JSON = 'JSON'
+
+ALL_TYPES = [TYPE_STRING, TYPE_INTEGER, TYPE_FLOAT, TYPE_BOOLEAN, TYPE_TIMESTAMP, TYPE_DATE, TYPE_TIME, TYPE_RECORD,
+             TYPE_NUMERIC, TYPE_GEOGRAPHY, TYPE_JSON]
+
+# Standard SQL names of the types
+TYPE_ALIASES = {
+    'INT64': TYPE_INTEGER,
+    'FLOAT64': TYPE_FLOAT,
+    'BOOL': TYPE_BOOLEAN,
+    'STRUCT': TYPE_RECORD,
+}
+
+# Types that can be detected in string values, these can always be widened to STRING
+DETECTED_STRING_TYPES = [TYPE_TIMESTAMP, TYPE_DATE, TYPE_TIME, TYPE_NUMERIC, TYPE_GEOGRAPHY, TYPE_JSON]
 
 MODE_NULLABLE = 'NULLABLE'
 MODE_REQUIRED = 'REQUIRED'
-MODE_REPEATED = 'REPEATED'
\ No newline at end of file
+MODE_REPEATED = 'REPEATED'
+
+ALL_MODES = [MODE_NULLABLE, MODE_REQUIRED, MODE_REPEATED]
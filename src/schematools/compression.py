@@ -0,0 +1,309 @@
+import bz2
+import zlib
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_BZIP2 = 'bzip2'
+
+COMPRESSION_EXTENSIONS = {
+    '.gz': COMPRESSION_GZIP,
+    '.gzip': COMPRESSION_GZIP,
+    '.zst': COMPRESSION_ZSTD,
+    '.zstd': COMPRESSION_ZSTD,
+    '.bz2': COMPRESSION_BZIP2,
+}
+
+# Start of a gzip member (magic + deflate compression method) and of a bzip2 stream (magic + block magic)
+GZIP_MAGIC = b'\x1f\x8b\x08'
+BZIP2_MAGIC = b'BZh'
+BZIP2_BLOCK_MAGIC = b'1AY&SY'
+
+ZSTD_FRAME_MAGIC = 0xFD2FB528
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+ZSTD_SKIPPABLE_MASK = 0xFFFFFFF0
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+
+READ_SIZE = 1024 * 1024
+
+# Number of bytes a member candidate is test-decompressed for
+TRIAL_SIZE = 64 * 1024
+
+
+def compression_type(path: str) -> Optional[str]:
+    """
+    Determines the compression of a file based on its extension.
+
+    :param path: location of the file
+    :return: the compression type, None for uncompressed files
+    """
+    for extension, compression in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def create_decompressor(compression: str):
+    """
+    Creates a decompressor for a single member (gzip), frame (zstd) or stream (bzip2).
+    All of them expose `eof` and `unused_data` once the member is complete.
+
+    :param compression: compression type
+    :return: a decompressor
+    """
+    if compression == COMPRESSION_GZIP:
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    elif compression == COMPRESSION_BZIP2:
+        return bz2.BZ2Decompressor()
+    elif compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ImportError('The zstandard package is required to read zstd files')
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f'Unsupported compression {compression}')
+
+
+def split_points(fileobj: BinaryIO, size: int, compression: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a compressed file into byte ranges of at least `chunk_size` bytes that start at a member boundary,
+    so every range can be decompressed independently.
+
+    Gzip files can only be split if they consist of multiple members (e.g. bgzip or concatenated files),
+    bzip2 files if they consist of multiple streams (e.g. pbzip2) and zstd files if they consist of multiple frames
+    (e.g. the seekable format). Other files result in a single range.
+
+    :param fileobj: the compressed file
+    :param size: size of the file in bytes
+    :param compression: compression type
+    :param chunk_size: minimal size of a range in bytes
+    :return: (start, end) byte ranges
+    """
+    if compression == COMPRESSION_ZSTD:
+        boundaries = [0]
+        for offset in zstd_frame_offsets(fileobj, size):
+            if offset - boundaries[-1] >= chunk_size:
+                boundaries.append(offset)
+    else:
+        boundaries = [0]
+        while boundaries[-1] + chunk_size < size:
+            offset = find_member(fileobj, boundaries[-1] + chunk_size, compression)
+            if offset is None:
+                break
+            boundaries.append(offset)
+
+    return list(zip(boundaries, boundaries[1:] + [size]))
+
+
+def find_member(fileobj: BinaryIO, position: int, compression: str) -> Optional[int]:
+    """
+    Finds the first gzip member or bzip2 stream that starts at or after a given position.
+    Candidates are recognized by their magic bytes, and verified by decompressing the start of the member.
+
+    :param fileobj: the compressed file
+    :param position: offset to start searching from
+    :param compression: compression type (gzip or bzip2)
+    :return: offset of the member, None if there is none
+    """
+    magic = GZIP_MAGIC if compression == COMPRESSION_GZIP else BZIP2_MAGIC
+    while True:
+        fileobj.seek(position)
+        block = fileobj.read(READ_SIZE)
+        if len(block) < len(magic):
+            return None
+
+        index = block.find(magic)
+        while index != -1:
+            if is_member(fileobj, position + index, compression):
+                return position + index
+            index = block.find(magic, index + 1)
+
+        # Magic bytes can be split over two blocks
+        position += len(block) - len(magic) + 1
+
+
+def is_member(fileobj: BinaryIO, offset: int, compression: str) -> bool:
+    fileobj.seek(offset)
+    data = fileobj.read(TRIAL_SIZE)
+
+    if compression == COMPRESSION_GZIP:
+        # Reserved flags must be unset, extra flags and OS must have a known value
+        if len(data) < 10 or data[3] & 0xE0 or data[8] not in (0, 2, 4) or (data[9] > 13 and data[9] != 255):
+            return False
+    elif data[3:4] not in b'123456789' or data[4:10] != BZIP2_BLOCK_MAGIC:
+        return False
+
+    try:
+        create_decompressor(compression).decompress(data)
+        return True
+    except (zlib.error, OSError, ValueError):
+        return False
+
+
+def zstd_frame_offsets(fileobj: BinaryIO, size: int) -> List[int]:
+    """
+    Determines the offsets of the frames of a zstd file.
+    Uses the seek table of the seekable format if present,
+    otherwise walks over the frame and block headers, without decompressing.
+
+    :param fileobj: the compressed file
+    :param size: size of the file in bytes
+    :return: frame offsets
+    """
+    offsets = zstd_seek_table(fileobj, size)
+    if offsets is not None:
+        return offsets
+
+    offsets = []
+    offset = 0
+    while offset < size:
+        fileobj.seek(offset)
+        header = fileobj.read(18)
+        magic = int.from_bytes(header[:4], 'little')
+        if magic & ZSTD_SKIPPABLE_MASK == ZSTD_SKIPPABLE_MAGIC:
+            offset += 8 + int.from_bytes(header[4:8], 'little')
+            continue
+        if magic != ZSTD_FRAME_MAGIC:
+            raise ValueError(f'Invalid zstd frame at offset {offset}')
+        offsets.append(offset)
+
+        # Frame header: descriptor, window descriptor, dictionary id and content size
+        descriptor = header[4]
+        single_segment = (descriptor >> 5) & 1
+        content_size_size = [single_segment, 2, 4, 8][descriptor >> 6]
+        dictionary_id_size = [0, 1, 2, 4][descriptor & 3]
+        offset += 5 + (1 - single_segment) + dictionary_id_size + content_size_size
+
+        # Blocks: 3 byte header with last block flag, block type and block size
+        last_block = False
+        while not last_block:
+            fileobj.seek(offset)
+            block_header = int.from_bytes(fileobj.read(3), 'little')
+            last_block = block_header & 1
+            block_type = (block_header >> 1) & 3
+            offset += 3 + (1 if block_type == 1 else block_header >> 3)
+
+        # Optional content checksum
+        if (descriptor >> 2) & 1:
+            offset += 4
+    return offsets
+
+
+def zstd_seek_table(fileobj: BinaryIO, size: int) -> Optional[List[int]]:
+    """
+    Reads the frame offsets from the seek table of a zstd file in the seekable format.
+
+    :param fileobj: the compressed file
+    :param size: size of the file in bytes
+    :return: frame offsets, None if the file has no seek table
+    """
+    if size < 17:
+        return None
+    fileobj.seek(size - 9)
+    footer = fileobj.read(9)
+    if int.from_bytes(footer[5:9], 'little') != ZSTD_SEEKABLE_MAGIC:
+        return None
+
+    frame_count = int.from_bytes(footer[:4], 'little')
+    entry_size = 12 if footer[4] & 0x80 else 8
+    fileobj.seek(size - 9 - frame_count * entry_size)
+    entries = fileobj.read(frame_count * entry_size)
+
+    offsets = []
+    offset = 0
+    for i in range(0, len(entries), entry_size):
+        offsets.append(offset)
+        offset += int.from_bytes(entries[i:i + 4], 'little')
+    return offsets
+
+
+def decompress_members(fileobj: BinaryIO, start: int, compression: str) -> Iterator[Tuple[int, bytes]]:
+    """
+    Decompresses all members of a file, starting from the member at the given offset.
+    The start of every member is marked with an empty chunk, so empty members are reported as well.
+
+    :param fileobj: the compressed file
+    :param start: offset of the first member
+    :param compression: compression type
+    :return: (offset of the member, decompressed data) pairs
+    """
+    fileobj.seek(start)
+    member_offset = start
+    buffer = b''
+    while True:
+        # Start of a new member
+        if len(buffer) < 8:
+            buffer += fileobj.read(READ_SIZE)
+        if not buffer:
+            return
+        if compression == COMPRESSION_ZSTD and \
+                int.from_bytes(buffer[:4], 'little') & ZSTD_SKIPPABLE_MASK == ZSTD_SKIPPABLE_MAGIC:
+            # Skippable frames (e.g. the seek table) don't contain data
+            skip_size = 8 + int.from_bytes(buffer[4:8], 'little')
+            member_offset += skip_size
+            fileobj.seek(member_offset)
+            buffer = b''
+            continue
+
+        yield member_offset, b''
+        decompressor = create_decompressor(compression)
+        consumed = 0
+        while not decompressor.eof:
+            if not buffer:
+                buffer = fileobj.read(READ_SIZE)
+                if not buffer:
+                    raise ValueError(f'Truncated {compression} member at offset {member_offset}')
+            data = decompressor.decompress(buffer)
+            consumed += len(buffer)
+            buffer = b''
+            if data:
+                yield member_offset, data
+
+        buffer = decompressor.unused_data
+        member_offset += consumed - len(buffer)
+
+
+def read_lines(fileobj: BinaryIO, start: int, end: int, compression: str) -> Iterator[bytes]:
+    """
+    Reads the lines of a byte range of a compressed file, as determined by `split_points`.
+
+    Lines can cross member boundaries, so a line belongs to the range in which it starts:
+    except for the first range, the (partial) first line is skipped,
+    and reading continues past the end of the range until the line that starts at the end is read.
+
+    :param fileobj: the compressed file
+    :param start: offset of the first member of the range
+    :param end: offset of the first member of the next range, or the file size
+    :param compression: compression type
+    :return: the lines of the range, without line endings
+    """
+    skip_first = start > 0
+    # Decompressed offset of the start of the next range
+    end_offset = None
+    pending = b''
+    pending_offset = 0
+
+    for member_offset, data in decompress_members(fileobj, start, compression):
+        if end_offset is None and member_offset >= end:
+            if member_offset > end:
+                raise ValueError(f'Offset {end} is not a {compression} member boundary')
+            end_offset = pending_offset + len(pending)
+        if end_offset is not None and pending_offset > end_offset:
+            return
+
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if skip_first:
+                skip_first = False
+            elif end_offset is not None and pending_offset > end_offset:
+                return
+            else:
+                yield line
+            pending_offset += len(line) + 1
+
+    if pending and not skip_first and (end_offset is None or pending_offset <= end_offset):
+        yield pending
@@ -1,3 +1,19 @@
+import datetime
+import json
+import re
+from typing import Callable, Hashable, Iterable
+
+from schematools.bq_types import *
+
+
+# Canonical timestamps, e.g. 2020-06-18T10:44:12.123456 (ASCII digits only)
+TIMESTAMP_CANONICAL_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})[Tt](\d{2}):(\d{2}):(\d{2})(?:\.\d{1,6})?', re.ASCII)
+
+# Everything that might be accepted by the strptime formats below
+TIMESTAMP_CANDIDATE_RE = re.compile(r'\d{4}-\d{1,2}-[ \d]?\d[Tt]\d{1,2}:\d{1,2}:\d{1,2}(?:\.\d{1,6})?')
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+TIMESTAMP_FORMAT_MICROS = '%Y-%m-%dT%H:%M:%S.%f'
 
 
 def is_timestamp(field_Value: str) -> bool:
@@ -5,27 +21,228 @@ def is_timestamp(field_Value: str) -> bool:
     Checks if a string is compatible with the TIMESTAMP
     type of BigQuery.
 
+    Accepts exactly the same values as the parser of the BigQuery client library,
+    but rejects most non-timestamps with a regular expression instead of an exception.
+
     Doc: https://github.com/googleapis/python-bigquery/blob/8bcf397fbe2527e06317741875a059b109cfcd9c/tests/unit/test__helpers.py#L218
 
     :param field_Value: a field value (string)
     :return: whether the value is TIMESTAMP compatible
     """
-    from google.cloud.bigquery._helpers import _timestamp_query_param_from_json
+    # Same normalization as the BigQuery client library:
+    # date/time separator can be a space, UTC can be written as Z or +00:00
+    value = field_Value.replace(' ', 'T', 1).replace('Z', '').replace('+00:00', '')
+
+    # Fast path for canonical timestamps, only the date/time ranges need to be checked
+    match = TIMESTAMP_CANONICAL_RE.fullmatch(value)
+    if match is not None:
+        try:
+            datetime.datetime(*map(int, match.groups()))
+            return True
+        except ValueError:
+            return False
+
+    # Reject everything that can't be a timestamp without parsing
+    if TIMESTAMP_CANDIDATE_RE.fullmatch(value) is None:
+        return False
+
+    # Slow path for the remaining, more lenient formats
     try:
-        result = _timestamp_query_param_from_json(field_Value, {'mode': 'NULLABLE', 'name':'unknown', 'field_type':'UNKNOWN'})
-        return result is not None
-    except:
+        datetime.datetime.strptime(value, TIMESTAMP_FORMAT_MICROS if '.' in value else TIMESTAMP_FORMAT)
+        return True
+    except ValueError:
         return False
 
 
+# Canonical BigQuery DATE and TIME literals
+DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})', re.ASCII)
+TIME_RE = re.compile(r'(\d{1,2}):(\d{1,2}):(\d{1,2})(?:\.\d{1,6})?', re.ASCII)
+
+# Decimal numbers that fit in BigQuery's NUMERIC type (29 integer digits, 9 fractional digits)
+NUMERIC_RE = re.compile(r'[+-]?\d{1,29}(?:\.\d{1,9})?', re.ASCII)
+
+# Well-known text (WKT) representation of a geography
+GEOGRAPHY_RE = re.compile(
+    r'(?:POINT|LINESTRING|POLYGON|MULTIPOINT|MULTILINESTRING|MULTIPOLYGON|GEOMETRYCOLLECTION)\s*(?:\(.*\)|EMPTY)',
+    re.IGNORECASE | re.DOTALL
+)
+
+
 def is_date(field_Value: str) -> bool:
-    # FUTURE implement
-    return False
+    """
+    Checks if a string is compatible with the DATE type of BigQuery (YYYY-[M]M-[D]D).
+
+    :param field_Value: a field value (string)
+    :return: whether the value is DATE compatible
+    """
+    match = DATE_RE.fullmatch(field_Value)
+    if match is None:
+        return False
+    try:
+        datetime.date(*map(int, match.groups()))
+        return True
+    except ValueError:
+        return False
 
 
 def is_time(field_Value: str) -> bool:
-    # FUTURE implement
-    return False
+    """
+    Checks if a string is compatible with the TIME type of BigQuery ([H]H:[M]M:[S]S[.DDDDDD]).
+
+    :param field_Value: a field value (string)
+    :return: whether the value is TIME compatible
+    """
+    match = TIME_RE.fullmatch(field_Value)
+    if match is None:
+        return False
+    try:
+        datetime.time(*map(int, match.groups()))
+        return True
+    except ValueError:
+        return False
+
+
+def is_numeric(field_Value: str) -> bool:
+    """
+    Checks if a string holds a decimal number that fits the NUMERIC type of BigQuery.
+
+    :param field_Value: a field value (string)
+    :return: whether the value is NUMERIC compatible
+    """
+    return NUMERIC_RE.fullmatch(field_Value) is not None
+
+
+def is_geography(field_Value: str) -> bool:
+    """
+    Checks if a string looks like a well-known text (WKT) geography.
+    Only the outer structure is checked, BigQuery validates the coordinates on load.
+
+    :param field_Value: a field value (string)
+    :return: whether the value is GEOGRAPHY compatible
+    """
+    return GEOGRAPHY_RE.fullmatch(field_Value) is not None
+
+
+def is_json(field_Value: str) -> bool:
+    """
+    Checks if a string holds a JSON object or array.
+
+    :param field_Value: a field value (string)
+    :return: whether the value is JSON compatible
+    """
+    if not field_Value or field_Value[0] not in '{[':
+        return False
+    try:
+        json.loads(field_Value)
+        return True
+    except ValueError:
+        return False
+
+
+class DataDetector(object):
+    """
+    A data detector recognizes string values of a more specific BigQuery type.
+
+    Detectors with a higher priority are tried first,
+    detectors with the same priority are tried from cheap to expensive.
+    """
+
+    def __init__(self, field_type: str, detect: Callable[[str], bool], priority: int = 0, cost: int = 1):
+        self.field_type = field_type
+        self.detect = detect
+        self.priority = priority
+        self.cost = cost
+
+
+class DetectorRegistry(object):
+    """
+    Ordered collection of data detectors.
+    """
+
+    def __init__(self, detectors: Iterable[DataDetector] = ()):
+        self.detectors = []
+        for detector in detectors:
+            self.register(detector)
+
+    def register(self, detector: DataDetector):
+        """
+        Adds a detector, replacing the existing detector of the same type.
+
+        :param detector: the data detector
+        """
+        self.detectors = [existing for existing in self.detectors if existing.field_type != detector.field_type]
+        self.detectors.append(detector)
+        self.detectors.sort(key=lambda existing: (-existing.priority, existing.cost))
+
+    def detect(self, field_value: str) -> str:
+        """
+        Determines the type of a string value, using the first detector that accepts it.
+
+        :param field_value: a field value (string)
+        :return: the detected BigQuery type, STRING if no detector matched
+        """
+        for detector in self.detectors:
+            if detector.detect(field_value):
+                return detector.field_type
+        return TYPE_STRING
+
+
+AVAILABLE_DETECTORS = {
+    TYPE_TIMESTAMP: DataDetector(TYPE_TIMESTAMP, is_timestamp, priority=30),
+    TYPE_DATE: DataDetector(TYPE_DATE, is_date, priority=20),
+    TYPE_TIME: DataDetector(TYPE_TIME, is_time, priority=20),
+    TYPE_NUMERIC: DataDetector(TYPE_NUMERIC, is_numeric, priority=10),
+    TYPE_GEOGRAPHY: DataDetector(TYPE_GEOGRAPHY, is_geography, priority=10, cost=2),
+    TYPE_JSON: DataDetector(TYPE_JSON, is_json, priority=0, cost=10),
+}
+
+DEFAULT_DETECTOR_TYPES = [TYPE_TIMESTAMP]
+
+
+def create_registry(field_types: Iterable[str] = None) -> DetectorRegistry:
+    """
+    Creates a registry with the available detectors for the given types.
+
+    :param field_types: BigQuery types to detect, defaults to DEFAULT_DETECTOR_TYPES
+    :return: a detector registry
+    """
+    if field_types is None:
+        field_types = DEFAULT_DETECTOR_TYPES
+    try:
+        return DetectorRegistry(AVAILABLE_DETECTORS[field_type] for field_type in field_types)
+    except KeyError as e:
+        raise ValueError(f'No data detector available for type {e}')
+
+
+DEFAULT_REGISTRY = create_registry()
+
+
+class DetectionContext(object):
+    """
+    Detection state for a batch of documents (e.g. a bundle).
+
+    Once a field path has been observed as a plain STRING, detection is skipped
+    for that path, as merging would widen any detected type to STRING anyway.
+    """
+
+    def __init__(self, registry: DetectorRegistry = None):
+        self.registry = registry or DEFAULT_REGISTRY
+        self.string_paths = set()
+        self.skipped = 0
 
+    def detect(self, path: Hashable, field_value: str) -> str:
+        """
+        Determines the type of a string value at a given field path.
 
+        :param path: field path of the value
+        :param field_value: a field value (string)
+        :return: the detected BigQuery type
+        """
+        if path in self.string_paths:
+            self.skipped += 1
+            return TYPE_STRING
 
+        field_type = self.registry.detect(field_value)
+        if field_type == TYPE_STRING:
+            self.string_paths.add(path)
+        return field_type
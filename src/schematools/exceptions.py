@@ -8,3 +8,9 @@ class BQSchemaMergeException(Exception):
     """
     pass
 
+
+class BQSchemaCastException(Exception):
+    """
+    Exception that occurs when a json document can't be converted to a BigQuery schema.
+    """
+    pass
@@ -0,0 +1,128 @@
+from typing import Dict, List
+
+from schematools.bq_types import *
+from schematools.data_detectors import DetectionContext
+from schematools.schema_extraction import determine_field_type
+
+
+class FieldStats(object):
+    """
+    Presence and cardinality statistics of a field and its children, collected from every document
+    (not only the first document of every shape, like the schema).
+
+    Tracks how often the field appears (including null values), how often it is null,
+    how often every type was observed, the maximal string length and the maximal array length.
+    Types of array elements are counted per element. Memory usage only depends on the number of fields.
+    The root node represents the top-level record.
+    """
+
+    __slots__ = ('count', 'null_count', 'type_counts', 'max_length', 'max_items', 'children')
+
+    def __init__(self):
+        self.count = 0
+        self.null_count = 0
+        self.type_counts = {}
+        self.max_length = None
+        self.max_items = None
+        self.children = None
+
+    def add_document(self, data: Dict[str, object], detection: DetectionContext = None):
+        """
+        Adds the values of a json document to this (root) node.
+
+        :param data: JSON document, as a Python dict object
+        :param detection: data detection context, the default detectors are used if omitted
+        """
+        self.add_value(data, detection, ())
+
+    def add_value(self, value: object, detection: DetectionContext, path: tuple):
+        self.count += 1
+        if value is None:
+            self.null_count += 1
+        elif isinstance(value, list):
+            if self.max_items is None or len(value) > self.max_items:
+                self.max_items = len(value)
+            for element in value:
+                # Null elements are dropped by BigQuery
+                if element is not None:
+                    self.add_element(element, detection, path)
+        else:
+            self.add_element(value, detection, path)
+
+    def add_element(self, value: object, detection: DetectionContext, path: tuple):
+        if isinstance(value, dict):
+            field_type = TYPE_RECORD
+            if self.children is None:
+                self.children = {}
+            children = self.children
+            for name, child_value in value.items():
+                child = children.get(name)
+                if child is None:
+                    child = children[name] = FieldStats()
+                child.add_value(child_value, detection, path + (name,))
+        else:
+            field_type = determine_field_type(value, detection, path)
+            if isinstance(value, str) and (self.max_length is None or len(value) > self.max_length):
+                self.max_length = len(value)
+
+        self.type_counts[field_type] = self.type_counts.get(field_type, 0) + 1
+
+    def merge(self, other: 'FieldStats'):
+        """
+        Merges the statistics of another node into this one, in place.
+        Subtrees of the other node may be adopted, so it should not be used afterwards.
+
+        :param other: statistics of the same field
+        """
+        self.count += other.count
+        self.null_count += other.null_count
+        for field_type, count in other.type_counts.items():
+            self.type_counts[field_type] = self.type_counts.get(field_type, 0) + count
+        if other.max_length is not None and (self.max_length is None or other.max_length > self.max_length):
+            self.max_length = other.max_length
+        if other.max_items is not None and (self.max_items is None or other.max_items > self.max_items):
+            self.max_items = other.max_items
+
+        if other.children is not None:
+            if self.children is None:
+                self.children = {}
+            children = self.children
+            for name, other_child in other.children.items():
+                child = children.get(name)
+                if child is None:
+                    children[name] = other_child
+                else:
+                    child.merge(other_child)
+
+    def to_report(self) -> Dict[str, object]:
+        """
+        Converts the statistics of this (root) node into a JSON serializable report.
+
+        :return: the number of documents and the statistics of every field
+        """
+        return {
+            'count': self.count,
+            'fields': self.fields_report(),
+        }
+
+    def fields_report(self) -> List[Dict[str, object]]:
+        # Presence is relative to the number of records (e.g. array elements) the field could appear in
+        record_count = self.type_counts.get(TYPE_RECORD, 0)
+        report = []
+        for name, child in (self.children or {}).items():
+            field = {
+                'name': name,
+                'count': child.count,
+                'presence': child.count / record_count if record_count else None,
+                'null_count': child.null_count,
+                'null_rate': child.null_count / child.count,
+                'types': dict(child.type_counts),
+            }
+            if child.max_length is not None:
+                field['max_length'] = child.max_length
+            if child.max_items is not None:
+                field['max_items'] = child.max_items
+            if child.children is not None:
+                field['fields'] = child.fields_report()
+            report.append(field)
+        return report
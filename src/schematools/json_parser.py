@@ -0,0 +1,97 @@
+import json
+import re
+from typing import AnyStr, Callable, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+PARSER_AUTO = 'auto'
+PARSER_JSON = 'json'
+PARSER_ORJSON = 'orjson'
+PARSER_SIMDJSON = 'simdjson'
+
+# Parser backends, in order of preference.
+# orjson needs a scan for large integers before parsing (see `parse_orjson`), which makes it slower than simdjson.
+ALL_PARSERS = [PARSER_SIMDJSON, PARSER_ORJSON, PARSER_JSON]
+
+# Errors on which the native parsers fall back to the standard library,
+# e.g. for NaN values (not valid JSON) or integers that don't fit in 64 bits
+SIMDJSON_ERRORS = (ValueError, RuntimeError)
+
+# orjson parses integers that don't fit in 64 bits as floats, these have at least 19 digits
+LARGE_INTEGER_PATTERN = re.compile(r'\d{19}')
+LARGE_INTEGER_BYTES_PATTERN = re.compile(rb'\d{19}')
+
+
+def available_parsers() -> List[str]:
+    """
+    Lists the parser backends that are installed, in order of preference.
+
+    :return: names of the available parsers
+    """
+    installed = {PARSER_ORJSON: orjson, PARSER_SIMDJSON: simdjson, PARSER_JSON: json}
+    return [name for name in ALL_PARSERS if installed[name] is not None]
+
+
+def resolve_parser(name: str = None) -> str:
+    """
+    Determines the parser backend to use.
+
+    :param name: name of the parser backend, the fastest available one is used if omitted or 'auto'
+    :return: name of an available parser backend
+    """
+    if name is None or name == PARSER_AUTO:
+        return available_parsers()[0]
+    if name not in ALL_PARSERS:
+        raise ValueError(f'Unknown JSON parser {name}, choose one of {", ".join([PARSER_AUTO] + ALL_PARSERS)}')
+    if name not in available_parsers():
+        raise ValueError(f'JSON parser {name} is not installed')
+    return name
+
+
+def create_parser(name: str = None) -> Callable[[AnyStr], object]:
+    """
+    Creates a function that parses a JSON document into Python objects.
+    The native parsers fall back to the standard library for documents they don't accept,
+    or that may contain integers that don't fit in 64 bits, so all parsers return the same values.
+    The simdjson parser reuses its buffers, so it should not be shared between threads.
+
+    :param name: name of the parser backend, the fastest available one is used if omitted or 'auto'
+    :return: parse function
+    """
+    name = resolve_parser(name)
+    if name == PARSER_ORJSON:
+        return parse_orjson
+    elif name == PARSER_SIMDJSON:
+        parser = simdjson.Parser()
+
+        def parse_simdjson(data: AnyStr) -> object:
+            try:
+                return parser.parse(data, recursive=True)
+            except SIMDJSON_ERRORS:
+                return json.loads(data)
+
+        return parse_simdjson
+    return json.loads
+
+
+def parse_orjson(data: AnyStr) -> object:
+    # Long digit runs may also be part of a string or a float, these are parsed by the standard library as well
+    pattern = LARGE_INTEGER_BYTES_PATTERN if isinstance(data, bytes) else LARGE_INTEGER_PATTERN
+    if pattern.search(data):
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+# Stateless parse function for parsing outside of the pipeline
+loads = create_parser(PARSER_ORJSON if orjson is not None else PARSER_JSON)
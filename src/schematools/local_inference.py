@@ -0,0 +1,167 @@
+import glob
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from schematools import compression
+from schematools.data_detectors import DetectionContext, create_registry
+from schematools.json_parser import create_parser
+from schematools.schema_extraction import extract_schema_from_dict
+from schematools.schema_fingerprint import ShapeCache, schema_fingerprint
+from schematools.schema_merge import WIDENING_STRICT, merge_schemas
+from schematools.schema_tree import SchemaNode
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# A file and the byte range [start, end) of which the lines are processed
+Chunk = Tuple[str, int, int]
+
+
+def split_files(patterns: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Chunk]:
+    """
+    Splits the files matching the given patterns into chunks of about `chunk_size` bytes.
+    Chunks are aligned to lines: every chunk ends right after a newline (or at the end of the file).
+    Compressed files are split at member boundaries, see `compression.split_points`.
+
+    :param patterns: file patterns (glob)
+    :param chunk_size: minimal size of a chunk in bytes, the last chunk of a file can be smaller
+    :return: list of chunks
+    """
+    chunks = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            compression_type = compression.compression_type(path)
+            if compression_type is not None:
+                with open(path, 'rb') as infile:
+                    ranges = compression.split_points(infile, os.path.getsize(path), compression_type, chunk_size)
+                chunks.extend((path, start, end) for start, end in ranges)
+            elif os.path.getsize(path) > 0:
+                chunks.extend((path, start, end) for start, end in split_points(path, chunk_size))
+    return chunks
+
+
+def split_points(path: str, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Determines the line aligned byte ranges of a (non-empty) file.
+
+    :param path: location of the file
+    :param chunk_size: minimal size of a chunk in bytes
+    :return: (start, end) byte ranges
+    """
+    # Only the bytes around the split points are paged in
+    with open(path, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        start = 0
+        while start < size:
+            newline = mm.find(b'\n', min(start + chunk_size, size) - 1)
+            end = size if newline == -1 else newline + 1
+            yield start, end
+            start = end
+
+
+def read_chunk(chunk: Chunk) -> Iterator[bytes]:
+    """
+    Reads the lines of a chunk.
+    Lines are streamed through a small buffer, so the memory usage does not depend on the file size.
+
+    :param chunk: file and line aligned byte range
+    :return: the lines of the chunk
+    """
+    path, start, end = chunk
+    compression_type = compression.compression_type(path)
+    if compression_type is not None:
+        with open(path, 'rb') as infile:
+            yield from compression.read_lines(infile, start, end, compression_type)
+        return
+
+    with open(path, 'rb') as infile:
+        infile.seek(start)
+        position = start
+        for line in infile:
+            yield line
+            position += len(line)
+            if position >= end:
+                break
+
+
+def infer_chunk(chunk: Chunk, data_detectors: List[str] = None, parser: str = None,
+                widening: str = WIDENING_STRICT) -> List[object]:
+    """
+    Infers the schema of all documents in a chunk.
+    Like the pipeline, only the first document of every shape is extracted.
+
+    :param chunk: file and byte range
+    :param data_detectors: BigQuery types to detect in string values, defaults to TIMESTAMP only
+    :param parser: JSON parser backend, the fastest available one is used if omitted
+    :param widening: widening mode for incompatible types
+    :return: the merged schema of the chunk, None if it has no documents
+    """
+    loads = create_parser(parser)
+    detection = DetectionContext(create_registry(data_detectors))
+    shape_cache = ShapeCache()
+    accumulator = SchemaNode()
+
+    for line in read_chunk(chunk):
+        if not line.strip():
+            continue
+        data = loads(line)
+
+        # Documents of a known shape would not change the schema
+        fingerprint = schema_fingerprint(data, detection)
+        if shape_cache.lookup(fingerprint):
+            continue
+        shape_cache.add(fingerprint)
+        accumulator.merge_schema(extract_schema_from_dict(data, detection, widening), widening=widening)
+
+    if accumulator.count == 0:
+        return None
+    return accumulator.to_schema()
+
+
+def tree_reduce(schemas: List[List[object]], widening: str = WIDENING_STRICT) -> List[object]:
+    """
+    Merges a list of schemas pairwise, level by level,
+    so every schema takes part in a logarithmic number of merges.
+
+    :param schemas: list of BigQuery schemas (may contain None)
+    :param widening: widening mode for incompatible types
+    :return: merged BigQuery schema
+    """
+    schemas = list(schemas)
+    if len(schemas) == 0:
+        return None
+
+    while len(schemas) > 1:
+        merged = [merge_schemas(schemas[i], schemas[i + 1], widening) for i in range(0, len(schemas) - 1, 2)]
+        if len(schemas) % 2 == 1:
+            merged.append(schemas[-1])
+        schemas = merged
+    return schemas[0]
+
+
+def infer_files(patterns: List[str], workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                data_detectors: List[str] = None, parser: str = None, widening: str = WIDENING_STRICT) -> List[object]:
+    """
+    Infers the schema of JSONL files, using multiple processes.
+    Files are split into chunks, of which the schemas are inferred in parallel
+    and merged afterwards.
+
+    :param patterns: file patterns (glob)
+    :param workers: number of worker processes, defaults to the number of cores
+    :param chunk_size: maximal size of a chunk in bytes
+    :param data_detectors: BigQuery types to detect in string values, defaults to TIMESTAMP only
+    :param parser: JSON parser backend, the fastest available one is used if omitted
+    :param widening: widening mode for incompatible types, see `determine_common_type`
+    :return: the merged schema, None if there are no documents
+    """
+    chunks = split_files(patterns, chunk_size)
+    workers = min(workers or os.cpu_count(), len(chunks))
+
+    # Avoid the process startup for small inputs
+    if workers <= 1:
+        return tree_reduce([infer_chunk(chunk, data_detectors, parser, widening) for chunk in chunks], widening)
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(infer_chunk, chunk, data_detectors, parser, widening) for chunk in chunks]
+        return tree_reduce([future.result() for future in futures], widening)
@@ -0,0 +1,46 @@
+from typing import Dict, List
+
+import pyarrow as pa
+
+from schematools.bq_types import *
+
+# Arrow types of the primitive BigQuery types, JSON and GEOGRAPHY values are kept as text
+ARROW_TYPES = {
+    TYPE_STRING: pa.string(),
+    TYPE_INTEGER: pa.int64(),
+    TYPE_FLOAT: pa.float64(),
+    TYPE_BOOLEAN: pa.bool_(),
+    TYPE_TIMESTAMP: pa.timestamp('us', tz='UTC'),
+    TYPE_DATE: pa.date32(),
+    TYPE_TIME: pa.time64('us'),
+    TYPE_NUMERIC: pa.decimal128(38, 9),
+    TYPE_GEOGRAPHY: pa.string(),
+    TYPE_JSON: pa.string(),
+}
+
+
+def to_arrow_schema(schema: List[Dict], required: bool = True) -> pa.Schema:
+    """
+    Converts a BigQuery schema into an Arrow schema, e.g. to write Parquet files.
+    RECORD fields become structs, REPEATED fields lists and REQUIRED fields are not nullable,
+    unless `required` is disabled, then all fields are nullable.
+
+    The converted rows of `compile_converter` (for Avro) hold values of the matching Python types.
+
+    :param schema: BigQuery schema
+    :param required: keep the REQUIRED mode of fields
+    :return: Arrow schema
+    """
+    return pa.schema([to_arrow_field(field, required) for field in schema])
+
+
+def to_arrow_field(field: Dict[str, object], required: bool = True) -> pa.Field:
+    field_type = TYPE_ALIASES.get(field['type'], field['type'])
+    if field_type == TYPE_RECORD:
+        arrow_type = pa.struct([to_arrow_field(child, required) for child in field['fields']])
+    else:
+        arrow_type = ARROW_TYPES[field_type]
+
+    if field['mode'] == MODE_REPEATED:
+        arrow_type = pa.list_(arrow_type)
+    return pa.field(field['name'], arrow_type, nullable=not required or field['mode'] != MODE_REQUIRED)
@@ -0,0 +1,259 @@
+import datetime
+import decimal
+import json
+import re
+from typing import Callable, Dict, List, Optional
+
+from schematools.bq_types import *
+from schematools.data_detectors import DATE_RE, TIME_RE, TIMESTAMP_FORMAT, TIMESTAMP_FORMAT_MICROS, is_json
+from schematools.exceptions import BQSchemaCastException
+
+# Formats of the files the rows are loaded from: JSON lines, or Avro files that hold typed values
+LOAD_FORMAT_JSON = 'json'
+LOAD_FORMAT_AVRO = 'avro'
+LOAD_FORMATS = [LOAD_FORMAT_JSON, LOAD_FORMAT_AVRO]
+
+# Timestamps in the format BigQuery loads as is
+TIMESTAMP_LOAD_RE = re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?(?:Z|\+00:00)?', re.ASCII)
+
+Converter = Callable[[object], object]
+
+
+def compile_converter(schema: List[Dict], load_format: str = LOAD_FORMAT_JSON,
+                      check_records: bool = False) -> Callable[[Dict[str, object]], Dict[str, object]]:
+    """
+    Compiles a schema into a row converter, which normalizes json documents before they are loaded:
+
+    - fields that are not in the schema (e.g. fields that were only null) and null values are dropped
+    - null elements are dropped from arrays, BigQuery rejects them
+    - integers in FLOAT fields become floats
+    - values in STRING fields become their JSON representation (e.g. 123 becomes "123"),
+      values in JSON fields become JSON strings (see `determine_common_type` for the widening of types)
+    - timestamps in other formats the detector accepts are formatted as YYYY-MM-DDTHH:MM:SS[.ffffff]
+
+    For Avro files, TIMESTAMP, DATE, TIME and NUMERIC values are converted to the matching Python objects,
+    and missing arrays are added as empty arrays (Avro has no null arrays).
+
+    The schema is only interpreted once: every field gets a converter function, or none if its values can be kept.
+    Documents are not modified, records that need no conversion are returned as is.
+    Values that don't match the schema are left to BigQuery, except for the values of RECORD fields
+    that are not an object (or array of objects) with `check_records` enabled,
+    e.g. for a record that was kept in a conflict with a primitive type (see `dead_letter_widening`).
+
+    :param schema: BigQuery schema
+    :param load_format: format of the files the rows are loaded from, json (default) or avro
+    :param check_records: raise a BQSchemaCastException for the values of RECORD fields that are not an object
+    :return: function that converts a document
+    """
+    if load_format not in LOAD_FORMATS:
+        raise ValueError(f'Unknown load format {load_format}, choose one of {", ".join(LOAD_FORMATS)}')
+    return compile_record_converter(schema, load_format, check_records)
+
+
+def compile_record_converter(fields: List[Dict], load_format: str, check_records: bool = False,
+                             record_name: str = None) -> Converter:
+    # Every field maps to the Python type of the values that are kept as is, and its converter
+    converters = {
+        field['name']: (PLAIN_TYPES.get(field['type']) if field['mode'] != MODE_REPEATED else None,
+                        compile_field_converter(field, load_format, check_records))
+        for field in fields
+    }
+    # Fields of which all values are kept as is
+    plain_fields = frozenset(name for name, (_, converter) in converters.items() if converter is None)
+    # Arrays that have to be present in every record
+    list_fields = tuple(field['name'] for field in fields if field['mode'] == MODE_REPEATED) \
+        if load_format == LOAD_FORMAT_AVRO else ()
+
+    def convert_record(data):
+        # Values that don't match the schema are left to BigQuery
+        if type(data) is not dict:
+            if check_records:
+                raise BQSchemaCastException(f'Value of record {record_name} is not an object but {type(data).__name__}')
+            return data
+        # Fast path: every field is known and needs no conversion
+        if not list_fields and plain_fields.issuperset(data):
+            return data
+
+        result = {}
+        for name, value in data.items():
+            entry = converters.get(name)
+            # Fields that are not in the schema and null values are dropped
+            if entry is None or value is None:
+                continue
+            plain_type, converter = entry
+            # Checking the type inline avoids a call for most values
+            result[name] = value if converter is None or type(value) is plain_type else converter(value)
+        for name in list_fields:
+            if name not in result:
+                result[name] = []
+        return result
+
+    return convert_record
+
+
+def compile_field_converter(field: Dict[str, object], load_format: str,
+                            check_records: bool = False) -> Optional[Converter]:
+    """
+    Compiles the converter of a single field, arrays are converted element by element.
+
+    :param field: field schema
+    :param load_format: json or avro
+    :param check_records: raise a BQSchemaCastException for values of RECORD fields that are not an object
+    :return: converter of the values of the field, None if they can be kept as is
+    """
+    convert_value = compile_value_converter(field, load_format, check_records)
+    check_list = check_records and field['type'] == TYPE_RECORD
+    if field['mode'] != MODE_REPEATED:
+        return convert_value
+
+    if convert_value is None:
+        def convert_list(values):
+            if type(values) is not list or None not in values:
+                return values
+            return [value for value in values if value is not None]
+    else:
+        def convert_list(values):
+            if type(values) is not list:
+                if check_list:
+                    raise BQSchemaCastException(f'Value of repeated record {field["name"]} is not an array '
+                                                f'but {type(values).__name__}')
+                return values
+            return [convert_value(value) for value in values if value is not None]
+
+    return convert_list
+
+
+def compile_value_converter(field: Dict[str, object], load_format: str,
+                            check_records: bool = False) -> Optional[Converter]:
+    field_type = field['type']
+    if field_type == TYPE_RECORD:
+        return compile_record_converter(field['fields'], load_format, check_records, field['name'])
+    return FORMAT_CONVERTERS[load_format].get(field_type)
+
+
+def convert_float(value: object) -> object:
+    return float(value) if type(value) is int else value
+
+
+def convert_string(value: object) -> object:
+    return value if type(value) is str else json.dumps(value)
+
+
+def convert_json(value: object) -> object:
+    # Strings that don't hold an object or array would not be valid JSON
+    if type(value) is str and is_json(value):
+        return value
+    return json.dumps(value)
+
+
+def convert_timestamp(value: object) -> object:
+    """
+    Formats a timestamp that the TIMESTAMP detector accepts, but BigQuery might not load (see `is_timestamp`).
+
+    :param value: a TIMESTAMP value
+    :return: the formatted timestamp, the value itself if it is already in a loadable format or not a timestamp
+    """
+    if type(value) is not str or TIMESTAMP_LOAD_RE.fullmatch(value) is not None:
+        return value
+
+    timestamp = parse_timestamp(value)
+    return value if timestamp is None else timestamp.isoformat()
+
+
+def parse_timestamp(value: str) -> Optional[datetime.datetime]:
+    """
+    Parses a timestamp in one of the formats the TIMESTAMP detector accepts (see `is_timestamp`).
+
+    :param value: a TIMESTAMP value
+    :return: the (naive) timestamp, None if the value is not a timestamp
+    """
+    normalized = value.replace(' ', 'T', 1).replace('Z', '').replace('+00:00', '')
+    try:
+        timestamp_format = TIMESTAMP_FORMAT_MICROS if '.' in normalized else TIMESTAMP_FORMAT
+        return datetime.datetime.strptime(normalized, timestamp_format)
+    except ValueError:
+        return None
+
+
+def convert_avro_timestamp(value: object) -> object:
+    # Timestamps without a time zone are in UTC
+    if type(value) is not str:
+        return value
+    timestamp = parse_timestamp(value)
+    return value if timestamp is None else timestamp.replace(tzinfo=datetime.timezone.utc)
+
+
+def convert_avro_date(value: object) -> object:
+    match = DATE_RE.fullmatch(value) if type(value) is str else None
+    if match is None:
+        return value
+    try:
+        return datetime.date(*map(int, match.groups()))
+    except ValueError:
+        return value
+
+
+def convert_avro_time(value: object) -> object:
+    match = TIME_RE.fullmatch(value) if type(value) is str else None
+    if match is None:
+        return value
+    fraction = value.partition('.')[2]
+    try:
+        return datetime.time(*map(int, match.groups()), int(fraction.ljust(6, '0')))
+    except ValueError:
+        return value
+
+
+def convert_avro_numeric(value: object) -> object:
+    # Floats are converted via their shortest representation, e.g. 0.1 instead of 0.1000000000000000055511151231257827
+    try:
+        return decimal.Decimal(repr(value) if type(value) is float else value)
+    except (decimal.InvalidOperation, TypeError, ValueError):
+        return value
+
+
+def check_load_format(schema: List[Dict], load_format: str):
+    """
+    Checks if rows of a schema can be loaded from files of a format.
+    Avro files can't hold JSON columns, as the Avro schema of the files is derived from the table schema by Beam.
+
+    :param schema: BigQuery schema
+    :param load_format: json or avro
+    :raises ValueError: if the schema holds a type that the format doesn't support
+    """
+    if load_format != LOAD_FORMAT_AVRO:
+        return
+    for field in schema:
+        if field['type'] == TYPE_JSON:
+            raise ValueError(f'Field {field["name"]} of type JSON can not be loaded from Avro files, '
+                             f'use the json load format')
+        if field['type'] == TYPE_RECORD:
+            check_load_format(field['fields'], load_format)
+
+
+# Python types of the values that don't need a conversion, for types that have a converter
+PLAIN_TYPES = {
+    TYPE_FLOAT: float,
+    TYPE_STRING: str,
+}
+
+TYPE_CONVERTERS = {
+    TYPE_FLOAT: convert_float,
+    TYPE_STRING: convert_string,
+    TYPE_JSON: convert_json,
+    TYPE_TIMESTAMP: convert_timestamp,
+}
+
+AVRO_TYPE_CONVERTERS = {
+    **TYPE_CONVERTERS,
+    TYPE_TIMESTAMP: convert_avro_timestamp,
+    TYPE_DATE: convert_avro_date,
+    TYPE_TIME: convert_avro_time,
+    TYPE_NUMERIC: convert_avro_numeric,
+}
+
+# Converters of the values of every type, per load format
+FORMAT_CONVERTERS = {
+    LOAD_FORMAT_JSON: TYPE_CONVERTERS,
+    LOAD_FORMAT_AVRO: AVRO_TYPE_CONVERTERS,
+}
@@ -1,4 +1,3 @@
-import json
 import logging
 
 from typing import Dict, List
@@ -6,60 +5,88 @@ from typing import Dict, List
 from schematools.bq_types import *
 from schematools.data_detectors import *
 from schematools.exceptions import BQSchemaMergeException
-from schematools.schema_merge import merge_schemas
+from schematools.json_parser import loads
+from schematools.schema_merge import WIDENING_STRICT, merge_schemas
 
 PRIMITIVE_TYPES = [bool, float, int, str]
+
+# Arrays of which all elements have one of these types always have a valid schema
+HOMOGENEOUS_TYPES = {bool, float, int}
+
 logger = logging.getLogger()
 
 
-def extract_schema(json_data: str) -> List[object]:
+def extract_schema(json_data: str, detection: DetectionContext = None, widening: str = WIDENING_STRICT) -> List[object]:
     """
     Extracts schema from a json object.
     Schema is a list of BigQuery schema objects,
     one for every field.
 
     :param json_data: json string
+    :param detection: data detection context, the default detectors are used if omitted
+    :param widening: widening mode for incompatible types of array elements
     :return: a schema
     """
     # Convert to Python dict
-    data = json.loads(json_data)
+    data = loads(json_data)
+
+    return extract_schema_from_dict(data, detection, widening)
+
 
+def extract_schema_from_dict(data: Dict[str, object], detection: DetectionContext = None,
+                             widening: str = WIDENING_STRICT) -> List[object]:
+    """
+    Extracts schema from an already parsed json object.
+    Allows callers that need the parsed document anyway
+    to decode every line only once.
+
+    :param data: JSON document, as a Python dict object
+    :param detection: data detection context, the default detectors are used if omitted
+    :param widening: widening mode for incompatible types of array elements
+    :return: a schema
+    """
     # FUTURE add validation checks
 
     # Extract schema (provide dummy name for top-level)
-    schema = convert_to_bq_schema_complex('toplevel', data)
+    schema = convert_to_bq_schema_complex('toplevel', data, detection, widening=widening)
 
     # Return top-level fields
     return schema['fields']
 
 
-def convert_to_bq_schema_complex(field_name: str, field_value: Dict[str, object]) -> Dict[str, object]:
+def convert_to_bq_schema_complex(field_name: str, field_value: Dict[str, object],
+                                 detection: DetectionContext = None, path: tuple = (),
+                                 widening: str = WIDENING_STRICT) -> Dict[str, object]:
     """
     Converts a complex object into a 'RECORD' BigQuery schema field.
     The type is set to 'RECORD', the mode is set to 'REQUIRED'.
 
     :param field_name: name of the resulting field
     :param field_value: dictionary containing the child objects
+    :param detection: data detection context
+    :param path: field path of the record
+    :param widening: widening mode for incompatible types of array elements
     :return: a 'RECORD' schema entry
     """
     fields = []
     for child_field_name, child_field_value in field_value.items():
+        child_path = path + (child_field_name,)
         # Null fields are skipped
         if child_field_value is None:
             pass
         # Convert primitive fields to schema
         elif is_primitive(child_field_value):
-            field = convert_to_bq_schema_primitive(child_field_name, child_field_value)
+            field = convert_to_bq_schema_primitive(child_field_name, child_field_value, detection, child_path)
             fields.append(field)
         # Convert lists to schema
         elif isinstance(child_field_value, list):
             # Skip empty lists
             if len(child_field_value) > 0:
-                field = convert_to_bq_schema_list(child_field_name, child_field_value)
+                field = convert_to_bq_schema_list(child_field_name, child_field_value, detection, child_path, widening)
                 fields.append(field)
         # Convert complex fields to schema
         else:
-            field = convert_to_bq_schema_complex(child_field_name, child_field_value)
+            field = convert_to_bq_schema_complex(child_field_name, child_field_value, detection, child_path, widening)
             fields.append(field)
 
     return {
@@ -70,7 +97,9 @@ def convert_to_bq_schema_complex(field_name: str, field_value: Dict[str, object]
     }
 
 
-def convert_to_bq_schema_list(field_name: str, field_values: List[object]) -> Dict[str, object]:
+def convert_to_bq_schema_list(field_name: str, field_values: List[object],
+                              detection: DetectionContext = None, path: tuple = (),
+                              widening: str = WIDENING_STRICT) -> Dict[str, object]:
     """
     Converts a list of objects into a 'REPEATED' BigQuery schema field.
     The mode is set to 'REPEATED', the type is based on the schema of the elements.
@@ -78,6 +107,9 @@ def convert_to_bq_schema_list(field_name: str, field_values: List[object]) -> Di
     The schemas for internal elements are merged together
     :param field_name: name of the resulting field
     :param field_values: list of values contained in this field
+    :param detection: data detection context
+    :param path: field path of the list, shared by all elements
+    :param widening: widening mode for incompatible types of the elements
     :return: a 'REPEATED' schema entry
     """
     field_schemas = []
@@ -87,14 +119,14 @@ def convert_to_bq_schema_list(field_name: str, field_values: List[object]) -> Di
             pass
         # Convert primitive fields to schema
         elif is_primitive(field_value):
-            field_schema = convert_to_bq_schema_primitive(field_name, field_value)
+            field_schema = convert_to_bq_schema_primitive(field_name, field_value, detection, path)
             field_schemas.append(field_schema)
         # Nested lists are not allowed
         elif isinstance(field_value, list):
             raise BQSchemaMergeException(f'Nested arrays are not supported: array field {field_name}')
         # Convert complex fields to schema
         else:
-            field_schema = convert_to_bq_schema_complex(field_name, field_value)
+            field_schema = convert_to_bq_schema_complex(field_name, field_value, detection, path, widening)
             field_schemas.append(field_schema)
 
     # Merge all schemas
@@ -102,7 +134,7 @@ def convert_to_bq_schema_list(field_name: str, field_values: List[object]) -> Di
     for current_schema in field_schemas:
         # Wrap new schema in a list, so it resembles a schema of one field
         # Then merge it against the accumulated schema
-        final_schema_container = merge_schemas(final_schema_container, [current_schema])
+        final_schema_container = merge_schemas(final_schema_container, [current_schema], widening)
 
     # Final schema should have one field
     if not final_schema_container or len(final_schema_container) != 1:
@@ -116,17 +148,20 @@ def convert_to_bq_schema_list(field_name: str, field_values: List[object]) -> Di
     return final_schema
 
 
-def convert_to_bq_schema_primitive(field_name: str, field_value: object) -> Dict[str, object]:
+def convert_to_bq_schema_primitive(field_name: str, field_value: object,
+                                   detection: DetectionContext = None, path: tuple = ()) -> Dict[str, object]:
     """
     Converts a primitive value into a primitive, required BigQuery schema field.
 
     :param field_name: name of the resulting field
     :param field_value: a primitive value
+    :param detection: data detection context
+    :param path: field path of the value
     :return: a 'REQUIRED' schema entry with a primitive type
     """
     return {
         'name': field_name,
-        'type': determine_field_type(field_value),
+        'type': determine_field_type(field_value, detection, path),
         'mode': MODE_REQUIRED,
     }
 
@@ -141,11 +176,14 @@ def is_primitive(field_value):
     return type(field_value) in PRIMITIVE_TYPES
 
 
-def determine_field_type(field_value: object) -> str:
+def determine_field_type(field_value: object, detection: DetectionContext = None, path: tuple = ()) -> str:
     """
     Extracts the field type of a value based on its Python type.
+    Strings are passed to the data detectors for more specific types.
 
     :param field_value: the value of the field
+    :param detection: data detection context, the default detectors are used if omitted
+    :param path: field path of the value
     :return: the inferred BigQuery field type, as a string
     """
 
@@ -159,18 +197,40 @@ def determine_field_type(field_value: object) -> str:
         return TYPE_INTEGER
     elif isinstance(field_value, str):
         # Check for specialized string fields
-        # FUTURE use a "data detector" system that uses injection
-        if is_timestamp(field_value):
-            return TYPE_TIMESTAMP
-        elif is_date(field_value):
-            return TYPE_DATE
-        elif is_time(field_value):
-            return TYPE_TIME
-
-        return TYPE_STRING
+        if detection is None:
+            return DEFAULT_REGISTRY.detect(field_value)
+        return detection.detect(path, field_value)
 
     logger.warning(f'Failed to detect type of {field_value}, falling back to {TYPE_STRING} type...')
 
     # Fall back to string type
     return TYPE_STRING
 
+
+def validate_document(data: object, detection: DetectionContext = None, widening: str = WIDENING_STRICT):
+    """
+    Checks that a schema can be extracted from a json document, without extracting it.
+    Only arrays can make extraction fail (nested arrays, elements of incompatible types),
+    so only arrays that don't consist of numbers or booleans of a single type are extracted.
+
+    :param data: JSON document
+    :param detection: data detection context, should be the one used for extraction
+    :param widening: widening mode, should be the one used for extraction
+    :raises ValueError: if the document is not a JSON object
+    :raises BQSchemaMergeException: if no schema can be extracted from the document
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f'JSON document is not an object but {type(data).__name__}')
+    validate_record(data, detection, (), widening)
+
+
+def validate_record(data: Dict[str, object], detection: DetectionContext, path: tuple, widening: str):
+    for field_name, field_value in data.items():
+        value_type = type(field_value)
+        if value_type is dict:
+            validate_record(field_value, detection, path + (field_name,), widening)
+        elif value_type is list and len(field_value) > 0:
+            element_type = type(field_value[0])
+            if element_type in HOMOGENEOUS_TYPES and all(type(element) is element_type for element in field_value):
+                continue
+            convert_to_bq_schema_list(field_name, field_value, detection, path + (field_name,), widening)
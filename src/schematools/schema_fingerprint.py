@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+from schematools.data_detectors import DetectionContext
+from schematools.schema_extraction import determine_field_type, is_primitive
+
+FINGERPRINT_RECORD = 'RECORD'
+FINGERPRINT_LIST = 'LIST'
+
+
+def schema_fingerprint(data: Dict[str, object], detection: DetectionContext = None) -> Hashable:
+    """
+    Computes a structural fingerprint of a json document.
+    The fingerprint captures the key paths (in order), the Python types
+    and the detected string types, but none of the actual values.
+    Documents with an equal fingerprint yield an equal schema,
+    so the fingerprint can be used to skip repeated schema extraction.
+
+    :param data: JSON document, as a Python dict object
+    :param detection: data detection context, should be the one used for extraction
+    :return: a hashable fingerprint
+    """
+    return fingerprint_value(data, detection, ())
+
+
+def fingerprint_value(value: object, detection: DetectionContext = None, path: tuple = ()) -> Hashable:
+    """
+    Recursively computes the fingerprint of a single json value.
+
+    :param value: a json value
+    :param detection: data detection context
+    :param path: field path of the value
+    :return: a hashable fingerprint
+    """
+    if value is None:
+        return None
+    elif is_primitive(value):
+        return determine_field_type(value, detection, path)
+    elif isinstance(value, list):
+        # Repeated element shapes do not influence the schema,
+        # so only keep the unique ones (in order of appearance)
+        element_fingerprints = dict.fromkeys(fingerprint_value(element, detection, path) for element in value)
+        return FINGERPRINT_LIST, tuple(element_fingerprints)
+    else:
+        return FINGERPRINT_RECORD, tuple(
+            (key, fingerprint_value(child, detection, path + (key,))) for key, child in value.items()
+        )
+
+
+class ShapeCache(object):
+    """
+    Bounded LRU set of document fingerprints.
+    Keeps track of the hits and misses, so the
+    effectiveness of the cache can be reported.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints = OrderedDict()
+
+    def lookup(self, fingerprint: Hashable) -> bool:
+        """
+        Checks if a fingerprint was seen before and marks it as recently used.
+
+        :param fingerprint: document fingerprint
+        :return: True iff the fingerprint is present in the cache
+        """
+        if fingerprint in self._fingerprints:
+            self._fingerprints.move_to_end(fingerprint)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def add(self, fingerprint: Hashable):
+        """
+        Adds a fingerprint to the cache, evicting the least recently used one if needed.
+
+        :param fingerprint: document fingerprint
+        """
+        self._fingerprints[fingerprint] = None
+        self._fingerprints.move_to_end(fingerprint)
+        if len(self._fingerprints) > self.max_size:
+            self._fingerprints.popitem(last=False)
+
+    def __len__(self):
+        return len(self._fingerprints)
@@ -2,14 +2,25 @@ from schematools.bq_types import *
 from schematools.exceptions import BQSchemaMergeException
 from typing import Dict, List
 
+# Widening modes, i.e. how conflicts between incompatible types are resolved
+WIDENING_STRICT = 'strict'
+WIDENING_STRING = 'string'
+WIDENING_JSON = 'json'
 
-def merge_schemas(schema1: List[Dict], schema2: List[Dict]):
+WIDENING_MODES = [WIDENING_STRICT, WIDENING_STRING, WIDENING_JSON]
+
+# Strict mode of runs with dead letters, not an option of its own (see `dead_letter_widening`)
+WIDENING_RECORD = 'record'
+
+
+def merge_schemas(schema1: List[Dict], schema2: List[Dict], widening: str = WIDENING_STRICT):
     """
     Merges two schemas into a relaxed one that is compatible with both.
     Schemas are provided as a list of field schemas.
 
     :param schema1: first BigQuery schema
     :param schema2: second BigQuery schema
+    :param widening: widening mode for incompatible types, see `determine_common_type`
     :return: merged BigQuery schema
     """
     if schema1 is None:
@@ -17,15 +28,139 @@ def merge_schemas(schema1: List[Dict], schema2: List[Dict]):
     if schema2 is None:
         return schema1
 
-    return merge_schema_fields_rec(schema1, schema2)
+    return merge_schema_fields_rec(schema1, schema2, widening)
+
+
+def merge_schema_list(schemas: List[List[Dict]], widening: str = WIDENING_STRICT) -> List[Dict]:
+    """
+    Merges any number of schemas into a relaxed one that is compatible with all of them,
+    in a single pass over the fields.
+    The result is equivalent to merging the schemas one by one, but fields are
+    ordered by first appearance.
+
+    :param schemas: list of BigQuery schemas
+    :param widening: widening mode for incompatible types, see `determine_common_type`
+    :return: merged BigQuery schema
+    """
+    schemas = [schema for schema in schemas if schema is not None]
+    if len(schemas) == 0:
+        return None
+    if len(schemas) == 1:
+        return schemas[0]
+
+    return merge_schema_fields_nway(schemas, widening)
+
+
+def merge_schema_fields_nway(schemas: List[List[Dict]], widening: str = WIDENING_STRICT) -> List[Dict]:
+    """
+    Recursively merges any number of lists of field schemas.
+    Fields that do not appear in every list are relaxed to nullable.
+
+    :param schemas: list of BigQuery schemas
+    :param widening: widening mode for incompatible types
+    :return: merged BigQuery schema
+    """
+
+    # Group the fields by name, in order of first appearance
+    fields_by_name = {}
+    for schema in schemas:
+        for field in schema:
+            fields_by_name.setdefault(field['name'], []).append(field)
+
+    merged_fields = []
+    for fields in fields_by_name.values():
+        merged_field = merge_field_group(fields, widening)
+
+        # Fields that are missing in some schemas can't be required
+        if len(fields) < len(schemas) and merged_field['mode'] == MODE_REQUIRED:
+            merged_field = dict(merged_field)
+            merged_field['mode'] = MODE_NULLABLE
+
+        merged_fields.append(merged_field)
+
+    return merged_fields
+
+
+def merge_field_group(fields: List[Dict], widening: str = WIDENING_STRICT) -> Dict[str, object]:
+    """
+    Merges a group of field schemas with the same name.
+    Records that conflict with primitive fields are merged one by one, so they can be widened.
+
+    :param fields: schema entries of the same field
+    :param widening: widening mode for incompatible types
+    :return: the merged schema entry
+    """
+    if len(fields) == 1:
+        return fields[0]
+
+    record_count = sum(1 for field in fields if field['type'] == TYPE_RECORD)
+
+    # Merge complex types, mode is taken from the first field
+    if record_count == len(fields):
+        result = dict(fields[0])
+        result['fields'] = merge_schema_fields_nway([field['fields'] for field in fields], widening)
+        return result
+
+    # Merge primitive types, or widen records and primitive types
+    result = fields[0]
+    for field in fields[1:]:
+        result = merge_record_schemas(result, field, widening)
+    return result
+
+
+def normalize_schema(schema: List[Dict]) -> Dict[str, tuple]:
+    """
+    Converts a schema into a form that ignores field order and any attributes
+    other than name, type, mode and nested fields.
+
+    :param schema: BigQuery schema
+    :return: dictionary mapping field names to (type, mode, normalized nested fields)
+    """
+    return {
+        field['name']: (field['type'], field.get('mode', MODE_NULLABLE), normalize_schema(field.get('fields') or []))
+        for field in schema
+    }
+
+
+def relax_schema(schema: List[Dict]) -> List[Dict]:
+    """
+    Relaxes all REQUIRED fields of a schema to NULLABLE, e.g. for a schema that was inferred from a sample,
+    as fields that are present in every sampled document can be missing in the others.
 
+    :param schema: BigQuery schema
+    :return: relaxed copy of the schema
+    """
+    relaxed = []
+    for field in schema:
+        field = dict(field)
+        if field.get('mode') == MODE_REQUIRED:
+            field['mode'] = MODE_NULLABLE
+        if field.get('fields'):
+            field['fields'] = relax_schema(field['fields'])
+        relaxed.append(field)
+    return relaxed
+
+
+def schemas_equal(schema1: List[Dict], schema2: List[Dict]) -> bool:
+    """
+    Structurally compares two schemas, field order and descriptions are not taken into account.
+
+    :param schema1: first BigQuery schema
+    :param schema2: second BigQuery schema
+    :return: True iff both schemas define the same fields
+    """
+    if schema1 is None or schema2 is None:
+        return schema1 is schema2
+    return normalize_schema(schema1) == normalize_schema(schema2)
 
-def merge_schema_fields_rec(schema1: List[Dict], schema2: List[Dict]) -> List[Dict]:
+
+def merge_schema_fields_rec(schema1: List[Dict], schema2: List[Dict], widening: str = WIDENING_STRICT) -> List[Dict]:
     """
     Recursively merges two lists of field schemas.
 
     :param schema1: first BigQuery schema
     :param schema2: second BigQuery schema
+    :param widening: widening mode for incompatible types
     :return: merged BigQuery schema
     """
 
@@ -42,56 +177,73 @@ def merge_schema_fields_rec(schema1: List[Dict], schema2: List[Dict]) -> List[Di
 
     # Inverse base case
     elif len(schema1) == 0:
-        return merge_schema_fields_rec(schema2, schema1)
+        return merge_schema_fields_rec(schema2, schema1, widening)
 
     # Recursive case
     else:
 
+        # Index the fields of the second schema by name,
+        # so matching is linear in the width of the schemas
+        fields2_by_name = index_fields(schema2)
+
         merged_fields = []
+        unique_fields = []
 
         # Combine all fields that appear in both schemas
-        # Note: field order does not matter
-        for field1, field2 in get_matching_fields(schema1, schema2):
-            merged_field = merge_record_schemas(field1, field2)
-            merged_fields.append(merged_field)
-            # field = merge_complex_schemas()
+        # Note: field order does not matter, but is kept deterministic:
+        # matching fields first, then the unique ones of each side
+        for field1 in schema1:
+            field2 = fields2_by_name.get(field1['name'])
+            if field2 is None:
+                unique_fields.append(field1)
+            else:
+                merged_field = merge_record_schemas(field1, field2, widening)
+                merged_fields.append(merged_field)
+
+        # Fields that only appear in the second schema
+        if len(merged_fields) < len(fields2_by_name):
+            fieldnames1 = {field['name'] for field in schema1}
+            unique_fields.extend(field for field in schema2 if field['name'] not in fieldnames1)
 
         # Nullify all fields that are in one side only
         # Note we abuse a recursive call here, as the base case deals with this situation
-        unique_fields = list(get_nonmatching_fields(schema1, schema2))
         merged_unique_fields = merge_schema_fields_rec(unique_fields, [])
 
         return merged_fields + merged_unique_fields
 
 
-def merge_record_schemas(field1: Dict[str, object], field2: Dict[str, object]) -> Dict[str, object]:
+def merge_record_schemas(field1: Dict[str, object], field2: Dict[str, object],
+                         widening: str = WIDENING_STRICT) -> Dict[str, object]:
     # Merge and add complex types
     if field1['type'] == TYPE_RECORD and field2['type'] == TYPE_RECORD:
-        return merge_record_field_schemas(field1, field2)
+        return merge_record_field_schemas(field1, field2, widening)
 
-    # Merge and add primitive types
-    elif field1['type'] != TYPE_RECORD and field2['type'] != TYPE_RECORD:
-        return merge_primitive_schemas(field1, field2)
+    # A record that conflicts with a primitive type is kept as is, with its own mode
+    elif widening == WIDENING_RECORD and TYPE_RECORD in (field1['type'], field2['type']):
+        return field1 if field1['type'] == TYPE_RECORD else field2
 
-    # Otherwise raise an exception
+    # Merge and add primitive types,
+    # a record and a primitive type can only be merged by widening them into a primitive type
     else:
-        raise BQSchemaMergeException(f'Cannot merge record and primitive types')
+        return merge_primitive_schemas(field1, field2, widening)
 
 
-def merge_record_field_schemas(field1: Dict[str, object], field2: Dict[str, object]) -> Dict[str, object]:
+def merge_record_field_schemas(field1: Dict[str, object], field2: Dict[str, object],
+                               widening: str = WIDENING_STRICT) -> Dict[str, object]:
     # Extract the fields from both field schemas
     field1_schema = field1['fields']
     field2_schema = field2['fields']
 
     # Merge the fields and replace old version
-    merged_subfields = merge_schema_fields_rec(field1_schema, field2_schema)
+    merged_subfields = merge_schema_fields_rec(field1_schema, field2_schema, widening)
     result = dict(field1)
     result['fields'] = merged_subfields
 
     return result
 
 
-def merge_primitive_schemas(schema1: Dict[str, object], schema2: Dict[str, object]) -> Dict[str, object]:
+def merge_primitive_schemas(schema1: Dict[str, object], schema2: Dict[str, object],
+                            widening: str = WIDENING_STRICT) -> Dict[str, object]:
     """
     Merges two primitive BigQuery field schemas.
     We assume the name of both fields is equal.
@@ -100,6 +252,7 @@ def merge_primitive_schemas(schema1: Dict[str, object], schema2: Dict[str, objec
 
     :param schema1: schema entry of first primitive field
     :param schema2: schema entry of second primitive field
+    :param widening: widening mode for incompatible types, see `determine_common_type`
     :return: the merged schema
     """
 
@@ -107,7 +260,7 @@ def merge_primitive_schemas(schema1: Dict[str, object], schema2: Dict[str, objec
         raise BQSchemaMergeException(f'Cannot merge fields with different names!')
 
     field_name = schema1['name']
-    common_type = determine_common_type(schema1['type'], schema2['type'])
+    common_type = determine_common_type(schema1['type'], schema2['type'], widening)
     common_mode = determine_common_mode(schema1['mode'], schema2['mode'])
 
     return {
@@ -116,56 +269,65 @@ def merge_primitive_schemas(schema1: Dict[str, object], schema2: Dict[str, objec
         'mode': common_mode,
     }
 
-def get_matching_fields(schema1: List[Dict], schema2: List[Dict]) -> List[Dict]:
-    """
-    Yields all top-level fields that appear in both schemas.
-
-    :param schema1: first BigQuery schema
-    :param schema2: second BigQuery schema
-    :return: fields that appear in both schemas (top-level)
-    """
-    for field1 in schema1:
-        for field2 in schema2:
-            if field1['name'] == field2['name']:
-                yield (field1, field2)
-
 
-def get_nonmatching_fields(schema1: List[Dict], schema2: List[Dict]) -> List[Dict]:
+def index_fields(schema: List[Dict]) -> Dict[str, Dict]:
     """
-    Yields all top-level fields that appear in only one schema.
+    Indexes the top-level fields of a schema by name.
 
-    :param schema1: first BigQuery schema
-    :param schema2: second BigQuery schema
-    :return: fields that appear in one of the schemas (top-level)
+    :param schema: BigQuery schema
+    :return: dictionary mapping field names to field schemas
     """
+    return {field['name']: field for field in schema}
 
-    # Determine sets of unique top-level field names for both schemas
-    fieldnames1 = {field['name'] for field in schema1}
-    fieldnames2 = {field['name'] for field in schema2}
 
-    # Yield unique fields on the left
-    for field in schema1:
-        if field['name'] not in fieldnames2:
-            yield field
-
-    # Yield unique fields on the right
-    for field in schema2:
-        if field['name'] not in fieldnames1:
-            yield field
+TYPE_MAP = {
+    frozenset([TYPE_INTEGER, TYPE_FLOAT]): TYPE_FLOAT,
+    # Detected types are strings in the source data
+    **{frozenset([detected_type, TYPE_STRING]): TYPE_STRING for detected_type in DETECTED_STRING_TYPES},
+}
 
+# Every widening mode is a lattice on top of the strict coercions:
+# - string: all other conflicts (also record vs primitive) are widened to STRING
+# - json: primitive conflicts are widened to STRING, conflicts with a record or JSON to JSON
+# - record: conflicts of a record with a primitive type keep the record, other conflicts are not resolved
+TYPE_LATTICES = {
+    WIDENING_STRICT: TYPE_MAP,
+    WIDENING_RECORD: {
+        **TYPE_MAP,
+        **{frozenset([TYPE_RECORD, other_type]): TYPE_RECORD for other_type in ALL_TYPES if other_type != TYPE_RECORD},
+    },
+    WIDENING_STRING: {
+        **{frozenset([type1, type2]): TYPE_STRING for type1 in ALL_TYPES for type2 in ALL_TYPES if type1 != type2},
+        **TYPE_MAP,
+    },
+    WIDENING_JSON: {
+        **{frozenset([type1, type2]): TYPE_STRING for type1 in ALL_TYPES for type2 in ALL_TYPES if type1 != type2},
+        **TYPE_MAP,
+        **{frozenset([type1, type2]): TYPE_JSON for type1 in [TYPE_RECORD, TYPE_JSON] for type2 in ALL_TYPES
+           if type1 != type2},
+    },
+}
 
 
+def dead_letter_widening(widening: str) -> str:
+    """
+    Determines the widening mode of a run with dead letters.
+    In strict mode, a field that is a record in some documents and a primitive type in others can't be widened,
+    the record is kept instead (see `WIDENING_RECORD`), so the documents with a primitive value
+    don't fit the schema and become dead letters when they are converted to it (see `compile_converter`).
 
-TYPE_MAP = {
-    frozenset([TYPE_INTEGER, TYPE_FLOAT]): TYPE_FLOAT
-}
+    :param widening: widening mode of the run
+    :return: widening mode of the schema inference
+    """
+    return WIDENING_RECORD if widening == WIDENING_STRICT else widening
 
 
-def determine_common_type(type1: str, type2: str) -> str:
+def determine_common_type(type1: str, type2: str, widening: str = WIDENING_STRICT) -> str:
     """
     Based on type coercion doc on https://cloud.google.com/bigquery/docs/reference/standard-sql/conversion_rules#casting
     :param type1: type of first value
     :param type2: type of second value
+    :param widening: widening mode, determines which conflicts are widened instead of raising an exception
     :return: common type, if available
     """
     try:
@@ -173,8 +335,10 @@ def determine_common_type(type1: str, type2: str) -> str:
         # If there is only one element in the set, they must be equal
         if len(type_set) == 1:
             return type1  # or: next(iter(mode_set))
-        return TYPE_MAP[frozenset([type1, type2])]
+        return TYPE_LATTICES[widening][type_set]
     except KeyError:
+        if TYPE_RECORD in type_set:
+            raise BQSchemaMergeException('Cannot merge record and primitive types')
         raise BQSchemaMergeException(f'Incompatible types encountered while merging: {type1}, {type2}')
 
 
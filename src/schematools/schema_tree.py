@@ -0,0 +1,192 @@
+from typing import Dict, List
+
+from schematools.bq_types import *
+from schematools.schema_merge import WIDENING_STRICT, determine_common_mode, determine_common_type
+
+# Compact integer codes for every combination of type and mode
+TYPE_MODES = [(type, mode) for type in ALL_TYPES for mode in ALL_MODES]
+TYPE_MODE_CODES = {type_mode: code for code, type_mode in enumerate(TYPE_MODES)}
+
+
+class SchemaNode(object):
+    """
+    Mutable tree representation of a BigQuery schema, used to merge schemas in place.
+
+    Every node keeps track of the number of merged schemas it appeared in.
+    A field is only required if it appeared in every occurrence of its parent,
+    so modes are relaxed when converting back to a BigQuery schema, not while merging.
+    The root node represents the top-level record.
+
+    Conflicting types are resolved according to a widening mode (see `determine_common_type`),
+    a record that is widened into a primitive type loses its children.
+    A record that is kept in a conflict with a primitive type (see `WIDENING_RECORD`) ignores the primitive values.
+    """
+
+    __slots__ = ('name', 'type', 'mode', 'count', 'children')
+
+    def __init__(self, name: str = None, type: str = TYPE_RECORD, mode: str = MODE_REQUIRED, count: int = 0):
+        self.name = name
+        self.type = type
+        self.mode = mode
+        self.count = count
+        self.children = {} if type == TYPE_RECORD else None
+
+    @classmethod
+    def from_schema(cls, schema: List[Dict], count: int = 1) -> 'SchemaNode':
+        """
+        Builds a root node from a BigQuery schema.
+
+        :param schema: BigQuery schema
+        :param count: number of times the schema was observed
+        :return: a root node
+        """
+        root = cls()
+        root.merge_schema(schema, count)
+        return root
+
+    def merge_schema(self, schema: List[Dict], count: int = 1, widening: str = WIDENING_STRICT):
+        """
+        Merges a BigQuery schema into this (root) node.
+
+        :param schema: BigQuery schema
+        :param count: number of times the schema was observed
+        :param widening: widening mode for incompatible types
+        """
+        self.count += count
+        self.merge_fields(schema, count, widening)
+
+    def merge_fields(self, fields: List[Dict], count: int, widening: str = WIDENING_STRICT):
+        children = self.children
+        for field in fields:
+            child = children.get(field['name'])
+            if child is None:
+                child = SchemaNode(field['name'], field['type'], field['mode'])
+                children[child.name] = child
+            child.merge_field(field, count, widening)
+
+    def merge_field(self, field: Dict[str, object], count: int, widening: str = WIDENING_STRICT):
+        """
+        Merges a single BigQuery field schema into this node.
+
+        :param field: field schema with the same name as this node
+        :param count: number of times the field was observed
+        :param widening: widening mode for incompatible types
+        """
+        field_type = field['type']
+        if field_type != self.type:
+            self.widen(field_type, field['mode'], widening)
+
+        self.count += count
+        if self.type == TYPE_RECORD:
+            # Mode of a record is taken from the first occurrence, primitive values of a kept record are ignored
+            if field_type == TYPE_RECORD:
+                self.merge_fields(field['fields'], count, widening)
+        elif field['mode'] != self.mode:
+            self.mode = determine_common_mode(self.mode, field['mode'])
+
+    def merge_node(self, other: 'SchemaNode', widening: str = WIDENING_STRICT):
+        """
+        Merges another node into this one, in place.
+        Subtrees of the other node may be adopted, so it should not be used afterwards.
+
+        :param other: node with the same name
+        :param widening: widening mode for incompatible types
+        """
+        if other.type != self.type:
+            self.widen(other.type, other.mode, widening)
+
+        self.count += other.count
+        if self.type == TYPE_RECORD:
+            if other.children is None:
+                return
+            children = self.children
+            for name, other_child in other.children.items():
+                child = children.get(name)
+                if child is None:
+                    children[name] = other_child
+                else:
+                    child.merge_node(other_child, widening)
+        elif other.mode != self.mode:
+            self.mode = determine_common_mode(self.mode, other.mode)
+
+    def widen(self, other_type: str, other_mode: str, widening: str):
+        """
+        Changes the type of this node into the common type of its own and another type.
+
+        :param other_type: type to merge with
+        :param other_mode: mode of the other type
+        :param widening: widening mode for incompatible types
+        """
+        common_type = determine_common_type(self.type, other_type, widening)
+        # Records that are widened into a primitive type lose their children
+        if common_type != TYPE_RECORD:
+            self.children = None
+        # Primitive types that are replaced by a record (see `WIDENING_RECORD`) take its mode
+        elif self.type != TYPE_RECORD:
+            self.children = {}
+            self.mode = other_mode
+        self.type = common_type
+
+    def size(self) -> int:
+        """
+        Counts the nodes in the subtree, a measure of the memory and shuffle size of an accumulator.
+
+        :return: number of nodes, including this one
+        """
+        if self.children is None:
+            return 1
+        return 1 + sum(child.size() for child in self.children.values())
+
+    def to_schema(self) -> List[Dict]:
+        """
+        Converts the children of this node into a BigQuery schema.
+
+        :return: BigQuery schema
+        """
+        schema = []
+        for child in self.children.values():
+            mode = child.mode
+            # Fields that are missing in some occurrences of the parent can't be required
+            if mode == MODE_REQUIRED and child.count < self.count:
+                mode = MODE_NULLABLE
+
+            field = {
+                'name': child.name,
+                'type': child.type,
+                'mode': mode,
+            }
+            if child.type == TYPE_RECORD:
+                field['fields'] = child.to_schema()
+            schema.append(field)
+        return schema
+
+    def pack(self) -> tuple:
+        """
+        Converts the subtree into nested tuples, the compact form used for pickling.
+        Type and mode are encoded into a single small integer when possible.
+
+        :return: nested tuples describing the subtree
+        """
+        code = TYPE_MODE_CODES.get((self.type, self.mode), (self.type, self.mode))
+        if self.children is None:
+            return self.name, code, self.count
+        return self.name, code, self.count, tuple(child.pack() for child in self.children.values())
+
+    @classmethod
+    def unpack(cls, packed: tuple) -> 'SchemaNode':
+        """
+        Restores a subtree from its packed form.
+
+        :param packed: nested tuples, as returned by `pack`
+        :return: the restored node
+        """
+        name, code, count = packed[:3]
+        type, mode = TYPE_MODES[code] if isinstance(code, int) else code
+        node = cls(name, type, mode, count)
+        if len(packed) > 3:
+            node.children = {child[0]: cls.unpack(child) for child in packed[3]}
+        return node
+
+    def __reduce__(self):
+        # Pickle the whole tree as plain tuples, rather than one object per node
+        return self.unpack, (self.pack(),)
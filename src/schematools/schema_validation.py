@@ -0,0 +1,118 @@
+from typing import Dict, List, Tuple
+
+from schematools.bq_types import *
+from schematools.data_detectors import DEFAULT_REGISTRY, DetectorRegistry
+from schematools.schema_extraction import is_primitive
+
+# Python types that fit a BigQuery type without widening it
+COMPATIBLE_TYPES = {
+    bool: {TYPE_BOOLEAN},
+    int: {TYPE_INTEGER, TYPE_FLOAT},
+    float: {TYPE_FLOAT},
+}
+
+SchemaIndex = Tuple[Dict[str, tuple], List[str]]
+
+
+def index_schema(schema: List[Dict]) -> SchemaIndex:
+    """
+    Converts a BigQuery schema into a structure that allows fast lookups by field name.
+    Every level consists of a dictionary mapping field names to (type, mode, nested index)
+    and a list of required field names.
+
+    :param schema: BigQuery schema
+    :return: schema index
+    """
+    fields = {}
+    required = []
+    for field in schema:
+        nested = index_schema(field['fields']) if field['type'] == TYPE_RECORD else None
+        fields[field['name']] = (field['type'], field['mode'], nested)
+        if field['mode'] == MODE_REQUIRED:
+            required.append(field['name'])
+    return fields, required
+
+
+def fits_schema(data: Dict[str, object], schema_index: SchemaIndex, registry: DetectorRegistry = None) -> bool:
+    """
+    Checks if a json document is subsumed by a schema,
+    i.e. merging the schema of the document into it would not change the schema.
+
+    :param data: JSON document, as a Python dict object
+    :param schema_index: index of the schema, see `index_schema`
+    :param registry: data detectors used for schema extraction
+    :return: True iff the document fits the schema
+    """
+    return fits_record(data, schema_index, registry or DEFAULT_REGISTRY)
+
+
+def fits_record(data: Dict[str, object], schema_index: SchemaIndex, registry: DetectorRegistry) -> bool:
+    fields, required = schema_index
+
+    # Required fields must be present
+    for name in required:
+        value = data.get(name)
+        if value is None or (isinstance(value, list) and len(value) == 0):
+            return False
+
+    for name, value in data.items():
+        # Null values and empty lists don't add anything to the schema
+        if value is None or (isinstance(value, list) and len(value) == 0):
+            continue
+
+        field = fields.get(name)
+        if field is None:
+            return False
+
+        field_type, field_mode, nested = field
+        if isinstance(value, list):
+            if field_mode != MODE_REPEATED:
+                return False
+            for element in value:
+                if element is not None and not fits_value(element, field_type, nested, registry):
+                    return False
+        elif field_mode == MODE_REPEATED or not fits_value(value, field_type, nested, registry):
+            return False
+
+    return True
+
+
+def fits_value(value: object, field_type: str, nested: SchemaIndex, registry: DetectorRegistry) -> bool:
+    if isinstance(value, str):
+        # Any detected type would be widened to STRING
+        return field_type == TYPE_STRING or registry.detect(value) == field_type
+    elif is_primitive(value):
+        return field_type in COMPATIBLE_TYPES[type(value)]
+    elif isinstance(value, dict):
+        return field_type == TYPE_RECORD and fits_record(value, nested, registry)
+
+    # Nested lists can't be represented
+    return False
+
+
+def find_unknown_fields(data: Dict[str, object], schema_index: SchemaIndex, prefix: str = '') -> List[str]:
+    """
+    Finds the fields of a json document that are not in a schema, and would be dropped when it is converted to it
+    (see `compile_converter`). Null values and empty lists are ignored, they don't hold any data.
+
+    :param data: JSON document, as a Python dict object
+    :param schema_index: index of the schema, see `index_schema`
+    :param prefix: path of the document, for nested records
+    :return: dot separated paths of the unknown fields
+    """
+    fields = schema_index[0]
+    unknown = []
+    for name, value in data.items():
+        if value is None or (isinstance(value, list) and len(value) == 0):
+            continue
+        field = fields.get(name)
+        if field is None:
+            unknown.append(prefix + name)
+            continue
+
+        nested = field[2]
+        if nested is not None:
+            for element in (value if isinstance(value, list) else [value]):
+                if isinstance(element, dict):
+                    unknown.extend(find_unknown_fields(element, nested, f'{prefix}{name}.'))
+    return unknown
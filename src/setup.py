@@ -3,11 +3,18 @@ import setuptools
 REQUIRED_PACKAGES = [
 ]
 
+# Native JSON parsers, the standard library parser is used if none is installed (see `--json_parser`)
+EXTRAS = {
+    'orjson': ['orjson>=3.0'],
+    'simdjson': ['pysimdjson>=3.0'],
+}
+
 
 setuptools.setup(
     name='json2bq',
     version='0.0.1',
     description='JSON to BQ loader with built-in schema unification',
     install_requires=REQUIRED_PACKAGES,
+    extras_require=EXTRAS,
     packages=setuptools.find_packages(),
 )
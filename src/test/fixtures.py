@@ -0,0 +1,17 @@
+import json
+import os
+
+
+def write_jsonl(directory: str, name: str, documents) -> str:
+    """
+    Writes json documents as a JSONL file, without a trailing newline.
+
+    :param directory: directory of the file
+    :param name: name of the file
+    :param documents: json documents, as Python objects
+    :return: path of the file
+    """
+    path = os.path.join(directory, name)
+    with open(path, 'w') as outfile:
+        outfile.write('\n'.join(json.dumps(document) for document in documents))
+    return path
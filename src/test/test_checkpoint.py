@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from json2bq.checkpoint import changed_files, checkpoint_files, commit_checkpoint, list_files, load_checkpoint, \
+    unprocessed_files, write_checkpoint
+from test.fixtures import write_jsonl
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp_dir.name, 'input')
+        os.mkdir(self.input_dir)
+        self.checkpoint = os.path.join(self.tmp_dir.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_incremental_runs(self):
+        schema = [{"name": "a", "type": "INTEGER", "mode": "NULLABLE"}]
+        write_jsonl(self.input_dir, 'a.jsonl', [{"a": 1}])
+        write_jsonl(self.input_dir, 'b.jsonl', [{"a": 2}])
+        pattern = os.path.join(self.input_dir, '*.jsonl')
+
+        # First run: all files are new
+        checkpoint = load_checkpoint(self.checkpoint)
+        files = list_files(pattern)
+        self.assertIsNone(checkpoint['schema'])
+        self.assertEqual(sorted(files), unprocessed_files(files, checkpoint))
+        write_checkpoint(schema, self.checkpoint, files)
+        # The checkpoint is only replaced once it is committed
+        self.assertIsNone(load_checkpoint(self.checkpoint)['schema'])
+        commit_checkpoint(self.checkpoint)
+
+        # Next run: only new files, changed files are skipped as their rows were already loaded
+        previous_files = files
+        write_jsonl(self.input_dir, 'b.jsonl', [{"a": 2}, {"a": 3}])
+        write_jsonl(self.input_dir, 'c.jsonl', [{"a": 4}])
+        checkpoint = load_checkpoint(self.checkpoint)
+        files = list_files(pattern)
+        self.assertEqual(schema, checkpoint['schema'])
+        self.assertEqual([os.path.join(self.input_dir, 'c.jsonl')], unprocessed_files(files, checkpoint))
+        self.assertEqual([os.path.join(self.input_dir, 'b.jsonl')], changed_files(files, checkpoint))
+
+        # Changed files keep their previous metadata, so they are reported again by the next run
+        next_files = checkpoint_files(files, checkpoint)
+        b_path = os.path.join(self.input_dir, 'b.jsonl')
+        self.assertEqual(previous_files[b_path], next_files[b_path])
+        self.assertEqual([b_path], changed_files(files, {'files': next_files}))
+
+    def test_load_checkpoint_version(self):
+        with open(self.checkpoint, 'w') as outfile:
+            json.dump({"version": 0, "files": {}, "schema": None}, outfile)
+
+        with self.assertRaises(ValueError):
+            load_checkpoint(self.checkpoint)
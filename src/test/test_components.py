@@ -0,0 +1,552 @@
+import datetime
+import json
+import os
+import tempfile
+import zlib
+from unittest import TestCase
+
+import apache_beam as beam
+import fastavro
+from apache_beam.io.gcp.bigquery_tools import AvroRowWriter
+from apache_beam.options.pipeline_options import PipelineOptions, StandardOptions
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.testing.test_stream import TestStream
+from apache_beam.testing.util import assert_that, equal_to
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from json2bq.components import DEAD_LETTER_TAG, CastToRoutedSchemaFn, CastToRunningSchemaFn, CastToSchemaFn, \
+    ExtractKeyedSchemaFn, ExtractSchemaFn, ExtractUnmatchedKeyedSchemaFn, ExtractUnmatchedSchemaFn, HoldPendingRows, \
+    LimitSamplePerFile, ParseJsonFn, add_bq_table_schema, clean_schema, create_bq_table, create_keyed_bq_table, \
+    failed_row_dead_letter, prep_routed_schema, prep_schema, route_table, load_schema, route_table_spec, \
+    to_schema_fields
+from json2bq.schema_accumulator import SchemaCombinerFn
+from schematools.exceptions import BQSchemaMergeException
+from schematools.schema_merge import WIDENING_RECORD
+
+
+class FakeBigQueryClient(object):
+    """
+    In-memory replacement of the BigQuery client, records all API calls.
+    """
+
+    def __init__(self, tables=None):
+        self.tables = {table_id: bigquery.Table(table_id, schema=to_schema_fields(schema))
+                       for table_id, schema in (tables or {}).items()}
+        self.calls = []
+
+    def get_table(self, table_id):
+        self.calls.append('get_table')
+        if table_id not in self.tables:
+            raise NotFound(f'Table {table_id} not found')
+        return self.tables[table_id]
+
+    def create_table(self, table):
+        self.calls.append('create_table')
+        self.tables[f'{table.project}.{table.dataset_id}.{table.table_id}'] = table
+
+    def update_table(self, table, fields):
+        self.calls.append('update_table')
+
+
+class TestComponents(TestCase):
+
+    def test_extract_schema_skips_repeated_shapes(self):
+        documents = [
+            {"a": 1},
+            {"a": 2},
+            {"a": 3, "b": "x"},
+            {"a": 4},
+        ]
+
+        with TestPipeline() as p:
+            schemas = (p
+                       | beam.Create(documents, reshuffle=False)
+                       | beam.ParDo(ExtractSchemaFn())
+                       )
+
+            assert_that(schemas, equal_to([
+                [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+                [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"},
+                 {"name": "b", "type": "STRING", "mode": "REQUIRED"}],
+            ]))
+
+    def test_extract_schema_counts_skipped_detections_once(self):
+        extract_fn = ExtractSchemaFn(collect_stats=True)
+        extract_fn.setup()
+        extract_fn.start_bundle()
+
+        # Fingerprints and statistics skip the detection of `a` as well, only the extraction counts
+        list(extract_fn.process({"a": "x"}))
+        list(extract_fn.process({"a": "y", "b": 1}))
+        self.assertEqual(2, extract_fn.skipped)
+
+    def test_parse_json_sample(self):
+        lines = [('file1', f'{{"a": {i}}}') for i in range(100)] + [('file2', f'{{"b": {i}}}') for i in range(100)]
+
+        with TestPipeline() as p:
+            parsed = (p
+                      | beam.Create(lines, reshuffle=False)
+                      | beam.ParDo(ParseJsonFn(sample_rate=0.5, sample_max=10))
+                            .with_outputs(ParseJsonFn.SCHEMA_SAMPLE_TAG, main='documents')
+                      )
+            sample = parsed[ParseJsonFn.SCHEMA_SAMPLE_TAG] | LimitSamplePerFile(10)
+
+            assert_that(parsed.documents | "Count documents" >> beam.combiners.Count.Globally(),
+                        equal_to([200]), label='documents')
+            assert_that(sample | "Count sample" >> beam.combiners.Count.Globally(),
+                        equal_to([20]), label='sample')
+
+    def test_parse_json_sample_deterministic(self):
+        parse_fn = ParseJsonFn(sample_rate=0.1)
+        parse_fn.start_bundle()
+
+        sampled1 = [parse_fn.is_sampled(zlib.crc32(str(i).encode('utf-8'))) for i in range(1000)]
+        sampled2 = [parse_fn.is_sampled(zlib.crc32(str(i).encode('utf-8'))) for i in range(1000)]
+
+        self.assertEqual(sampled1, sampled2)
+        self.assertTrue(50 < sum(sampled1) < 150)
+
+    def test_parse_json_sample_max_deterministic(self):
+        lines = [('file1', f'{{"a": {i}}}') for i in range(100)]
+        expected = sorted(lines, key=lambda element: (zlib.crc32(element[1].encode('utf-8')), element[1]))[:5]
+
+        # The sample doesn't depend on the order in which the lines are processed
+        for ordered_lines in (lines, lines[::-1]):
+            with TestPipeline() as p:
+                parsed = (p
+                          | beam.Create(ordered_lines, reshuffle=False)
+                          | beam.ParDo(ParseJsonFn(sample_max=5)).with_outputs(ParseJsonFn.SCHEMA_SAMPLE_TAG,
+                                                                                main='documents')
+                          )
+                assert_that(parsed[ParseJsonFn.SCHEMA_SAMPLE_TAG] | LimitSamplePerFile(5),
+                            equal_to([json.loads(line) for _, line in expected]))
+
+    def test_parse_json_dead_letter(self):
+        lines = [('file1', '{"a": 1}'), ('file1', '{"a": '), ('file2', '[1, 2]'), ('file2', '{"a": [[1], [2]]}')]
+
+        with TestPipeline() as p:
+            parsed = (p
+                      | beam.Create(lines, reshuffle=False)
+                      | beam.ParDo(ParseJsonFn(dead_letter=True)).with_outputs(DEAD_LETTER_TAG, main='documents')
+                      )
+
+            assert_that(parsed.documents, equal_to([{"a": 1}]), label='documents')
+            assert_that(parsed[DEAD_LETTER_TAG] | beam.Map(lambda letter: (letter['error'], letter['source'])),
+                        equal_to([('JSONDecodeError', 'file1'), ('ValueError', 'file2'),
+                                  ('BQSchemaMergeException', 'file2')]),
+                        label='dead_letters')
+
+    def test_parse_json_strict(self):
+        parse_fn = ParseJsonFn()
+        parse_fn.setup()
+        parse_fn.start_bundle()
+
+        self.assertRaises(ValueError, list, parse_fn.process(('file1', '{"a": ')))
+
+    def test_extract_schema_dead_letter(self):
+        documents = [{"a": 1}, {"a": [1, "x"]}, {"a": [1, "x"]}]
+
+        with TestPipeline() as p:
+            extracted = (p
+                         | beam.Create(documents, reshuffle=False)
+                         | beam.ParDo(ExtractSchemaFn(dead_letter=True)).with_outputs(DEAD_LETTER_TAG, main='schemas')
+                         )
+
+            assert_that(extracted.schemas, equal_to([[{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]]),
+                        label='schemas')
+            assert_that(extracted[DEAD_LETTER_TAG] | beam.Map(lambda letter: letter['record']),
+                        equal_to(['{"a": [1, "x"]}'] * 2), label='dead_letters')
+
+    def test_extract_schema_conflict_between_documents(self):
+        # Every document has a valid schema on its own, the conflict only shows when the schemas are combined
+        extract_fn = ExtractSchemaFn(dead_letter=True)
+        extract_fn.setup()
+        extract_fn.start_bundle()
+        schemas = [schema for data in [{"a": {"b": 1}}, {"a": 1}] for schema in extract_fn.process(data)]
+
+        combiner = SchemaCombinerFn()
+        self.assertRaises(BQSchemaMergeException, combiner.add_inputs, combiner.create_accumulator(), schemas)
+
+        # With dead letters, the record is kept, the documents with a primitive value are dead letters when cast
+        combiner = SchemaCombinerFn(widening=WIDENING_RECORD)
+        schema = combiner.extract_output(combiner.add_inputs(combiner.create_accumulator(), schemas))
+        self.assertEqual([{"name": "a", "type": "RECORD", "mode": "REQUIRED", "fields": [
+            {"name": "b", "type": "INTEGER", "mode": "NULLABLE"},
+        ]}], schema)
+
+    def test_extract_keyed_schema_dead_letter_source(self):
+        documents = [("t1", ("file1", {"a": 1})), ("t2", ("file2", {"a": [1, "x"]}))]
+
+        with TestPipeline() as p:
+            extracted = (p
+                         | beam.Create(documents, reshuffle=False)
+                         | beam.ParDo(ExtractKeyedSchemaFn(dead_letter=True, with_source=True))
+                               .with_outputs(DEAD_LETTER_TAG, main='schemas')
+                         )
+
+            assert_that(extracted.schemas, equal_to([("t1", [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}])]),
+                        label='schemas')
+            assert_that(extracted[DEAD_LETTER_TAG] | beam.Map(lambda letter: (letter['source'], letter['record'])),
+                        equal_to([('file2', '{"a": [1, "x"]}')]), label='dead_letters')
+
+    def test_extract_unmatched_schemas(self):
+        documents = [{"a": 1}, {"a": 2, "b": "x"}, {"a": 1.5}]
+
+        with TestPipeline() as p:
+            sampled_schema = p | "Sample" >> beam.Create([[{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]])
+            schema = ((p
+                       | "Documents" >> beam.Create(documents)
+                       | beam.ParDo(ExtractUnmatchedSchemaFn(), beam.pvalue.AsSingleton(sampled_schema))
+                       ), sampled_schema) | beam.Flatten() | beam.CombineGlobally(SchemaCombinerFn())
+
+            assert_that(schema, equal_to([[
+                {"name": "a", "type": "FLOAT", "mode": "REQUIRED"},
+                {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+            ]]))
+
+    def test_extract_schemas_with_stats(self):
+        # A single rogue record widens the type
+        documents = [{"a": i} for i in range(99)] + [{"a": 1.5}]
+
+        with TestPipeline() as p:
+            output = (p
+                      | beam.Create(documents)
+                      | beam.ParDo(ExtractSchemaFn(collect_stats=True))
+                      | beam.CombineGlobally(SchemaCombinerFn(collect_stats=True))
+                      )
+
+            assert_that(output, equal_to([(
+                [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}],
+                {"count": 100, "fields": [{
+                    "name": "a", "count": 100, "presence": 1.0, "null_count": 0, "null_rate": 0.0,
+                    "types": {"INTEGER": 99, "FLOAT": 1},
+                }]},
+            )]))
+
+    def test_extract_unmatched_keyed_schemas_with_stats(self):
+        # Statistics include the documents that fit the schema
+        documents = [("t1", {"a": 1}), ("t1", {"a": 2}), ("t1", {"a": 1.5})]
+
+        with TestPipeline() as p:
+            sampled_schemas = p | "Sample" >> beam.Create([
+                ("t1", [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]),
+            ])
+            unmatched = (p
+                         | "Documents" >> beam.Create(documents)
+                         | beam.ParDo(ExtractUnmatchedKeyedSchemaFn(collect_stats=True),
+                                      beam.pvalue.AsDict(sampled_schemas))
+                         )
+            type_counts = ((unmatched, sampled_schemas)
+                           | beam.Flatten()
+                           | beam.CombinePerKey(SchemaCombinerFn(collect_stats=True))
+                           | beam.Map(lambda element: (element[0], element[1][1]['fields'][0]['types']))
+                           )
+
+            assert_that(type_counts, equal_to([("t1", {"INTEGER": 2, "FLOAT": 1})]))
+
+    def test_extract_keyed_schemas(self):
+        documents = [
+            ("t1", {"a": "2020-06-18T10:44:12"}),
+            ("t2", {"a": "x"}),
+            ("t1", {"a": "2020-06-18T10:44:13"}),
+            ("t2", {"a": "y"}),
+        ]
+
+        with TestPipeline() as p:
+            schemas = (p
+                       | beam.Create(documents, reshuffle=False)
+                       | beam.ParDo(ExtractKeyedSchemaFn())
+                       )
+
+            assert_that(schemas, equal_to([
+                ("t1", [{"name": "a", "type": "TIMESTAMP", "mode": "REQUIRED"}]),
+                ("t2", [{"name": "a", "type": "STRING", "mode": "REQUIRED"}]),
+            ]))
+
+    def test_extract_unmatched_keyed_schemas(self):
+        documents = [("t1", {"a": 1}), ("t1", {"a": 1.5}), ("t2", {"a": 1.5}), ("t3", {"c": True})]
+
+        with TestPipeline() as p:
+            sampled_schemas = p | "Sample" >> beam.Create([
+                ("t1", [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]),
+                ("t2", [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}]),
+            ])
+            schemas = ((p
+                        | "Documents" >> beam.Create(documents)
+                        | beam.ParDo(ExtractUnmatchedKeyedSchemaFn(), beam.pvalue.AsDict(sampled_schemas))
+                        ), sampled_schemas) | beam.Flatten() | beam.CombinePerKey(SchemaCombinerFn())
+
+            assert_that(schemas, equal_to([
+                ("t1", [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}]),
+                ("t2", [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}]),
+                ("t3", [{"name": "c", "type": "BOOLEAN", "mode": "REQUIRED"}]),
+            ]))
+
+    def test_extract_schemas_widened(self):
+        documents = [{"a": [1, "x"]}, {"a": [2], "b": {"c": 1}}, {"b": "y"}]
+
+        with TestPipeline() as p:
+            schema = (p
+                      | beam.Create(documents)
+                      | beam.ParDo(ExtractSchemaFn(widening="json"))
+                      | beam.CombineGlobally(SchemaCombinerFn(widening="json"))
+                      )
+
+            assert_that(schema, equal_to([[
+                {"name": "a", "type": "STRING", "mode": "REPEATED"},
+                {"name": "b", "type": "JSON", "mode": "NULLABLE"},
+            ]]))
+
+    def test_cast_to_schema(self):
+        documents = [{"a": 1, "b": {"c": 1}}, {"a": "x", "b": "y"}]
+
+        with TestPipeline() as p:
+            schema = p | "Schema" >> beam.Create([[
+                {"name": "a", "type": "STRING", "mode": "REQUIRED"},
+                {"name": "b", "type": "JSON", "mode": "REQUIRED"},
+            ]])
+            cast = (p
+                    | "Documents" >> beam.Create(documents)
+                    | beam.ParDo(CastToSchemaFn(), beam.pvalue.AsSingleton(schema))
+                    )
+
+            assert_that(cast, equal_to([{"a": "1", "b": '{"c": 1}'}, {"a": "x", "b": '"y"'}]))
+
+    def test_cast_to_schema_avro(self):
+        schema = [
+            {"name": "a", "type": "STRING", "mode": "REQUIRED"},
+            {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"},
+            {"name": "l", "type": "INTEGER", "mode": "REPEATED"},
+            {"name": "r", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "f", "type": "FLOAT", "mode": "NULLABLE"},
+            ]},
+        ]
+        documents = [{"a": 1, "ts": "2020-06-18 10:44:12Z", "r": {"f": 1}}, {"a": "x", "l": [1, None], "other": 1}]
+
+        def write_avro(rows, path, json_schema):
+            # Fake sink: the rows are written like the temporary files of an Avro load job
+            writer = AvroRowWriter(open(path, 'wb'), prep_schema(None, json_schema, "avro"))
+            for row in rows:
+                writer.write(row)
+            writer.close()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'rows.avro')
+            with TestPipeline() as p:
+                bq_schema = p | "Schema" >> beam.Create([schema])
+                _ = (p
+                     | "Documents" >> beam.Create(documents)
+                     | beam.ParDo(CastToSchemaFn("avro"), beam.pvalue.AsSingleton(bq_schema))
+                     | beam.combiners.ToList()
+                     | beam.Map(write_avro, path, schema)
+                     )
+
+            with open(path, 'rb') as infile:
+                rows = sorted(fastavro.reader(infile), key=lambda row: row["a"])
+
+        self.assertEqual([
+            {"a": "1", "ts": datetime.datetime(2020, 6, 18, 10, 44, 12, tzinfo=datetime.timezone.utc), "l": [],
+             "r": {"f": 1.0}},
+            {"a": "x", "ts": None, "l": [1], "r": None},
+        ], rows)
+
+    def test_prep_schema_avro(self):
+        schema = [{"name": "a", "type": "JSON", "mode": "NULLABLE"}]
+
+        self.assertEqual({'fields': schema}, prep_schema(None, schema))
+        with self.assertRaises(ValueError):
+            prep_schema(None, schema, "avro")
+
+    def test_cast_to_routed_schema(self):
+        documents = [{"t": "x", "a": 1}, {"t": "y", "a": 1}, {"t": "z", "a": 1}]
+
+        with TestPipeline() as p:
+            schemas = p | "Schemas" >> beam.Create([
+                ("events_x", [{"name": "t", "type": "STRING", "mode": "REQUIRED"},
+                              {"name": "a", "type": "STRING", "mode": "REQUIRED"}]),
+                ("events_y", [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]),
+            ])
+            cast = (p
+                    | "Documents" >> beam.Create(documents)
+                    | beam.ParDo(CastToRoutedSchemaFn(["t"], "events"), beam.pvalue.AsDict(schemas))
+                    )
+
+            # Fields that are not in the schema are dropped, documents of unknown tables are kept as is
+            assert_that(cast, equal_to([{"t": "x", "a": "1"}, {"a": 1}, {"t": "z", "a": 1}]))
+
+    def test_cast_to_schema_report_dropped(self):
+        schema = [{"name": "a", "type": "INTEGER", "mode": "NULLABLE"}]
+        cast_fn = CastToSchemaFn(report_dropped=True)
+        cast_fn.setup()
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual([{"a": 1}], list(cast_fn.process({"a": 1, "b": 2}, schema)))
+            self.assertEqual([{"a": 2}], list(cast_fn.process({"a": 2, "b": 3, "c": None}, schema)))
+        # Every dropped field is only logged once
+        self.assertEqual(1, len(logs.output))
+        self.assertIn("Field b", logs.output[0])
+        self.assertEqual({"b"}, cast_fn.dropped_paths)
+
+    def test_cast_to_schema_dead_letter(self):
+        schema = [{"name": "a", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "b", "type": "FLOAT", "mode": "NULLABLE"},
+        ]}]
+        cast_fn = CastToSchemaFn(dead_letter=True, with_source=True)
+        cast_fn.setup()
+
+        self.assertEqual([{"a": {"b": 1.0}}], list(cast_fn.process(("file1", {"a": {"b": 1}}), schema)))
+        dead_letters = list(cast_fn.process(("file2", {"a": 1}), schema))
+        self.assertEqual(1, len(dead_letters))
+        self.assertEqual(DEAD_LETTER_TAG, dead_letters[0].tag)
+        self.assertEqual({"error": "BQSchemaCastException", "reason": "Value of record a is not an object but int",
+                          "source": "file2", "record": '{"a": 1}'}, dead_letters[0].value)
+
+    def test_cast_to_running_schema(self):
+        schema = [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"},
+                  {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"}]
+        cast_fn = CastToRunningSchemaFn()
+        cast_fn.setup()
+
+        self.assertEqual([{"a": 1.0, "ts": "2020-06-18T10:44:12"}],
+                         list(cast_fn.process({"a": 1, "ts": "2020-6-18 10:44:12Z"}, schema)))
+        # Documents that don't fit the running schema yet keep their new fields
+        self.assertEqual([{"a": 1, "b": "x"}], list(cast_fn.process({"a": 1, "b": "x"}, schema)))
+        # Before the first schema update, documents are kept as is
+        self.assertEqual([{"a": 1}], list(cast_fn.process({"a": 1}, None)))
+
+    def test_cast_to_running_schema_hold_pending(self):
+        schema = [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}]
+        cast_fn = CastToRunningSchemaFn(hold_pending=True)
+        cast_fn.setup()
+
+        self.assertEqual([{"a": 1.0}], list(cast_fn.process({"a": 1}, schema)))
+        # Documents that don't fit the running schema yet are emitted on the pending output
+        [pending] = cast_fn.process({"a": 1, "b": "x"}, schema)
+        self.assertEqual(CastToRunningSchemaFn.PENDING_TAG, pending.tag)
+        self.assertEqual({"a": 1, "b": "x"}, pending.value)
+
+    def test_hold_pending_rows(self):
+        schema = [{"name": "a", "type": "FLOAT", "mode": "NULLABLE"},
+                  {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"}]
+        stream = (TestStream()
+                  .add_elements([{"a": 1, "ts": "2020-6-18 10:44:12Z"}, {"a": 2, "b": "x"}])
+                  .advance_processing_time(60)
+                  .advance_watermark_to_infinity())
+
+        options = PipelineOptions()
+        options.view_as(StandardOptions).streaming = True
+        with TestPipeline(options=options) as p:
+            running_schema = p | "Schema" >> beam.Create([schema])
+            held = (p
+                    | stream
+                    | HoldPendingRows(beam.pvalue.AsSingleton(running_schema), 30)
+                    )
+
+            # Released documents are converted to the running schema, the ones that still don't fit are kept as is
+            assert_that(held, equal_to([{"a": 1.0, "ts": "2020-06-18T10:44:12"}, {"a": 2, "b": "x"}]))
+
+    def test_failed_row_dead_letter(self):
+        letter = failed_row_dead_letter(("p:d.t", {"a": 1}), source="projects/p/subscriptions/s")
+
+        self.assertEqual({"error": "FailedRows", "reason": "Insert into p:d.t failed",
+                          "source": "projects/p/subscriptions/s", "record": '{"a": 1}'}, letter)
+
+    def test_route_table(self):
+        self.assertEqual("events_click", route_table({"type": "click"}, ["type"], "events"))
+        self.assertEqual("events_page_view", route_table({"type": "page-view"}, ["type"], "events"))
+        self.assertEqual("events_3", route_table({"meta": {"version": 3}}, ["meta", "version"], "events"))
+        self.assertEqual("events", route_table({"type": None}, ["type"], "events"))
+        self.assertEqual("events", route_table({"meta": "x"}, ["meta", "version"], "events"))
+        self.assertEqual("events", route_table({"type": {"a": 1}}, ["type"], "events"))
+        self.assertEqual("p:d.events_click", route_table_spec({"type": "click"}, ["type"], "p", "d", "events"))
+
+    def test_prep_routed_schema(self):
+        schema = [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]
+
+        self.assertEqual({'fields': schema}, prep_routed_schema("p:d.events_click", {"events_click": schema}))
+
+    def test_create_keyed_bq_table(self):
+        client = FakeBigQueryClient()
+        schema = [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]
+
+        result = create_keyed_bq_table(("events_click", schema), 'project', 'dataset', client=client)
+
+        self.assertEqual(("events_click", schema), result)
+        self.assertIn('project.dataset.events_click', client.tables)
+
+    def test_create_bq_table_new(self):
+        client = FakeBigQueryClient()
+        schema = [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]
+
+        final_schema = create_bq_table(schema, 'project', 'dataset', 'table', client=client)
+
+        self.assertEqual(schema, final_schema)
+        self.assertEqual(['get_table', 'create_table'], client.calls)
+        self.assertEqual(to_schema_fields(schema), client.tables['project.dataset.table'].schema)
+
+    def test_create_bq_table_unchanged(self):
+        existing_schema = [
+            {"name": "a", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "r", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+            ]},
+        ]
+        client = FakeBigQueryClient({'project.dataset.table': existing_schema})
+        schema = [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}]
+
+        create_bq_table(schema, 'project', 'dataset', 'table', client=client)
+
+        self.assertEqual(['get_table'], client.calls)
+
+    def test_create_bq_table_updated(self):
+        existing_schema = [{"name": "a", "type": "INTEGER", "mode": "NULLABLE"}]
+        client = FakeBigQueryClient({'project.dataset.table': existing_schema})
+        schema = [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"},
+                  {"name": "b", "type": "STRING", "mode": "REQUIRED"}]
+
+        final_schema = create_bq_table(schema, 'project', 'dataset', 'table', client=client)
+
+        expected_result = [
+            {"name": "a", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+        ]
+        self.assertEqual(expected_result, final_schema)
+        self.assertEqual(['get_table', 'update_table'], client.calls)
+        self.assertEqual(to_schema_fields(expected_result), client.tables['project.dataset.table'].schema)
+
+    def test_load_schema(self):
+        schema = {"fields": [
+            {"name": "a", "type": "int64"},
+            {"name": "r", "type": "STRUCT", "mode": "repeated", "fields": [
+                {"name": "b", "type": "STRING", "mode": "REQUIRED", "description": "test"},
+            ]},
+        ]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'schema.json')
+            with open(path, 'w') as schema_file:
+                json.dump(schema, schema_file)
+
+            result = load_schema(path)
+
+        expected_result = [
+            {"name": "a", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "r", "type": "RECORD", "mode": "REPEATED", "fields": [
+                {"name": "b", "type": "STRING", "mode": "REQUIRED"},
+            ]},
+        ]
+        self.assertEqual(expected_result, result)
+        self.assertEqual(expected_result, clean_schema(schema["fields"]))
+
+    def test_add_bq_table_schema(self):
+        existing_schema = [{"name": "a", "type": "INTEGER", "mode": "NULLABLE"}]
+        client = FakeBigQueryClient({'project.dataset.table': existing_schema})
+        seed_schema = [{"name": "b", "type": "STRING", "mode": "NULLABLE"}]
+
+        self.assertEqual(existing_schema, add_bq_table_schema(None, 'project', 'dataset', 'table', client=client))
+        self.assertEqual(seed_schema, add_bq_table_schema(seed_schema, 'project', 'dataset', 'other', client=client))
+        self.assertIsNone(add_bq_table_schema(None, 'project', 'dataset', 'other', client=client))
+        self.assertEqual([
+            {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+            {"name": "a", "type": "INTEGER", "mode": "NULLABLE"},
+        ], add_bq_table_schema(seed_schema, 'project', 'dataset', 'table', client=client))
@@ -0,0 +1,80 @@
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from apache_beam.io import ReadFromTextWithFilename
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.testing.util import assert_that, equal_to
+
+from json2bq.compressed_input import ReadCompressedTextWithFilename, ReadTextFilesWithFilename, read_text_with_filename
+
+LINES = [json.dumps({"id": i, "name": f"name {i}"}) for i in range(100)]
+
+
+class TestCompressedInput(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_multi_member_gzip(self):
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl.gz')
+        data = ('\n'.join(LINES) + '\n').encode('utf-8')
+        with open(path, 'wb') as outfile:
+            # Members that don't respect line boundaries
+            for i in range(0, len(data), 300):
+                outfile.write(gzip.compress(data[i:i + 300]))
+
+        with TestPipeline() as p:
+            lines = p | ReadCompressedTextWithFilename(os.path.join(self.tmp_dir.name, '*.gz'), chunk_size=1)
+
+            assert_that(lines, equal_to([(path, line) for line in LINES]))
+
+    def test_read_single_member_gzip(self):
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl.gz')
+        with gzip.open(path, 'wt') as outfile:
+            outfile.write('\n'.join(LINES))
+
+        with TestPipeline() as p:
+            lines = p | ReadCompressedTextWithFilename(path, chunk_size=1)
+
+            assert_that(lines, equal_to([(path, line) for line in LINES]))
+
+    def test_read_text_with_filename(self):
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl')
+        with open(path, 'w') as outfile:
+            outfile.write('\n'.join(LINES))
+
+        self.assertIsInstance(read_text_with_filename(path + '.zst'), ReadCompressedTextWithFilename)
+        self.assertIsInstance(read_text_with_filename(path), ReadFromTextWithFilename)
+
+    def test_read_files(self):
+        compressed_path = os.path.join(self.tmp_dir.name, 'data.jsonl.gz')
+        with gzip.open(compressed_path, 'wt') as outfile:
+            outfile.write('\n'.join(LINES[:50]))
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl')
+        with open(path, 'w') as outfile:
+            outfile.write('\n'.join(LINES[50:]))
+        with open(os.path.join(self.tmp_dir.name, 'other.jsonl'), 'w') as outfile:
+            outfile.write('\n'.join(LINES))
+
+        with TestPipeline() as p:
+            lines = p | ReadTextFilesWithFilename([compressed_path, path])
+
+            assert_that(lines, equal_to([(compressed_path, line) for line in LINES[:50]] +
+                                        [(path, line) for line in LINES[50:]]))
+
+    def test_read_files_line_endings(self):
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl')
+        with open(path, 'wb') as outfile:
+            outfile.write(b'{"a": 1}\r\n{"a": 2}\n{"a": 3}\n')
+
+        with TestPipeline() as p:
+            lines = p | ReadTextFilesWithFilename([path])
+
+            # Line endings are stripped like `ReadFromTextWithFilename` does
+            assert_that(lines, equal_to([(path, '{"a": 1}'), (path, '{"a": 2}'), (path, '{"a": 3}')]))
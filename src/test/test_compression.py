@@ -0,0 +1,121 @@
+import bz2
+import gzip
+import io
+import json
+from unittest import TestCase, skipIf
+
+from schematools.compression import (COMPRESSION_BZIP2, COMPRESSION_GZIP, COMPRESSION_ZSTD, ZSTD_SEEKABLE_MAGIC,
+                                     ZSTD_SKIPPABLE_MAGIC, compression_type, read_lines, split_points, zstandard)
+
+LINES = [json.dumps({"id": i, "name": f"name {i}", "values": list(range(i % 7))}).encode('utf-8') for i in range(200)]
+
+COMPRESSORS = {
+    COMPRESSION_GZIP: gzip.compress,
+    COMPRESSION_BZIP2: bz2.compress,
+}
+# zstd support is optional
+if zstandard is not None:
+    COMPRESSORS[COMPRESSION_ZSTD] = zstandard.ZstdCompressor().compress
+
+
+def compress_members(data, compression, member_size):
+    """
+    Compresses every `member_size` bytes into a separate member, members don't respect line boundaries.
+    """
+    compress = COMPRESSORS[compression]
+    return [compress(data[i:i + member_size]) for i in range(0, len(data), member_size)]
+
+
+def zstd_seek_table(frames):
+    entries = b''.join(len(frame).to_bytes(4, 'little') + b'\x00\x00\x00\x00' for frame in frames)
+    footer = len(frames).to_bytes(4, 'little') + b'\x00' + ZSTD_SEEKABLE_MAGIC.to_bytes(4, 'little')
+    return (ZSTD_SKIPPABLE_MAGIC | 0xE).to_bytes(4, 'little') + \
+        (len(entries) + len(footer)).to_bytes(4, 'little') + entries + footer
+
+
+def read_all(data, compression, chunk_size):
+    fileobj = io.BytesIO(data)
+    ranges = split_points(fileobj, len(data), compression, chunk_size)
+    return ranges, [line for start, end in ranges for line in read_lines(fileobj, start, end, compression)]
+
+
+class TestCompression(TestCase):
+
+    def test_compression_type(self):
+        self.assertEqual(COMPRESSION_GZIP, compression_type('gs://bucket/data.jsonl.gz'))
+        self.assertEqual(COMPRESSION_ZSTD, compression_type('data.jsonl.zst'))
+        self.assertEqual(COMPRESSION_BZIP2, compression_type('data.jsonl.bz2'))
+        self.assertIsNone(compression_type('data.jsonl'))
+
+    def test_split_and_read_members(self):
+        data = b'\n'.join(LINES) + b'\n'
+
+        for compression in COMPRESSORS:
+            for member_size in [100, 1000, 1024 * 1024]:
+                members = compress_members(data, compression, member_size)
+                compressed = b''.join(members)
+
+                for chunk_size in [1, 500, 2000, 1024 * 1024]:
+                    with self.subTest(compression=compression, member_size=member_size, chunk_size=chunk_size):
+                        ranges, lines = read_all(compressed, compression, chunk_size)
+
+                        self.assertEqual(LINES, lines)
+                        if chunk_size == 1:
+                            self.assertEqual(len(members), len(ranges))
+                        elif chunk_size >= len(compressed):
+                            self.assertEqual(1, len(ranges))
+
+    def test_single_member(self):
+        data = b'\n'.join(LINES)
+
+        for compression, compress in COMPRESSORS.items():
+            with self.subTest(compression=compression):
+                compressed = compress(data)
+                ranges, lines = read_all(compressed, compression, 100)
+
+                self.assertEqual([(0, len(compressed))], ranges)
+                self.assertEqual(LINES, lines)
+
+    def test_line_ends_at_member_boundary(self):
+        # Every member ends with a newline, the next range starts with a complete line
+        for compression, compress in COMPRESSORS.items():
+            with self.subTest(compression=compression):
+                compressed = b''.join(compress(b'\n'.join(LINES[i:i + 10]) + b'\n') for i in range(0, len(LINES), 10))
+                ranges, lines = read_all(compressed, compression, 1)
+
+                self.assertEqual(len(LINES) // 10, len(ranges))
+                self.assertEqual(LINES, lines)
+
+    def test_empty_members(self):
+        data = b'\n'.join(LINES)
+
+        for compression, compress in COMPRESSORS.items():
+            with self.subTest(compression=compression):
+                members = compress_members(data, compression, 1000)
+                compressed = b''.join(member + compress(b'') for member in members)
+                _, lines = read_all(compressed, compression, 1)
+
+                self.assertEqual(LINES, lines)
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_seek_table(self):
+        data = b'\n'.join(LINES)
+        frames = compress_members(data, COMPRESSION_ZSTD, 1000)
+        compressed = b''.join(frames) + zstd_seek_table(frames)
+
+        ranges, lines = read_all(compressed, COMPRESSION_ZSTD, 1)
+
+        self.assertEqual(len(frames), len(ranges))
+        self.assertEqual(len(compressed), ranges[-1][1])
+        self.assertEqual(LINES, lines)
+
+    def test_gzip_false_magic(self):
+        # Uncompressed (stored) data containing a gzip header that does not start a valid member
+        fake_member = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03' + b'\xff' * 100
+        data = b'\n'.join(LINES[:10]) + b'\n' + fake_member + b'\n' + b'\n'.join(LINES[10:]) + b'\n'
+        compressed = gzip.compress(data, compresslevel=0) + gzip.compress(data, compresslevel=0)
+
+        ranges, lines = read_all(compressed, COMPRESSION_GZIP, 1)
+
+        self.assertEqual(2, len(ranges))
+        self.assertEqual(2 * (len(LINES) + 1), len(lines))
@@ -0,0 +1,179 @@
+import random
+from unittest import TestCase
+
+from schematools.bq_types import *
+from schematools.data_detectors import (DataDetector, DetectionContext, DetectorRegistry, create_registry, is_date,
+                                        is_geography, is_json, is_numeric, is_time, is_timestamp)
+from schematools.schema_extraction import extract_schema
+
+TIMESTAMP_EDGE_CASES = [
+    # Valid timestamps in different notations
+    '2020-06-18T10:44:12',
+    '2020-06-18 10:44:12',
+    '2020-06-18T10:44:12Z',
+    '2020-06-18T10:44:12+00:00',
+    '2020-06-18T10:44:12.123456',
+    '2020-06-18T10:44:12.1',
+    '2020-06-18T10:44:12.123456Z',
+    '2020-06-18t10:44:12',
+    '2020-6-8T1:4:2',
+    '2020-02-29T00:00:00',
+    '0001-01-01T00:00:00',
+    '9999-12-31T23:59:59.999999',
+    'Z2020-06-18T10:44:12',
+    '2020-06-18T10:Z44:12',
+    '٢٠٢٠-06-18T10:44:12',
+    # Invalid timestamps
+    '',
+    'hello',
+    '2020-06-18',
+    '10:44:12',
+    '2020-06-18T10:44',
+    '2020-06-18T10:44:12.1234567',
+    '2020-06-18T10:44:12.',
+    '2020-06-18T10:44:12+01:00',
+    '2020-06-18T10:44:12 ',
+    ' 2020-06-18T10:44:12',
+    '2020-06-18  10:44:12',
+    '2020-06- 8T10:44:12',
+    '2020-13-18T10:44:12',
+    '2020-00-18T10:44:12',
+    '2020-02-30T10:44:12',
+    '2019-02-29T10:44:12',
+    '2020-06-18T24:00:00',
+    '2020-06-18T10:60:00',
+    '2020-06-18T10:44:60',
+    '2020-06-18T10:44:61',
+    '0000-01-01T00:00:00',
+    '20200-06-18T10:44:12',
+    '2020/06/18T10:44:12',
+    '2020-06-18T10:44:12.123.456',
+    '2020-06-18X10:44:12',
+    '2020-06-18T10:44:1٢',
+    '2020-06-18T10:44:12.١٢',
+]
+
+
+def gen_random_timestamp_like(rng: random.Random) -> str:
+    """
+    Generates a string that resembles a timestamp, with random mutations.
+    """
+    value = list(f'{rng.randint(0, 12000):04d}-{rng.randint(0, 13):02d}-{rng.randint(0, 32):02d}'
+                 f'T{rng.randint(0, 25):02d}:{rng.randint(0, 61):02d}:{rng.randint(0, 62):02d}'
+                 f'.{rng.randint(0, 9999999)}')
+    for _ in range(rng.randint(0, 3)):
+        position = rng.randrange(len(value))
+        mutation = rng.choice(['delete', 'replace', 'insert'])
+        if mutation == 'delete':
+            del value[position]
+        else:
+            character = rng.choice('0123456789-:. TtZ+x')
+            if mutation == 'replace':
+                value[position] = character
+            else:
+                value.insert(position, character)
+    return ''.join(value)
+
+
+class TestDataDetectors(TestCase):
+
+    def legacy_is_timestamp(self, field_value: str) -> bool:
+        # Reference implementation, based on the BigQuery client library
+        from google.cloud.bigquery._helpers import _timestamp_query_param_from_json
+        try:
+            result = _timestamp_query_param_from_json(field_value,
+                                                      {'mode': 'NULLABLE', 'name': 'unknown', 'field_type': 'UNKNOWN'})
+            return result is not None
+        except Exception:
+            return False
+
+    def test_timestamp_edge_cases(self):
+        for value in TIMESTAMP_EDGE_CASES:
+            self.assertEqual(self.legacy_is_timestamp(value), is_timestamp(value), f'Different verdict for {value!r}')
+
+    def test_timestamp_random_cases(self):
+        rng = random.Random(42)
+        for _ in range(20000):
+            value = gen_random_timestamp_like(rng)
+            self.assertEqual(self.legacy_is_timestamp(value), is_timestamp(value), f'Different verdict for {value!r}')
+
+    def test_timestamp(self):
+        self.assertTrue(is_timestamp('2020-06-18T10:44:12'))
+        self.assertFalse(is_timestamp('basic string'))
+
+    def test_date(self):
+        self.assertTrue(is_date('2020-06-18'))
+        self.assertTrue(is_date('2020-6-8'))
+        self.assertFalse(is_date('2020-02-30'))
+        self.assertFalse(is_date('2020-06-18T10:44:12'))
+
+    def test_time(self):
+        self.assertTrue(is_time('10:44:12'))
+        self.assertTrue(is_time('10:44:12.123456'))
+        self.assertFalse(is_time('24:00:00'))
+        self.assertFalse(is_time('10:44'))
+
+    def test_numeric(self):
+        self.assertTrue(is_numeric('123'))
+        self.assertTrue(is_numeric('-123.456'))
+        self.assertFalse(is_numeric('1.2.3'))
+        self.assertFalse(is_numeric('0.1234567891'))
+
+    def test_geography(self):
+        self.assertTrue(is_geography('POINT(4.35 50.85)'))
+        self.assertTrue(is_geography('polygon ((0 0, 1 0, 1 1, 0 0))'))
+        self.assertFalse(is_geography('POINTLESS'))
+
+    def test_json(self):
+        self.assertTrue(is_json('{"a": 1}'))
+        self.assertTrue(is_json('[1, 2]'))
+        self.assertFalse(is_json('{not json}'))
+        self.assertFalse(is_json('123'))
+
+    def test_registry_order(self):
+        registry = DetectorRegistry([
+            DataDetector(TYPE_STRING, lambda value: True, priority=0),
+            DataDetector(TYPE_JSON, lambda value: True, priority=10, cost=5),
+            DataDetector(TYPE_NUMERIC, lambda value: True, priority=10, cost=1),
+        ])
+
+        self.assertEqual([TYPE_NUMERIC, TYPE_JSON, TYPE_STRING], [detector.field_type for detector in registry.detectors])
+        self.assertEqual(TYPE_NUMERIC, registry.detect('123'))
+
+    def test_registry_replaces_detector(self):
+        registry = create_registry([TYPE_TIMESTAMP])
+        registry.register(DataDetector(TYPE_TIMESTAMP, lambda value: False))
+
+        self.assertEqual(1, len(registry.detectors))
+        self.assertEqual(TYPE_STRING, registry.detect('2020-06-18T10:44:12'))
+
+    def test_create_registry_unknown_type(self):
+        with self.assertRaises(ValueError):
+            create_registry(['UNKNOWN'])
+
+    def test_extract_with_detectors(self):
+        detection = DetectionContext(create_registry([TYPE_TIMESTAMP, TYPE_DATE, TYPE_TIME]))
+
+        schema = extract_schema('{"d": "2020-06-18", "t": "10:44:12", "s": "hello"}', detection)
+
+        expected_result = [
+            {"name": "d", "type": "DATE", "mode": "REQUIRED"},
+            {"name": "t", "type": "TIME", "mode": "REQUIRED"},
+            {"name": "s", "type": "STRING", "mode": "REQUIRED"},
+        ]
+        self.assertEqual(expected_result, schema)
+
+    def test_detection_skipped_for_string_paths(self):
+        detection = DetectionContext()
+
+        extract_schema('{"a": "hello", "b": {"a": "2020-06-18T10:44:12"}}', detection)
+        schema = extract_schema('{"a": "2020-06-18T10:44:12", "b": {"a": "2020-06-18T10:44:12"}}', detection)
+
+        expected_result = [
+            {"name": "a", "type": "STRING", "mode": "REQUIRED"},
+            {"name": "b", "type": "RECORD", "mode": "REQUIRED", "fields": [
+                {"name": "a", "type": "TIMESTAMP", "mode": "REQUIRED"},
+            ]},
+        ]
+        self.assertEqual(expected_result, schema)
+        self.assertEqual(1, detection.skipped)
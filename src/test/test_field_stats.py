@@ -0,0 +1,77 @@
+import pickle
+from unittest import TestCase
+
+from schematools.field_stats import FieldStats
+
+
+def collect_stats(documents):
+    stats = FieldStats()
+    for document in documents:
+        stats.add_document(document)
+    return stats
+
+
+class TestFieldStats(TestCase):
+
+    def test_primitive_fields(self):
+        stats = collect_stats([
+            {"a": 1, "b": "xyz"},
+            {"a": 2.5, "b": None},
+            {"a": 3, "b": "2020-06-18T10:44:12"},
+            {"a": 4},
+        ])
+
+        expected_result = {
+            "count": 4,
+            "fields": [
+                {
+                    "name": "a", "count": 4, "presence": 1.0, "null_count": 0, "null_rate": 0.0,
+                    "types": {"INTEGER": 3, "FLOAT": 1},
+                },
+                {
+                    "name": "b", "count": 3, "presence": 0.75, "null_count": 1, "null_rate": 1 / 3,
+                    "types": {"STRING": 1, "TIMESTAMP": 1}, "max_length": 19,
+                },
+            ]
+        }
+        self.assertEqual(expected_result, stats.to_report())
+
+    def test_nested_fields(self):
+        stats = collect_stats([
+            {"r": {"x": 1}, "l": [{"y": "a"}, {"y": "bc", "z": True}, None]},
+            {"r": {"y": 1}, "l": []},
+        ])
+
+        report = stats.to_report()['fields']
+
+        self.assertEqual(["r", "l"], [field['name'] for field in report])
+        self.assertEqual({"RECORD": 2}, report[0]['types'])
+        self.assertEqual([("x", 0.5), ("y", 0.5)], [(field['name'], field['presence']) for field in report[0]['fields']])
+
+        # Presence of fields of repeated records is relative to the number of elements
+        self.assertEqual({"RECORD": 2}, report[1]['types'])
+        self.assertEqual(3, report[1]['max_items'])
+        self.assertEqual(
+            [("y", 1.0, 2), ("z", 0.5, None)],
+            [(field['name'], field['presence'], field.get('max_length')) for field in report[1]['fields']]
+        )
+
+    def test_merge(self):
+        documents = [
+            {"a": 1, "b": [1, 2]},
+            {"a": None, "c": {"d": "xy"}},
+            {"a": 2.5, "b": [1, 2, 3, 4], "c": {"d": "x"}},
+            {"a": "x", "c": {"e": 1}},
+        ]
+
+        expected_result = collect_stats(documents).to_report()
+        for split in range(len(documents) + 1):
+            with self.subTest(split=split):
+                stats = collect_stats(documents[:split])
+                stats.merge(collect_stats(documents[split:]))
+                self.assertEqual(expected_result, stats.to_report())
+
+    def test_pickle(self):
+        stats = collect_stats([{"a": 1, "b": {"c": "xyz"}}, {"a": None, "d": [1, 2]}])
+
+        self.assertEqual(stats.to_report(), pickle.loads(pickle.dumps(stats)).to_report())
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+import apache_beam as beam
+from apache_beam.io.filesystems import FileSystems
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.testing.util import assert_that, equal_to
+
+from json2bq.file_schema_cache import FileSchemaCache, InferCachedFileSchemas
+from test.fixtures import write_jsonl
+
+
+class TestFileSchemaCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp_dir.name, 'input')
+        self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+        os.mkdir(self.input_dir)
+        os.mkdir(self.cache_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def match(self, path):
+        return FileSystems.match([path])[0].metadata_list[0]
+
+    def test_get_put(self):
+        cache = FileSchemaCache(self.cache_dir)
+        path = write_jsonl(self.input_dir, 'a.jsonl', [{"a": 1}])
+        schema = [{"name": "a", "type": "INTEGER", "mode": "NULLABLE"}]
+
+        key = cache.fingerprint(self.match(path))
+        self.assertIsNone(cache.get(key))
+        cache.put(key, schema, path)
+        self.assertEqual(schema, cache.get(key))
+
+        # Other data detectors or widening modes get a new key
+        self.assertNotEqual(key, FileSchemaCache(self.cache_dir, data_detectors=['DATE']).fingerprint(self.match(path)))
+        self.assertNotEqual(key, FileSchemaCache(self.cache_dir, widening='string').fingerprint(self.match(path)))
+
+        # Changed files get a new key
+        write_jsonl(self.input_dir, 'a.jsonl', [{"a": 1}, {"a": 2}])
+        self.assertNotEqual(key, cache.fingerprint(self.match(path)))
+
+    def test_evict(self):
+        cache = FileSchemaCache(self.cache_dir, max_age=3600)
+        for i in range(3):
+            cache.put(f'key{i}', [], f'file{i}')
+            os.utime(cache.entry_path(f'key{i}'), (time.time() - i * 1000, time.time() - i * 1000))
+        entry_size = os.path.getsize(cache.entry_path('key0'))
+
+        # Entries older than the maximal age are evicted
+        self.assertEqual(0, cache.evict())
+        self.assertEqual(1, cache.evict(now=time.time() + 2000))
+        self.assertIsNone(cache.get('key2'))
+
+        # The oldest entries are evicted until the cache is small enough
+        cache = FileSchemaCache(self.cache_dir, max_size=entry_size)
+        self.assertEqual(1, cache.evict())
+        self.assertEqual([], cache.get('key0'))
+        self.assertIsNone(cache.get('key1'))
+
+    def test_infer_cached_file_schemas(self):
+        cache = FileSchemaCache(self.cache_dir)
+        path_a = write_jsonl(self.input_dir, 'a.jsonl', [{"a": 1}, {"a": 2, "b": "x"}])
+        path_b = write_jsonl(self.input_dir, 'b.jsonl', [{"c": True}])
+        pattern = os.path.join(self.input_dir, '*.jsonl')
+        # The schema of file b is cached, so the file is not read
+        cached_schema = [{"name": "cached", "type": "STRING", "mode": "NULLABLE"}]
+        cache.put(cache.fingerprint(self.match(path_b)), cached_schema, path_b)
+
+        with TestPipeline() as p:
+            schemas, dead_letters = p | InferCachedFileSchemas(pattern, cache)
+
+            assert_that(schemas, equal_to([
+                [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"},
+                 {"name": "b", "type": "STRING", "mode": "NULLABLE"}],
+                cached_schema,
+            ]), label='CheckSchemas')
+            assert_that(dead_letters, equal_to([]), label='CheckDeadLetters')
+
+        # The schema of file a was added to the cache
+        self.assertEqual(["a", "b"], [field['name'] for field in cache.get(cache.fingerprint(self.match(path_a)))])
+
+    def test_infer_cached_file_schemas_from_documents(self):
+        cache = FileSchemaCache(self.cache_dir)
+        path_a = write_jsonl(self.input_dir, 'a.jsonl', [{"a": 1}])
+        path_b = write_jsonl(self.input_dir, 'b.jsonl', [{"b": "x"}])
+        pattern = os.path.join(self.input_dir, '*.jsonl')
+        cached_schema = [{"name": "cached", "type": "STRING", "mode": "NULLABLE"}]
+        cache.put(cache.fingerprint(self.match(path_b)), cached_schema, path_b)
+
+        with TestPipeline() as p:
+            # The documents of the whole input are provided, only the ones of file a are extracted
+            documents = p | beam.Create([(path_a, {"a": 1}), (path_b, {"b": "x"})])
+            schemas, dead_letters = p | InferCachedFileSchemas(pattern, cache, documents=documents)
+
+            assert_that(schemas, equal_to([
+                [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+                cached_schema,
+            ]), label='CheckSchemas')
+            assert_that(dead_letters, equal_to([]), label='CheckDeadLetters')
+
+        self.assertEqual(["a"], [field['name'] for field in cache.get(cache.fingerprint(self.match(path_a)))])
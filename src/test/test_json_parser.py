@@ -0,0 +1,47 @@
+import json
+from unittest import TestCase
+
+from schematools.json_parser import PARSER_JSON, available_parsers, create_parser, resolve_parser
+from schematools.schema_extraction import extract_schema
+
+DOCUMENTS = [
+    '{"a": 1, "b": 1.5, "c": "x", "d": true, "e": null}',
+    '{"a": {"b": {"c": [1, 2, 3]}}, "d": [{"e": "2020-06-18T10:44:12"}, {"f": false}], "g": []}',
+    '{"unicode": "\\u00e9\\ud83d\\ude00", "escaped": "a\\"b\\\\c", "exp": 1e3, "neg": -0.0}',
+    '{"a": NaN}',
+    '{"big": 123456789012345678901234567890}',
+]
+
+
+class TestJsonParser(TestCase):
+
+    def test_parsers_match_stdlib(self):
+        for name in available_parsers():
+            loads = create_parser(name)
+            for document in DOCUMENTS:
+                with self.subTest(parser=name, document=document):
+                    self.assertEqual(repr(json.loads(document)), repr(loads(document)))
+                    self.assertEqual(repr(json.loads(document)), repr(loads(document.encode('utf-8'))))
+
+    def test_parse_large_integers(self):
+        documents = ['{"a": 9223372036854775807, "b": -9223372036854775808}',
+                     '{"a": 18446744073709551616, "b": -9223372036854775809, "c": [123456789012345678901234567890]}']
+        for name in available_parsers():
+            loads = create_parser(name)
+            for document in documents:
+                with self.subTest(parser=name, document=document):
+                    data = loads(document)
+                    self.assertEqual(json.loads(document), data)
+                    self.assertTrue(all(type(value) is int for value in [data['a'], data['b']]))
+
+    def test_resolve_parser(self):
+        self.assertEqual(available_parsers()[0], resolve_parser(None))
+        self.assertEqual(available_parsers()[0], resolve_parser('auto'))
+        self.assertEqual(PARSER_JSON, resolve_parser(PARSER_JSON))
+        self.assertRaises(ValueError, resolve_parser, 'unknown')
+
+    def test_extract_schema(self):
+        self.assertEqual(
+            [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}, {"name": "b", "type": "TIMESTAMP", "mode": "REQUIRED"}],
+            extract_schema('{"a": 1, "b": "2020-06-18T10:44:12"}')
+        )
@@ -0,0 +1,109 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from schematools.__main__ import main
+from schematools.local_inference import infer_files, read_chunk, split_files, tree_reduce
+from schematools.schema_extraction import extract_schema
+from schematools.schema_merge import merge_schema_list, schemas_equal
+
+DOCUMENTS = [
+    {"a": 1, "b": "x"},
+    {"a": 2.5, "c": {"d": True}},
+    {"a": 3, "b": "2020-06-18T10:44:12", "e": [1, 2]},
+    {"a": 4, "c": {"d": False, "f": "y"}},
+    {"a": 5, "b": "z"},
+]
+
+
+class TestLocalInference(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lines = [json.dumps(document) for document in DOCUMENTS * 20]
+        self.path = os.path.join(self.tmp_dir.name, 'data.jsonl')
+        with open(self.path, 'w') as outfile:
+            # Last line without a trailing newline
+            outfile.write('\n'.join(self.lines))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_chunks_cover_all_lines(self):
+        for chunk_size in [1, 2, 17, 18, 19, 100, 10 ** 6]:
+            with self.subTest(chunk_size=chunk_size):
+                lines = [line.decode('utf-8').rstrip('\n')
+                         for chunk in split_files([self.path], chunk_size)
+                         for line in read_chunk(chunk)]
+                self.assertEqual(self.lines, lines)
+
+    def test_chunks_line_aligned(self):
+        with open(self.path, 'rb') as infile:
+            data = infile.read()
+
+        for chunk_size in [1, 17, 100]:
+            with self.subTest(chunk_size=chunk_size):
+                chunks = split_files([self.path], chunk_size)
+
+                self.assertEqual(0, chunks[0][1])
+                self.assertEqual(len(data), chunks[-1][2])
+                for (_, _, end), (_, start, _) in zip(chunks, chunks[1:]):
+                    self.assertEqual(end, start)
+                    self.assertEqual(b'\n', data[start - 1:start])
+
+    def test_compressed_file(self):
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl.gz')
+        with gzip.open(path, 'wt') as outfile:
+            outfile.write('\n'.join(self.lines))
+
+        chunks = split_files([path], 10)
+
+        self.assertEqual([(path, 0, os.path.getsize(path))], chunks)
+        self.assertEqual(self.lines, [line.decode('utf-8') for line in read_chunk(chunks[0])])
+
+    def test_multi_member_compressed_file(self):
+        path = os.path.join(self.tmp_dir.name, 'data.jsonl.gz')
+        with open(path, 'wb') as outfile:
+            for i in range(0, len(self.lines), 10):
+                outfile.write(gzip.compress('\n'.join(self.lines[i:i + 10]).encode('utf-8') + b'\n'))
+
+        chunks = split_files([path], 10)
+
+        self.assertEqual(len(self.lines) // 10, len(chunks))
+        self.assertEqual(self.lines, [line.decode('utf-8') for chunk in chunks for line in read_chunk(chunk)])
+        self.assertEqual(infer_files([self.path]), infer_files([path], workers=2, chunk_size=10))
+
+    def test_infer_files(self):
+        expected_result = merge_schema_list([extract_schema(json.dumps(document)) for document in DOCUMENTS])
+
+        for workers, chunk_size in [(1, 10 ** 6), (1, 50), (2, 50)]:
+            with self.subTest(workers=workers, chunk_size=chunk_size):
+                schema = infer_files([os.path.join(self.tmp_dir.name, '*.jsonl')], workers=workers, chunk_size=chunk_size)
+                self.assertTrue(schemas_equal(expected_result, schema))
+
+    def test_tree_reduce(self):
+        schemas = [
+            [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+            None,
+            [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}],
+            [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}, {"name": "b", "type": "STRING", "mode": "REQUIRED"}],
+            [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+        ]
+
+        expected_result = [
+            {"name": "a", "type": "FLOAT", "mode": "REQUIRED"},
+            {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+        ]
+        self.assertEqual(expected_result, tree_reduce(schemas))
+        self.assertIsNone(tree_reduce([]))
+
+    def test_main(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(['infer', self.path, '--workers', '1'])
+
+        self.assertEqual(infer_files([self.path]), json.loads(output.getvalue()))
@@ -0,0 +1,83 @@
+import datetime
+import glob
+import os
+import tempfile
+from unittest import TestCase
+
+import apache_beam as beam
+import pyarrow.parquet as pq
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.testing.util import assert_that, equal_to
+
+from json2bq.parquet_output import WriteParquetFiles
+
+
+def read_rows(parquet_file):
+    # Rows of a Parquet file, built from its columns (`Table.to_pylist` needs a newer pyarrow than Beam allows)
+    columns = parquet_file.read().to_pydict()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+class TestParquetOutput(TestCase):
+
+    schema = [
+        {"name": "a", "type": "STRING", "mode": "REQUIRED"},
+        {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"},
+        {"name": "r", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "l", "type": "INTEGER", "mode": "REPEATED"},
+        ]},
+    ]
+
+    def test_write_parquet(self):
+        documents = [{"a": str(i), "ts": "2020-06-18 10:44:12Z", "r": {"l": [i, None]}, "other": i} for i in range(25)]
+
+        def check_files(paths):
+            assert len(paths) >= 1, paths
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with TestPipeline() as p:
+                schema = p | "Schema" >> beam.Create([self.schema])
+                paths, _ = (p
+                            | "Documents" >> beam.Create(documents)
+                            | WriteParquetFiles(os.path.join(tmp_dir, 'data'), beam.pvalue.AsSingleton(schema),
+                                                row_group_size=10)
+                            )
+                assert_that(paths | beam.combiners.ToList(), check_files)
+
+            # The temporary files were moved to their final location
+            self.assertEqual([], glob.glob(os.path.join(tmp_dir, 'temp-*')))
+            files = [pq.ParquetFile(path) for path in glob.glob(os.path.join(tmp_dir, 'data-*.parquet'))]
+            # Rows are written in bounded row groups
+            for parquet_file in files:
+                for i in range(parquet_file.metadata.num_row_groups):
+                    self.assertLessEqual(parquet_file.metadata.row_group(i).num_rows, 10)
+            rows = sorted((row for parquet_file in files for row in read_rows(parquet_file)),
+                          key=lambda row: int(row["a"]))
+
+        self.assertEqual(25, len(rows))
+        self.assertEqual({
+            "a": "3",
+            "ts": datetime.datetime(2020, 6, 18, 10, 44, 12, tzinfo=datetime.timezone.utc),
+            "r": {"l": [3]},
+        }, rows[3])
+
+    def test_write_parquet_dead_letter(self):
+        # Documents that don't fit the schema, e.g. when it was inferred from a sample
+        documents = [{"a": "1", "r": {"l": [1]}}, {"a": None}, {"a": "3", "r": {"l": ["x"]}}]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with TestPipeline() as p:
+                schema = p | "Schema" >> beam.Create([self.schema])
+                _, dead_letters = (p
+                                   | "Documents" >> beam.Create(documents)
+                                   | WriteParquetFiles(os.path.join(tmp_dir, 'data'), beam.pvalue.AsSingleton(schema),
+                                                       dead_letter=True)
+                                   )
+                assert_that(dead_letters | beam.Map(lambda letter: letter['error']), equal_to(['ArrowInvalid']))
+
+            rows = [row for path in glob.glob(os.path.join(tmp_dir, 'data-*.parquet'))
+                    for row in read_rows(pq.ParquetFile(path))]
+
+        # Values of the wrong type are dead letters, missing values of REQUIRED fields are written as nulls
+        self.assertEqual([{"a": "1", "ts": None, "r": {"l": [1]}}, {"a": None, "ts": None, "r": None}],
+                         sorted(rows, key=lambda row: row["a"] is None))
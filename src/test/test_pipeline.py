@@ -0,0 +1,222 @@
+import functools
+import glob
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import apache_beam as beam
+
+from json2bq import pipeline
+from json2bq.components import write_json
+from test.fixtures import write_jsonl
+
+
+def fake_create_bq_table(schema, project, dataset, table, path=None):
+    # Fake table creation: the schema of every table is written to a file
+    write_json(schema, os.path.join(path, f'{table}.schema.json'))
+    return schema
+
+
+def fake_create_keyed_bq_table(element, project, dataset, path=None):
+    table, schema = element
+    fake_create_bq_table(schema, project, dataset, table, path=path)
+    return element
+
+
+def fake_write_to_bigquery(rows, table, schema, schema_side_input, load_format, temp_bq_location=None, project=None,
+                           dataset=None, path=None):
+    # Fake load: the rows are written as JSONL files, with the table they are loaded into
+    def to_line(row):
+        return json.dumps({'table': table(row) if callable(table) else table, 'row': row})
+
+    return (rows
+            | "Serialize rows" >> beam.Map(to_line)
+            | "Write rows" >> beam.io.WriteToText(os.path.join(path, 'rows'), file_name_suffix='.jsonl')
+            )
+
+
+class TestPipeline(TestCase):
+    """
+    Runs the batch pipeline end to end on the DirectRunner, with fake BigQuery table creation and loads.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp_dir.name, 'output')
+        os.makedirs(self.output)
+        patches = [
+            mock.patch.object(pipeline, 'create_bq_table', functools.partial(fake_create_bq_table, path=self.output)),
+            mock.patch.object(pipeline, 'create_keyed_bq_table',
+                              functools.partial(fake_create_keyed_bq_table, path=self.output)),
+            mock.patch.object(pipeline, 'write_to_bigquery', functools.partial(fake_write_to_bigquery, path=self.output)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_pipeline(self, documents, files=1, **kwargs):
+        input_dir = os.path.join(self.tmp_dir.name, 'input')
+        os.makedirs(input_dir, exist_ok=True)
+        for index in range(files):
+            write_jsonl(input_dir, f'input_{index}.jsonl', documents[index::files])
+        pipeline.run(os.path.join(input_dir, '*.jsonl'), 'dataset', 'events',
+                     pipeline_args=['--project=test-project'], **kwargs)
+
+    def read_schema(self, table='events'):
+        with open(os.path.join(self.output, f'{table}.schema.json')) as infile:
+            return json.load(infile)
+
+    def read_rows(self):
+        rows = []
+        for path in glob.glob(os.path.join(self.output, 'rows*.jsonl')):
+            with open(path) as infile:
+                rows.extend(json.loads(line) for line in infile)
+        return rows
+
+    def test_run(self):
+        documents = [{"id": i, "score": i if i % 2 else i + 0.5, "user": {"name": f"user{i}"}} for i in range(20)]
+        documents.append({"id": 20, "ts": "2020-6-18 10:44:12Z", "user": None})
+
+        self.run_pipeline(documents, files=2, field_stats_output=os.path.join(self.output, 'stats.json'))
+
+        self.assertEqual([
+            {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "score", "type": "FLOAT", "mode": "NULLABLE"},
+            {"name": "user", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "name", "type": "STRING", "mode": "REQUIRED"},
+            ]},
+            {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"},
+        ], sorted(self.read_schema(), key=lambda field: ["id", "score", "user", "ts"].index(field["name"])))
+        rows = sorted((row["row"] for row in self.read_rows()), key=lambda row: row["id"])
+        self.assertEqual(21, len(rows))
+        # Rows are cast to the schema
+        self.assertEqual({"id": 1, "score": 1.0, "user": {"name": "user1"}}, rows[1])
+        self.assertEqual({"id": 20, "ts": "2020-06-18T10:44:12"}, rows[20])
+        with open(os.path.join(self.output, 'stats.json')) as infile:
+            self.assertEqual(["id", "score", "user", "ts"], [field["name"] for field in json.load(infile)["fields"]])
+
+    def test_run_routed(self):
+        documents = [{"type": "a", "x": 1}, {"type": "b", "y": "z"}, {"type": "a", "x": 2.5}, {"x": 3}]
+
+        self.run_pipeline(documents, route_field="type")
+
+        self.assertEqual([{"name": "type", "type": "STRING", "mode": "REQUIRED"},
+                          {"name": "x", "type": "FLOAT", "mode": "REQUIRED"}], self.read_schema("events_a"))
+        self.assertEqual([{"name": "type", "type": "STRING", "mode": "REQUIRED"},
+                          {"name": "y", "type": "STRING", "mode": "REQUIRED"}], self.read_schema("events_b"))
+        self.assertEqual([{"name": "x", "type": "INTEGER", "mode": "REQUIRED"}], self.read_schema("events"))
+        rows = sorted(self.read_rows(), key=lambda row: (row["table"], json.dumps(row["row"])))
+        self.assertEqual([
+            {"table": "test-project:dataset.events", "row": {"x": 3}},
+            {"table": "test-project:dataset.events_a", "row": {"type": "a", "x": 1.0}},
+            {"table": "test-project:dataset.events_a", "row": {"type": "a", "x": 2.5}},
+            {"table": "test-project:dataset.events_b", "row": {"type": "b", "y": "z"}},
+        ], rows)
+
+    def test_run_cached(self):
+        documents = [{"id": i, "x": "a"} if i % 2 else {"id": i} for i in range(10)]
+        cache = os.path.join(self.tmp_dir.name, 'cache')
+
+        self.run_pipeline(documents, files=2, schema_cache=cache)
+        self.assertEqual(10, len(self.read_rows()))
+        self.assertEqual(2, len(glob.glob(os.path.join(cache, '*.json'))))
+
+        # Without loading, the files are not read again, their schemas come from the cache
+        os.remove(os.path.join(self.output, 'events.schema.json'))
+        self.run_pipeline(documents, files=2, schema_cache=cache, load_data=False)
+        self.assertEqual([
+            {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "x", "type": "STRING", "mode": "NULLABLE"},
+        ], self.read_schema())
+
+    def test_run_seeded(self):
+        seed_path = os.path.join(self.tmp_dir.name, 'seed.json')
+        write_json([{"name": "id", "type": "INTEGER", "mode": "NULLABLE"}], seed_path)
+        documents = [{"id": i} for i in range(10)] + [{"id": 10, "x": True}]
+
+        self.run_pipeline(documents, seed_schema=seed_path)
+
+        # Only the documents that don't fit the seed are merged into it
+        self.assertEqual([
+            {"name": "id", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "x", "type": "BOOLEAN", "mode": "NULLABLE"},
+        ], self.read_schema())
+        self.assertEqual(11, len(self.read_rows()))
+
+    def read_dead_letters(self):
+        dead_letters = []
+        for path in glob.glob(os.path.join(self.output, 'dead_letters*.jsonl')):
+            with open(path) as infile:
+                dead_letters.extend(json.loads(line) for line in infile)
+        return dead_letters
+
+    def test_run_dead_letters(self):
+        documents = [{"id": 1, "a": {"b": 1}}, {"id": 2, "a": 5}, {"id": 3, "a": [1, "x"]}, {"id": 4}]
+
+        self.run_pipeline(documents, files=2, dead_letter_output=os.path.join(self.output, 'dead_letters'))
+
+        # The conflict between the record and the integer doesn't fail the job, the record is kept
+        self.assertEqual([
+            {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "a", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "b", "type": "INTEGER", "mode": "NULLABLE"},
+            ]},
+        ], self.read_schema())
+        self.assertEqual([1, 4], sorted(row["row"]["id"] for row in self.read_rows()))
+        # Every dead letter records the file it was read from
+        dead_letters = sorted((letter["error"], os.path.basename(letter["source"]), json.loads(letter["record"]))
+                              for letter in self.read_dead_letters())
+        self.assertEqual([
+            ("BQSchemaCastException", "input_1.jsonl", {"id": 2, "a": 5}),
+            ("BQSchemaMergeException", "input_0.jsonl", {"id": 3, "a": [1, "x"]}),
+        ], dead_letters)
+
+    def test_run_routed_dead_letters(self):
+        documents = [{"type": "a", "x": {"y": 1}}] * 5 + [{"type": "a", "x": 2}, {"type": "b", "x": [1, "z"]}]
+
+        self.run_pipeline(documents, route_field="type", schema_sample_max=2, schema_validation=True,
+                          dead_letter_output=os.path.join(self.output, 'dead_letters'))
+
+        self.assertEqual([{"name": "type", "type": "STRING", "mode": "REQUIRED"},
+                          {"name": "x", "type": "RECORD", "mode": "REQUIRED", "fields": [
+                              {"name": "y", "type": "INTEGER", "mode": "NULLABLE"},
+                          ]}], self.read_schema("events_a"))
+        self.assertEqual(5, len(self.read_rows()))
+        self.assertEqual([("BQSchemaCastException", "input_0.jsonl"), ("BQSchemaMergeException", "input_0.jsonl")],
+                         sorted((letter["error"], os.path.basename(letter["source"]))
+                                for letter in self.read_dead_letters()))
+
+    def test_sampled_schema_validation(self):
+        documents = [{"id": i} for i in range(100)]
+        documents[50]["y"] = "extra"
+
+        self.run_pipeline(documents, schema_sample_max=5, schema_validation=True)
+
+        # The documents that don't fit the sampled schema extend it
+        self.assertEqual([
+            {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "y", "type": "STRING", "mode": "NULLABLE"},
+        ], self.read_schema())
+        self.assertEqual(1, sum(1 for row in self.read_rows() if row["row"].get("y") == "extra"))
+
+    def test_sampled_schema_is_relaxed(self):
+        # 1% of the documents lack x, the sample of 20 documents per file is unlikely to hold any of them
+        documents = [{"id": i} if i % 100 == 99 else {"id": i, "x": i} for i in range(1000)]
+        documents[500]["y"] = "extra"
+
+        self.run_pipeline(documents, schema_sample_max=20)
+
+        # Fields of a sampled schema are nullable, so the rows without them can be loaded
+        self.assertEqual([
+            {"name": "id", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "x", "type": "INTEGER", "mode": "NULLABLE"},
+        ], self.read_schema())
+        rows = self.read_rows()
+        self.assertEqual(1000, len(rows))
+        self.assertEqual(10, sum(1 for row in rows if "x" not in row["row"]))
+        # Fields that are not in the sample are dropped (and reported)
+        self.assertFalse(any("y" in row["row"] for row in rows))
@@ -0,0 +1,149 @@
+from unittest import TestCase
+
+import apache_beam as beam
+from apache_beam.metrics.metric import MetricsFilter
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.testing.util import assert_that, equal_to
+
+from json2bq.schema_accumulator import CombineSchemas, SchemaCombinerFn
+from schematools.field_stats import FieldStats
+from schematools.schema_extraction import extract_schema
+from schematools.schema_tree import SchemaNode
+
+
+class TestSchemaCombiner(TestCase):
+
+    def test_combine_schemas(self):
+        inputs = [
+            '{"ts":"2020-06-18T10:44:12","started":{"pid":45678}}',
+            '{"ts":"2020-06-18T10:44:13","logged_in":{"username":"foo"}}',
+            '{"ts":"2020-06-18T10:44:14","started":{"pid":1}}',
+        ]
+        schemas = [extract_schema(input_json) for input_json in inputs]
+
+        final_schema = SchemaCombinerFn().apply(schemas)
+
+        expected_result = [
+            {"name": "ts", "type": "TIMESTAMP", "mode": "REQUIRED"},
+            {
+                "name": "started", "type": "RECORD", "mode": "NULLABLE",
+                "fields": [{"name": "pid", "type": "INTEGER", "mode": "REQUIRED"}]
+            },
+            {
+                "name": "logged_in", "type": "RECORD", "mode": "NULLABLE",
+                "fields": [{"name": "username", "type": "STRING", "mode": "REQUIRED"}]
+            }
+        ]
+        self.assertEqual(expected_result, final_schema)
+
+    def test_add_input_repeated_schema(self):
+        combiner = SchemaCombinerFn()
+        schema = [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}]
+
+        accumulator = combiner.create_accumulator()
+        for _ in range(5):
+            accumulator = combiner.add_input(accumulator, list(schema))
+
+        self.assertEqual(5, accumulator.count)
+        self.assertEqual(schema, combiner.extract_output(accumulator))
+
+    def test_merge_accumulators(self):
+        combiner = SchemaCombinerFn()
+        accumulator1 = combiner.add_inputs(combiner.create_accumulator(), [
+            [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}],
+            [{"name": "field1", "type": "FLOAT", "mode": "REQUIRED"}],
+            [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}],
+        ])
+        accumulator2 = combiner.add_input(combiner.create_accumulator(), [
+            {"name": "field2", "type": "STRING", "mode": "REQUIRED"}
+        ])
+
+        merged = combiner.merge_accumulators([accumulator1, accumulator2, combiner.create_accumulator()])
+
+        expected_result = [
+            {"name": "field1", "type": "FLOAT", "mode": "NULLABLE"},
+            {"name": "field2", "type": "STRING", "mode": "NULLABLE"},
+        ]
+        self.assertEqual(expected_result, combiner.extract_output(merged))
+
+    def test_combine_nothing(self):
+        self.assertIsNone(SchemaCombinerFn().apply([]))
+
+    def test_combine_schemas_and_stats(self):
+        combiner = SchemaCombinerFn(collect_stats=True)
+        documents = [{"a": 1}, {"a": 2}, {"a": 3.5, "b": "x"}]
+
+        stats1, stats2 = FieldStats(), FieldStats()
+        for document in documents[:2]:
+            stats1.add_document(document)
+        stats2.add_document(documents[2])
+
+        schema, report = combiner.apply([
+            [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+            stats1,
+            [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}, {"name": "b", "type": "STRING", "mode": "REQUIRED"}],
+            stats2,
+        ])
+
+        self.assertEqual([
+            {"name": "a", "type": "FLOAT", "mode": "REQUIRED"},
+            {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+        ], schema)
+        self.assertEqual(3, report['count'])
+        self.assertEqual({"INTEGER": 2, "FLOAT": 1}, report['fields'][0]['types'])
+
+    def test_combine_stats_empty(self):
+        self.assertEqual((None, {'count': 0, 'fields': []}), SchemaCombinerFn(collect_stats=True).apply([]))
+
+    def test_add_input_node(self):
+        combiner = SchemaCombinerFn()
+        node = SchemaNode.from_schema([{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}], count=2)
+
+        accumulator = combiner.add_input(combiner.create_accumulator(), [
+            {"name": "field1", "type": "FLOAT", "mode": "REQUIRED"}
+        ])
+        accumulator = combiner.add_input(accumulator, node)
+
+        self.assertEqual(3, accumulator.count)
+        self.assertEqual([{"name": "field1", "type": "FLOAT", "mode": "REQUIRED"}], combiner.extract_output(accumulator))
+
+
+class TestCombineSchemas(TestCase):
+
+    schemas = [
+        [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+        [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"}, {"name": "b", "type": "STRING", "mode": "REQUIRED"}],
+        [{"name": "a", "type": "INTEGER", "mode": "REQUIRED"}],
+    ]
+
+    def test_combine_schemas(self):
+        p = TestPipeline()
+        schema = p | beam.Create(self.schemas) | CombineSchemas(fanout=2)
+        assert_that(schema, equal_to([[
+            {"name": "a", "type": "FLOAT", "mode": "REQUIRED"},
+            {"name": "b", "type": "STRING", "mode": "NULLABLE"},
+        ]]))
+        result = p.run()
+        result.wait_until_finish()
+
+        # Every input reaches a pre-aggregated accumulator
+        sizes = result.metrics().query(MetricsFilter().with_name('inputs_per_accumulator'))['distributions']
+        self.assertEqual(3, sum(size.committed.sum for size in sizes))
+
+    def test_combine_keyed_schemas_and_stats(self):
+        stats = FieldStats()
+        stats.add_document({"a": 1})
+
+        with TestPipeline() as p:
+            output = (p
+                      | beam.Create([("t1", self.schemas[0]), ("t1", self.schemas[1]), ("t2", self.schemas[2]),
+                                     ("t2", stats)])
+                      | CombineSchemas(collect_stats=True, keyed=True, fanout=2)
+                      | beam.Map(lambda element: (element[0], element[1][0], element[1][1]['count']))
+                      )
+
+            assert_that(output, equal_to([
+                ("t1", [{"name": "a", "type": "FLOAT", "mode": "REQUIRED"},
+                        {"name": "b", "type": "STRING", "mode": "NULLABLE"}], 0),
+                ("t2", self.schemas[2], 1),
+            ]))
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+import pyarrow as pa
+
+from schematools.schema_arrow import to_arrow_schema
+
+
+class TestSchemaArrow(TestCase):
+
+    def test_to_arrow_schema(self):
+        schema = [
+            {"name": "id", "type": "STRING", "mode": "REQUIRED"},
+            {"name": "n", "type": "INT64", "mode": "NULLABLE"},
+            {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"},
+            {"name": "num", "type": "NUMERIC", "mode": "REPEATED"},
+            {"name": "r", "type": "RECORD", "mode": "REPEATED", "fields": [
+                {"name": "x", "type": "JSON", "mode": "NULLABLE"},
+                {"name": "d", "type": "DATE", "mode": "REQUIRED"},
+            ]},
+        ]
+
+        expected_result = pa.schema([
+            pa.field("id", pa.string(), nullable=False),
+            pa.field("n", pa.int64()),
+            pa.field("ts", pa.timestamp('us', tz='UTC')),
+            pa.field("num", pa.list_(pa.decimal128(38, 9))),
+            pa.field("r", pa.list_(pa.struct([
+                pa.field("x", pa.string()),
+                pa.field("d", pa.date32(), nullable=False),
+            ]))),
+        ])
+        self.assertEqual(expected_result, to_arrow_schema(schema))
+
+    def test_to_arrow_schema_not_required(self):
+        schema = [
+            {"name": "id", "type": "STRING", "mode": "REQUIRED"},
+            {"name": "r", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "d", "type": "DATE", "mode": "REQUIRED"},
+            ]},
+        ]
+
+        expected_result = pa.schema([
+            pa.field("id", pa.string()),
+            pa.field("r", pa.struct([pa.field("d", pa.date32())])),
+        ])
+        self.assertEqual(expected_result, to_arrow_schema(schema, required=False))
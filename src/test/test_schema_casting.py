@@ -0,0 +1,129 @@
+import datetime
+import decimal
+from unittest import TestCase
+
+from schematools.exceptions import BQSchemaCastException
+from schematools.schema_casting import LOAD_FORMAT_AVRO, check_load_format, compile_converter, convert_timestamp
+
+
+class TestSchemaCasting(TestCase):
+
+    schema = [
+        {"name": "id", "type": "STRING", "mode": "REQUIRED"},
+        {"name": "n", "type": "INTEGER", "mode": "NULLABLE"},
+        {"name": "f", "type": "FLOAT", "mode": "NULLABLE"},
+        {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"},
+        {"name": "payload", "type": "JSON", "mode": "NULLABLE"},
+        {"name": "tags", "type": "STRING", "mode": "REPEATED"},
+        {"name": "r", "type": "RECORD", "mode": "REPEATED", "fields": [
+            {"name": "x", "type": "STRING", "mode": "NULLABLE"},
+            {"name": "y", "type": "FLOAT", "mode": "NULLABLE"},
+        ]},
+        {"name": "s", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "z", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "l", "type": "BOOLEAN", "mode": "REPEATED"},
+        ]},
+    ]
+
+    def test_convert_document(self):
+        convert = compile_converter(self.schema)
+        document = {
+            "id": 123,
+            "n": 1,
+            "f": 2,
+            "ts": "2020-6-18 10:44:12Z",
+            "payload": "abc",
+            "tags": ["a", 1, True, None],
+            "r": [{"x": {"a": 1}, "y": 1, "unknown": None}, None],
+            "s": {"z": 1, "l": [True, None]},
+            "only_null": None,
+            "only_empty": [],
+        }
+
+        expected_result = {
+            "id": "123",
+            "n": 1,
+            "f": 2.0,
+            "ts": "2020-06-18T10:44:12",
+            "payload": '"abc"',
+            "tags": ["a", "1", "true"],
+            "r": [{"x": '{"a": 1}', "y": 1.0}],
+            "s": {"z": 1, "l": [True]},
+        }
+        result = convert(document)
+        self.assertEqual(expected_result, result)
+        self.assertIsInstance(result["f"], float)
+        # The original document is not modified
+        self.assertEqual(123, document["id"])
+        self.assertEqual([True, None], document["s"]["l"])
+
+    def test_convert_document_unchanged(self):
+        convert = compile_converter(self.schema)
+        record = {"z": 1}
+
+        self.assertIs(record, convert({"s": record})["s"])
+        self.assertEqual({"payload": '{"a": [1]}', "r": []}, convert({"payload": '{"a": [1]}', "r": []}))
+        self.assertEqual({"s": "x"}, convert({"s": "x"}))
+
+    def test_convert_timestamp(self):
+        for value, expected_result in [
+            ("2020-06-18T10:44:12", "2020-06-18T10:44:12"),
+            ("2020-06-18 10:44:12.123+00:00", "2020-06-18 10:44:12.123+00:00"),
+            ("2020-6-8t1:44:12", "2020-06-08T01:44:12"),
+            ("2020-06-18T10:44:12.5Z", "2020-06-18T10:44:12.5Z"),
+            ("2020-06-8T10:44:12.5Z", "2020-06-08T10:44:12.500000"),
+            ("not a timestamp", "not a timestamp"),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(expected_result, convert_timestamp(value))
+
+    def test_convert_document_avro(self):
+        schema = self.schema + [
+            {"name": "d", "type": "DATE", "mode": "NULLABLE"},
+            {"name": "t", "type": "TIME", "mode": "NULLABLE"},
+            {"name": "num", "type": "NUMERIC", "mode": "REPEATED"},
+        ]
+        convert = compile_converter(schema, LOAD_FORMAT_AVRO)
+        document = {
+            "ts": "2020-6-18 10:44:12.5Z",
+            "d": "2020-6-8",
+            "t": "1:02:03.25",
+            "num": ["1.5", 2, 0.1],
+            "r": [{"y": 1}],
+            "s": {"z": 1},
+        }
+
+        expected_result = {
+            "ts": datetime.datetime(2020, 6, 18, 10, 44, 12, 500000, tzinfo=datetime.timezone.utc),
+            "d": datetime.date(2020, 6, 8),
+            "t": datetime.time(1, 2, 3, 250000),
+            "num": [decimal.Decimal("1.5"), decimal.Decimal(2), decimal.Decimal("0.1")],
+            "r": [{"y": 1.0}],
+            "s": {"z": 1, "l": []},
+            "tags": [],
+        }
+        # Arrays that are missing are added, Avro has no null arrays
+        self.assertEqual(expected_result, convert(document))
+        self.assertEqual({"tags": [], "r": [], "num": []}, convert({}))
+
+    def test_convert_document_check_records(self):
+        convert = compile_converter(self.schema, check_records=True)
+
+        self.assertEqual({"id": "1", "r": [{"x": "a"}], "s": {"z": 1}}, convert({"id": 1, "r": [{"x": "a"}], "s": {"z": 1}}))
+        for document in [{"id": "1", "s": 1}, {"id": "1", "r": {"x": "a"}}, {"id": "1", "r": [{"x": "a"}, "b"]}]:
+            with self.subTest(document=document):
+                with self.assertRaises(BQSchemaCastException):
+                    convert(document)
+        # Without the check, the values are left to BigQuery
+        self.assertEqual({"id": "1", "s": 1}, compile_converter(self.schema)({"id": "1", "s": 1}))
+
+    def test_check_load_format(self):
+        schema = [{"name": "s", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "payload", "type": "JSON", "mode": "NULLABLE"},
+        ]}]
+
+        check_load_format(schema, "json")
+        with self.assertRaises(ValueError):
+            check_load_format(schema, LOAD_FORMAT_AVRO)
+        with self.assertRaises(ValueError):
+            compile_converter(schema, "parquet")
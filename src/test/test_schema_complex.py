@@ -1,7 +1,8 @@
+import json
 from unittest import TestCase
 
 from schematools.exceptions import BQSchemaMergeException
-from schematools.schema_extraction import extract_schema
+from schematools.schema_extraction import extract_schema, extract_schema_from_dict, validate_document
 
 
 class TestSchemaExtractionComplex(TestCase):
@@ -119,3 +120,33 @@ class TestSchemaExtractionComplex(TestCase):
             }
         ]
         self.assertEqual(expected_result, schema)
+
+    def test_extract_schema_from_dict(self):
+        input_json = '{"ts":"2020-06-18T10:44:12","started":{"pid":45678}}'
+
+        schema = extract_schema_from_dict(json.loads(input_json))
+
+        self.assertEqual(extract_schema(input_json), schema)
+
+    def test_validate_document(self):
+        valid_documents = [
+            {"a": 1, "b": [1, 2, 3], "c": {"d": [1, 2.5]}},
+            {"a": ["x", "2020-06-18T10:44:12", None], "b": [{"c": 1}, {"c": 2.5, "d": "x"}], "e": []},
+        ]
+        invalid_documents = [
+            {"a": [[1, 2], [3]]},
+            {"a": {"b": [{"c": 1}, 2]}},
+            {"a": [1, "x"]},
+            {"a": [True, 1]},
+            {"a": [{"b": 1}, {"b": "x"}]},
+        ]
+
+        for document in valid_documents:
+            with self.subTest(document=document):
+                validate_document(document)
+                extract_schema_from_dict(document)
+        for document in invalid_documents:
+            with self.subTest(document=document):
+                self.assertRaises(BQSchemaMergeException, validate_document, document)
+                self.assertRaises(BQSchemaMergeException, extract_schema_from_dict, document)
+        self.assertRaises(ValueError, validate_document, [1, 2])
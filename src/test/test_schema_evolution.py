@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from apache_beam.options.pipeline_options import PipelineOptions, StandardOptions
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.testing.test_stream import TestStream
+from apache_beam.testing.util import assert_that, equal_to
+
+from json2bq.schema_evolution import EvolveSchema
+
+FIELD_A = {"name": "a", "type": "INTEGER", "mode": "REQUIRED"}
+FIELD_B = {"name": "b", "type": "STRING", "mode": "REQUIRED"}
+FIELD_C = {"name": "c", "type": "BOOLEAN", "mode": "REQUIRED"}
+
+
+def nullable(field):
+    return dict(field, mode="NULLABLE")
+
+
+class TestSchemaEvolution(TestCase):
+
+    def test_evolve_schema_per_window(self):
+        stream = (TestStream()
+                  .advance_watermark_to(0)
+                  # Burst of new fields within one window
+                  .add_elements([[FIELD_A], [FIELD_A, FIELD_B], [FIELD_A]], event_timestamp=1)
+                  .advance_watermark_to(10)
+                  # Nothing new
+                  .add_elements([[FIELD_A, FIELD_B]], event_timestamp=11)
+                  .advance_watermark_to(20)
+                  # Another new field
+                  .add_elements([[FIELD_A, FIELD_C]], event_timestamp=21)
+                  .advance_watermark_to_infinity())
+
+        options = PipelineOptions()
+        options.view_as(StandardOptions).streaming = True
+        with TestPipeline(options=options) as p:
+            updates = (p
+                       | stream
+                       | EvolveSchema(lambda schema: schema, window_size=10)
+                       )
+
+            assert_that(updates, equal_to([
+                [FIELD_A, nullable(FIELD_B)],
+                [FIELD_A, nullable(FIELD_B), nullable(FIELD_C)],
+            ]))
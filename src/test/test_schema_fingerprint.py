@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from schematools.schema_fingerprint import ShapeCache, schema_fingerprint
+
+
+class TestSchemaFingerprint(TestCase):
+
+    def test_fingerprint_ignores_values(self):
+        data1 = {"a": 1, "b": "x", "c": {"d": [1, 2]}}
+        data2 = {"a": 5, "b": "y", "c": {"d": [3]}}
+
+        self.assertEqual(schema_fingerprint(data1), schema_fingerprint(data2))
+
+    def test_fingerprint_detects_types(self):
+        data1 = {"a": 1}
+        data2 = {"a": 1.5}
+        data3 = {"a": "2020-06-18T10:44:12"}
+        data4 = {"a": "hello"}
+
+        fingerprints = {schema_fingerprint(data) for data in [data1, data2, data3, data4]}
+
+        self.assertEqual(4, len(fingerprints))
+
+    def test_fingerprint_key_order(self):
+        data1 = {"a": 1, "b": 2}
+        data2 = {"b": 2, "a": 1}
+
+        self.assertNotEqual(schema_fingerprint(data1), schema_fingerprint(data2))
+
+    def test_fingerprint_list_and_record(self):
+        data1 = {"a": [{"b": 1}]}
+        data2 = {"a": {"b": 1}}
+
+        self.assertNotEqual(schema_fingerprint(data1), schema_fingerprint(data2))
+
+    def test_shape_cache_hits(self):
+        cache = ShapeCache(max_size=2)
+
+        self.assertFalse(cache.lookup('a'))
+        cache.add('a')
+        self.assertTrue(cache.lookup('a'))
+
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_shape_cache_evicts_least_recently_used(self):
+        cache = ShapeCache(max_size=2)
+        cache.add('a')
+        cache.add('b')
+        cache.lookup('a')
+        cache.add('c')
+
+        self.assertEqual(2, len(cache))
+        self.assertTrue(cache.lookup('a'))
+        self.assertFalse(cache.lookup('b'))
@@ -2,7 +2,8 @@ from unittest import TestCase
 
 from schematools.exceptions import BQSchemaMergeException
 from schematools.schema_extraction import extract_schema
-from schematools.schema_merge import merge_schemas
+from schematools.schema_merge import WIDENING_JSON, WIDENING_RECORD, WIDENING_STRICT, WIDENING_STRING, \
+    dead_letter_widening, merge_schema_list, merge_schemas, relax_schema, schemas_equal
 
 
 class TestSchemaExtractionPrimitive(TestCase):
@@ -101,6 +102,18 @@ class TestSchemaExtractionPrimitive(TestCase):
         self.assertEqual(expected_result, final_schema)
 
 
+    def test_merge_colliding_primitive_detected_string(self):
+
+        schema1 = [{"name": "field1", "type": "TIMESTAMP", "mode": "REQUIRED"}]
+        schema2 = [{"name": "field1", "type": "STRING", "mode": "REQUIRED"}]
+
+        final_schema = merge_schemas(schema1, schema2)
+
+        expected_result = [
+            {"name": "field1", "type": "STRING", "mode": "REQUIRED"},
+        ]
+        self.assertEqual(expected_result, final_schema)
+
     def test_merge_noncolliding_primitive(self):
 
         schema1 = [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}]
@@ -204,4 +217,174 @@ class TestSchemaExtractionPrimitive(TestCase):
         expected_result = [
             {"name": "field1", "type": "INTEGER", "mode": "REQUIRED"},
         ]
-        self.assertEqual(expected_result, final_schema)
\ No newline at end of file
+        self.assertEqual(expected_result, final_schema)
+
+    def test_merge_schema_list(self):
+
+        schema1 = [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}]
+        schema2 = [{"name": "field1", "type": "FLOAT", "mode": "REQUIRED"},
+                   {"name": "field2", "type": "STRING", "mode": "REQUIRED"}]
+        schema3 = [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"},
+                   {"name": "field3", "type": "RECORD", "mode": "REQUIRED", "fields": [
+                       {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"}
+                   ]}]
+
+        final_schema = merge_schema_list([schema1, schema2, None, schema3])
+
+        expected_result = [
+            {"name": "field1", "type": "FLOAT", "mode": "REQUIRED"},
+            {"name": "field2", "type": "STRING", "mode": "NULLABLE"},
+            {"name": "field3", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"}
+            ]},
+        ]
+        self.assertEqual(expected_result, final_schema)
+
+    def test_merge_schema_list_nested(self):
+
+        schema1 = [{"name": "field1", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "nested_field2", "type": "INTEGER", "mode": "REQUIRED"}
+        ]}]
+        schema2 = [{"name": "field1", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"}
+        ]}]
+
+        final_schema = merge_schema_list([schema1, schema2, schema1])
+
+        self.assertEqual(merge_schemas(schema1, schema2), final_schema)
+
+    def test_merge_schema_list_primitive_and_complex(self):
+
+        schema1 = [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}]
+        schema2 = [{"name": "field1", "type": "RECORD", "mode": "REQUIRED", "fields": []}]
+
+        with self.assertRaises(BQSchemaMergeException):
+            merge_schema_list([schema1, schema1, schema2])
+
+    def test_merge_schema_list_empty(self):
+
+        self.assertIsNone(merge_schema_list([]))
+
+    def test_schemas_equal(self):
+
+        schema1 = [{"name": "field1", "type": "INTEGER", "mode": "REQUIRED"},
+                   {"name": "field2", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                       {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED", "description": None}
+                   ]}]
+        schema2 = [{"name": "field2", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                       {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"}
+                   ]},
+                   {"name": "field1", "type": "INTEGER", "mode": "REQUIRED"}]
+        schema3 = [{"name": "field1", "type": "INTEGER", "mode": "NULLABLE"},
+                   {"name": "field2", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                       {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"}
+                   ]}]
+
+        self.assertTrue(schemas_equal(schema1, schema2))
+        self.assertFalse(schemas_equal(schema1, schema3))
+        self.assertFalse(schemas_equal(schema1, None))
+
+    def test_merge_widening_string(self):
+
+        schema1 = [{"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+                   {"name": "p", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                       {"name": "a", "type": "INTEGER", "mode": "REQUIRED"}
+                   ]}]
+        schema2 = [{"name": "id", "type": "STRING", "mode": "REQUIRED"},
+                   {"name": "p", "type": "BOOLEAN", "mode": "REQUIRED"}]
+
+        with self.assertRaises(BQSchemaMergeException):
+            merge_schemas(schema1, schema2)
+
+        expected_result = [
+            {"name": "id", "type": "STRING", "mode": "REQUIRED"},
+            {"name": "p", "type": "STRING", "mode": "NULLABLE"},
+        ]
+        self.assertEqual(expected_result, merge_schemas(schema1, schema2, WIDENING_STRING))
+        self.assertEqual(expected_result, merge_schema_list([schema1, schema2], WIDENING_STRING))
+
+    def test_merge_widening_json(self):
+
+        schema1 = [{"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+                   {"name": "p", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                       {"name": "a", "type": "INTEGER", "mode": "REQUIRED"}
+                   ]}]
+        schema2 = [{"name": "id", "type": "TIMESTAMP", "mode": "REQUIRED"},
+                   {"name": "p", "type": "STRING", "mode": "REQUIRED"}]
+
+        expected_result = [
+            {"name": "id", "type": "STRING", "mode": "REQUIRED"},
+            {"name": "p", "type": "JSON", "mode": "NULLABLE"},
+        ]
+        self.assertEqual(expected_result, merge_schemas(schema1, schema2, WIDENING_JSON))
+
+        # Integers and floats are still merged into floats
+        schema3 = [{"name": "id", "type": "FLOAT", "mode": "REQUIRED"}]
+        self.assertEqual([{"name": "id", "type": "FLOAT", "mode": "REQUIRED"}],
+                         merge_schemas(schema1[:1], schema3, WIDENING_JSON))
+
+    def test_merge_widening_record(self):
+
+        schema1 = [{"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+                   {"name": "p", "type": "RECORD", "mode": "REPEATED", "fields": [
+                       {"name": "a", "type": "INTEGER", "mode": "REQUIRED"}
+                   ]}]
+        schema2 = [{"name": "id", "type": "FLOAT", "mode": "REQUIRED"},
+                   {"name": "p", "type": "BOOLEAN", "mode": "NULLABLE"}]
+
+        # The record is kept, with its own mode
+        expected_result = [
+            {"name": "id", "type": "FLOAT", "mode": "REQUIRED"},
+            {"name": "p", "type": "RECORD", "mode": "REPEATED", "fields": [
+                {"name": "a", "type": "INTEGER", "mode": "REQUIRED"}
+            ]},
+        ]
+        self.assertEqual(expected_result, merge_schemas(schema1, schema2, WIDENING_RECORD))
+        self.assertEqual(expected_result, merge_schemas(schema2, schema1, WIDENING_RECORD))
+        self.assertEqual(expected_result, merge_schema_list([schema2, schema1, schema2], WIDENING_RECORD))
+
+        # Conflicts between primitive types are not resolved
+        with self.assertRaises(BQSchemaMergeException):
+            merge_schemas(schema1, [{"name": "id", "type": "BOOLEAN", "mode": "REQUIRED"}], WIDENING_RECORD)
+
+        self.assertEqual(WIDENING_RECORD, dead_letter_widening(WIDENING_STRICT))
+        self.assertEqual(WIDENING_JSON, dead_letter_widening(WIDENING_JSON))
+
+    def test_merge_widening_order_independent(self):
+
+        types = ["INTEGER", "FLOAT", "BOOLEAN", "STRING", "TIMESTAMP", "JSON", "RECORD"]
+        schemas = [
+            [{"name": "field1", "type": field_type, "mode": "REQUIRED", **({"fields": []} if field_type == "RECORD" else {})}]
+            for field_type in types
+        ]
+
+        for widening in [WIDENING_STRING, WIDENING_JSON]:
+            for schema1 in schemas:
+                for schema2 in schemas:
+                    for schema3 in schemas:
+                        types = (schema1[0]["type"], schema2[0]["type"], schema3[0]["type"])
+                        with self.subTest(widening=widening, types=types):
+                            self.assertEqual(
+                                merge_schemas(merge_schemas(schema1, schema2, widening), schema3, widening),
+                                merge_schemas(schema1, merge_schemas(schema2, schema3, widening), widening),
+                            )
+
+    def test_relax_schema(self):
+        schema = [
+            {"name": "a", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "b", "type": "STRING", "mode": "REPEATED"},
+            {"name": "r", "type": "RECORD", "mode": "REQUIRED", "fields": [
+                {"name": "c", "type": "FLOAT", "mode": "REQUIRED"},
+            ]},
+        ]
+
+        self.assertEqual([
+            {"name": "a", "type": "INTEGER", "mode": "NULLABLE"},
+            {"name": "b", "type": "STRING", "mode": "REPEATED"},
+            {"name": "r", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "c", "type": "FLOAT", "mode": "NULLABLE"},
+            ]},
+        ], relax_schema(schema))
+        # The schema itself is kept intact
+        self.assertEqual("REQUIRED", schema[2]["fields"][0]["mode"])
@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+from schematools.schema_merge import merge_schemas
+
+
+def gen_wide_schema(width: int, depth: int, reverse: bool = False):
+    """
+    Generates a schema with `width` primitive fields,
+    nested in `depth - 1` levels of records.
+    """
+    fields = [{"name": f"field_{i}", "type": "INTEGER", "mode": "REQUIRED"} for i in range(width)]
+    if reverse:
+        fields.reverse()
+    for level in range(depth - 1):
+        fields = [{"name": f"record_{level}", "type": "RECORD", "mode": "REQUIRED", "fields": fields}]
+    return fields
+
+
+class TestSchemaMergeScaling(TestCase):
+
+    def test_merge_wide_schema_result(self):
+        schema1 = gen_wide_schema(1000, 3)
+        schema2 = gen_wide_schema(1000, 3, reverse=True)
+
+        final_schema = merge_schemas(schema1, schema2)
+
+        self.assertEqual(gen_wide_schema(1000, 3), final_schema)
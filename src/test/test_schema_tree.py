@@ -0,0 +1,122 @@
+import pickle
+from unittest import TestCase
+
+from schematools.exceptions import BQSchemaMergeException
+from schematools.schema_extraction import extract_schema
+from schematools.schema_merge import WIDENING_JSON, WIDENING_RECORD, merge_schemas
+from schematools.schema_tree import SchemaNode
+
+
+def sort_schema(schema):
+    """
+    Sorts fields by name, as field order is not relevant when comparing merge results.
+    """
+    return sorted(
+        (dict(field, fields=sort_schema(field['fields'])) if 'fields' in field else field for field in schema),
+        key=lambda field: field['name']
+    )
+
+
+class TestSchemaTree(TestCase):
+
+    inputs = [
+        '{"ts":"2020-06-18T10:44:12","started":{"pid":45678}}',
+        '{"ts":"2020-06-18T10:44:13","logged_in":{"username":"foo"}}',
+        '{"ts":"2020-06-18T10:44:14","started":{"pid":1.5, "host":"a"}, "tags":["x"]}',
+        '{"ts":"2020-06-18T10:44:15","items":[{"a":1}, {"b":2}]}',
+    ]
+
+    def test_merge_equivalent_to_merge_schemas(self):
+        expected_result = None
+        root = SchemaNode()
+        for input_json in self.inputs:
+            expected_result = merge_schemas(expected_result, extract_schema(input_json))
+            root.merge_schema(extract_schema(input_json))
+
+        self.assertEqual(sort_schema(expected_result), sort_schema(root.to_schema()))
+
+    def test_merge_nodes(self):
+        root1 = SchemaNode.from_schema(extract_schema(self.inputs[0]))
+        root2 = SchemaNode()
+        for input_json in self.inputs[1:]:
+            root2.merge_schema(extract_schema(input_json))
+
+        root1.merge_node(root2)
+
+        expected_result = None
+        for input_json in self.inputs:
+            expected_result = merge_schemas(expected_result, extract_schema(input_json))
+        self.assertEqual(sort_schema(expected_result), sort_schema(root1.to_schema()))
+
+    def test_nested_field_relaxed(self):
+        root = SchemaNode.from_schema([{"name": "field1", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"},
+            {"name": "nested_field2", "type": "INTEGER", "mode": "REQUIRED"}
+        ]}])
+        root.merge_schema([{"name": "field1", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"}
+        ]}])
+
+        expected_result = [
+            {"name": "field1", "type": "RECORD", "mode": "NULLABLE", "fields": [
+                {"name": "nested_field", "type": "INTEGER", "mode": "REQUIRED"},
+                {"name": "nested_field2", "type": "INTEGER", "mode": "NULLABLE"},
+            ]},
+        ]
+        self.assertEqual(expected_result, root.to_schema())
+
+    def test_merge_primitive_and_complex(self):
+        root = SchemaNode.from_schema(extract_schema('{"started":{"pid":45678}}'))
+
+        with self.assertRaises(BQSchemaMergeException):
+            root.merge_schema(extract_schema('{"started":true}'))
+
+    def test_merge_widened_primitive_and_complex(self):
+        root = SchemaNode.from_schema(extract_schema('{"started":{"pid":45678},"id":1}'))
+        root.merge_schema(extract_schema('{"started":true,"id":"x"}'), widening=WIDENING_JSON)
+        root.merge_schema(extract_schema('{"started":{"host":"a"}}'), widening=WIDENING_JSON)
+
+        other = SchemaNode.from_schema(extract_schema('{"id":{"a":1}}'))
+        root.merge_node(other, WIDENING_JSON)
+
+        expected_result = [
+            {"name": "started", "type": "JSON", "mode": "NULLABLE"},
+            {"name": "id", "type": "JSON", "mode": "NULLABLE"},
+        ]
+        self.assertEqual(expected_result, root.to_schema())
+        self.assertEqual(root.to_schema(), pickle.loads(pickle.dumps(root)).to_schema())
+
+    def test_merge_record_kept_with_primitive(self):
+        root = SchemaNode.from_schema(extract_schema('{"started":true}'))
+        root.merge_schema(extract_schema('{"started":[{"pid":45678}]}'), widening=WIDENING_RECORD)
+        root.merge_schema(extract_schema('{"started":1}'), widening=WIDENING_RECORD)
+
+        other = SchemaNode.from_schema(extract_schema('{"started":"x"}'))
+        other.merge_node(SchemaNode.from_schema(extract_schema('{"started":[{"host":"a"}]}')), WIDENING_RECORD)
+        root.merge_node(other, WIDENING_RECORD)
+
+        # The record takes its own mode, the primitive values are ignored
+        expected_result = [
+            {"name": "started", "type": "RECORD", "mode": "REPEATED", "fields": [
+                {"name": "pid", "type": "INTEGER", "mode": "NULLABLE"},
+                {"name": "host", "type": "STRING", "mode": "NULLABLE"},
+            ]},
+        ]
+        self.assertEqual(expected_result, root.to_schema())
+
+    def test_size(self):
+        root = SchemaNode.from_schema(extract_schema(self.inputs[0]))
+
+        # Root, ts, started and started.pid
+        self.assertEqual(4, root.size())
+
+    def test_pickle_roundtrip(self):
+        root = SchemaNode()
+        for input_json in self.inputs:
+            root.merge_schema(extract_schema(input_json))
+
+        restored = pickle.loads(pickle.dumps(root))
+
+        self.assertEqual(root.to_schema(), restored.to_schema())
+        self.assertEqual(root.count, restored.count)
+        self.assertLess(len(pickle.dumps(root)), len(pickle.dumps(root.to_schema())))
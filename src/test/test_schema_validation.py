@@ -0,0 +1,60 @@
+import copy
+from unittest import TestCase
+
+from schematools.exceptions import BQSchemaMergeException
+from schematools.schema_extraction import extract_schema_from_dict
+from schematools.schema_merge import merge_schemas
+from schematools.schema_validation import find_unknown_fields, fits_schema, index_schema
+
+
+class TestSchemaValidation(TestCase):
+
+    schema = [
+        {"name": "id", "type": "INTEGER", "mode": "REQUIRED"},
+        {"name": "score", "type": "FLOAT", "mode": "NULLABLE"},
+        {"name": "ts", "type": "TIMESTAMP", "mode": "NULLABLE"},
+        {"name": "name", "type": "STRING", "mode": "NULLABLE"},
+        {"name": "tags", "type": "STRING", "mode": "REPEATED"},
+        {"name": "user", "type": "RECORD", "mode": "NULLABLE", "fields": [
+            {"name": "active", "type": "BOOLEAN", "mode": "REQUIRED"},
+        ]},
+    ]
+
+    def assertFits(self, data, expected):
+        self.assertEqual(expected, fits_schema(data, index_schema(self.schema)), data)
+
+        # A document fits iff merging its schema does not change the schema
+        try:
+            merged = merge_schemas(copy.deepcopy(self.schema), extract_schema_from_dict(data))
+            unchanged = sorted(merged, key=lambda field: field['name']) == sorted(self.schema, key=lambda field: field['name'])
+        except BQSchemaMergeException:
+            unchanged = False
+        self.assertEqual(expected, unchanged, data)
+
+    def test_fits(self):
+        self.assertFits({"id": 1}, True)
+        self.assertFits({"id": 1, "score": 2, "ts": "2020-06-18T10:44:12", "name": "2020-06-18T10:44:12"}, True)
+        self.assertFits({"id": 1, "tags": ["a", None], "user": {"active": True}}, True)
+        self.assertFits({"id": 1, "score": None, "tags": [], "unknown": None}, True)
+
+    def test_does_not_fit(self):
+        self.assertFits({"score": 1.5}, False)
+        self.assertFits({"id": 1.5}, False)
+        self.assertFits({"id": 1, "unknown": 1}, False)
+        self.assertFits({"id": 1, "ts": "hello"}, False)
+        self.assertFits({"id": 1, "tags": "a"}, False)
+        self.assertFits({"id": 1, "name": ["a"]}, False)
+        self.assertFits({"id": 1, "user": {}}, False)
+        self.assertFits({"id": 1, "user": {"active": True, "admin": True}}, False)
+
+    def test_empty_schema(self):
+        self.assertTrue(fits_schema({"a": None}, index_schema([])))
+        self.assertFalse(fits_schema({"a": 1}, index_schema([])))
+
+    def test_find_unknown_fields(self):
+        schema_index = index_schema(self.schema)
+
+        self.assertEqual([], find_unknown_fields({"id": 1, "unknown": None, "other": []}, schema_index))
+        self.assertEqual(["unknown", "user.admin"],
+                         find_unknown_fields({"id": 1, "unknown": 1, "user": {"active": True, "admin": True}},
+                                             schema_index))